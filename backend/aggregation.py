@@ -0,0 +1,54 @@
+import logging
+from typing import List, Any, Dict
+
+logger = logging.getLogger(__name__)
+
+EARLY_EXIT_OFF = "off"
+EARLY_EXIT_MAX_SEVERITY = "max_severity"
+EARLY_EXIT_FIRST_NSFW = "first_nsfw"
+EARLY_EXIT_QUORUM = "quorum"
+
+
+class EarlyExitPolicy:
+    """Decides when per-clip results already settle the verdict so outstanding clips can be cancelled
+
+    max_severity: stop once a clip reaches block_severity; the max can't go higher
+    in a way that changes the action taken.
+    first_nsfw: stop at the first clip flagged nsfw.
+    quorum: stop once quorum clips are flagged nsfw.
+    off: always wait for every clip.
+    """
+
+    def __init__(self, mode: str = EARLY_EXIT_OFF, block_severity: int = 5, quorum: int = 2):
+        self.mode = mode
+        self.block_severity = block_severity
+        self.quorum = max(1, quorum)
+        self.stats = {"aggregations": 0, "early_exits": 0, "clips_cancelled": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in (EARLY_EXIT_MAX_SEVERITY, EARLY_EXIT_FIRST_NSFW, EARLY_EXIT_QUORUM)
+
+    def decided(self, results: List[Any]) -> bool:
+        """Whether the clip results seen so far settle the verdict"""
+        if self.mode == EARLY_EXIT_MAX_SEVERITY:
+            return any(result.severity >= self.block_severity for result in results)
+        if self.mode == EARLY_EXIT_FIRST_NSFW:
+            return any(result.status == "nsfw" for result in results)
+        if self.mode == EARLY_EXIT_QUORUM:
+            return sum(result.status == "nsfw" for result in results) >= self.quorum
+        return False
+
+    def record(self, early: bool, cancelled: int):
+        self.stats["aggregations"] += 1
+        if early:
+            self.stats["early_exits"] += 1
+            self.stats["clips_cancelled"] += cancelled
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "block_severity": self.block_severity,
+            "quorum": self.quorum,
+            **self.stats,
+        }
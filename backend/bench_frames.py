@@ -0,0 +1,67 @@
+"""Benchmark per-index seeking against single-pass frame decoding
+
+Usage: python bench_frames.py [video] [--counts 1,3,5,10,25] [--repeats 5]
+"""
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import cv2
+import numpy as np
+
+from frames import read_video_frames, FrameEncoding, EncodedFrame
+
+
+def read_video_frames_seek(file_path: str, num_frames: int, encoding: FrameEncoding) -> List[EncodedFrame]:
+    """Previous implementation: seek to each index with CAP_PROP_POS_FRAMES, encoded the same way as the new one"""
+    frames = []
+    cap = cv2.VideoCapture(file_path)
+    try:
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        for idx in np.linspace(0, total_frames - 1, num_frames, dtype=int):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
+            ret, frame = cap.read()
+            if ret:
+                frames.append(encoding.encode(frame))
+    finally:
+        cap.release()
+    return frames
+
+
+def time_runs(fn, repeats: int) -> List[float]:
+    fn()  # Warm-up: file cache and codec initialisation
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("video", nargs="?", default="test_video.mp4")
+    parser.add_argument("--counts", default="1,3,5,10,25")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4, help="JPEG encode threads for the sequential reader")
+    args = parser.parse_args()
+
+    executor = ThreadPoolExecutor(max_workers=args.workers)
+    # Both readers produce the same EncodedFrames, so only decoding and seeking differ
+    encoding = FrameEncoding()
+    print(f"{'frames':>6}  {'seek ms':>9}  {'sequential ms':>13}  {'speedup':>7}")
+    for count in [int(c) for c in args.counts.split(",")]:
+        seek = time_runs(lambda: read_video_frames_seek(args.video, count, encoding), args.repeats)
+        sequential = time_runs(
+            lambda: read_video_frames(args.video, count, encode_executor=executor, encoding=encoding), args.repeats
+        )
+        seek_ms = statistics.median(seek) * 1000
+        sequential_ms = statistics.median(sequential) * 1000
+        print(f"{count:>6}  {seek_ms:>9.1f}  {sequential_ms:>13.1f}  {seek_ms / sequential_ms:>6.2f}x")
+    executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
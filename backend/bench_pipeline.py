@@ -0,0 +1,381 @@
+"""Benchmark the full /analyze pipeline against local fake model backends
+
+Usage: python bench_pipeline.py [--videos 640x360@10,1280x720@45] [--concurrency 1,4,16]
+                                [--requests 20] [--output bench_pipeline.json] [--baseline old.json]
+
+Synthetic videos are generated with ffmpeg (and reused from --video-dir). Replicate
+and Grok are served by a fake HTTP server in a child process, reached through the
+real HttpClient; Gemini is replaced in-process because the SDK talks gRPC, and Whisper
+by a fixed-latency stub. Latency, jitter and failure rates are configurable per backend
+and seeded, so runs on the same machine are comparable. Requests go through the
+ASGI app in-process, so CPU and RSS cover upload handling, ffmpeg/OpenCV work and
+orchestration but not a network hop.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import random
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+RESULT_VERSION = 1
+
+
+class BackendProfile:
+    """Latency and failure model for one fake backend"""
+
+    def __init__(self, latency: float, failure_rate: float, jitter: float, seed: int):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+
+    def delay(self) -> float:
+        if not self.jitter:
+            return self.latency
+        return self.latency * self.rng.lognormvariate(0, self.jitter)
+
+    def fails(self) -> bool:
+        return self.rng.random() < self.failure_rate
+
+
+def serve_fake_providers(port: int, replicate: Dict[str, float], grok: Dict[str, float], seed: int):
+    """Child process: fake Replicate predictions and Grok chat completions"""
+    from aiohttp import web
+
+    replicate_profile = BackendProfile(seed=seed, **replicate)
+    grok_profile = BackendProfile(seed=seed + 1, **grok)
+
+    async def create_prediction(request):
+        await request.read()
+        await asyncio.sleep(replicate_profile.delay())
+        if replicate_profile.fails():
+            return web.json_response({"detail": "fake outage"}, status=503)
+        return web.json_response({
+            "id": os.urandom(8).hex(),
+            "status": "succeeded",
+            "output": "A person stands in a brightly lit room next to a table with coloured shapes.",
+        }, status=201)
+
+    async def chat_completion(request):
+        await request.read()
+        await asyncio.sleep(grok_profile.delay())
+        if grok_profile.fails():
+            return web.json_response({"error": "fake outage"}, status=503)
+        verdict = {"status": "safe", "categories": [], "severity": 0, "description": "Fake Grok verdict."}
+        return web.json_response({"choices": [{"message": {"role": "assistant", "content": json.dumps(verdict)}}]})
+
+    app = web.Application(client_max_size=256 * 1024 * 1024)
+    app.router.add_post("/v1/predictions", create_prediction)
+    app.router.add_post("/v1/chat/completions", chat_completion)
+    web.run_app(app, host="127.0.0.1", port=port, print=None, handle_signals=True)
+
+
+class FakeGeminiResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeGeminiModel:
+    """Stand-in for genai.GenerativeModel with seeded latency, failures and verdicts"""
+
+    def __init__(self, profile: BackendProfile, nsfw_rate: float):
+        self.profile = profile
+        self.nsfw_rate = nsfw_rate
+
+    async def generate_content_async(self, content):
+        await asyncio.sleep(self.profile.delay())
+        if self.profile.fails():
+            raise RuntimeError("fake Gemini outage")
+        if self.profile.rng.random() < self.nsfw_rate:
+            verdict = {"status": "nsfw", "categories": ["violence"], "severity": 3, "description": "Fake nsfw clip."}
+        else:
+            verdict = {"status": "safe", "categories": [], "severity": 0, "description": "Fake safe clip."}
+        return FakeGeminiResponse(json.dumps(verdict))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Fake provider server did not start on port {port}")
+
+
+def parse_video_spec(spec: str) -> Dict[str, Any]:
+    """'1280x720@45' -> width 1280, height 720, 45 seconds"""
+    size, _, duration = spec.partition("@")
+    width, height = (int(part) for part in size.lower().split("x"))
+    return {"spec": spec, "width": width, "height": height, "duration": float(duration or 10)}
+
+
+def make_video(video: Dict[str, Any], video_dir: str, fps: int = 30) -> str:
+    """Generate (or reuse) a synthetic test pattern video with a tone on the audio track"""
+    path = os.path.join(video_dir, f"bench_{video['width']}x{video['height']}_{video['duration']:g}s.mp4")
+    if not os.path.exists(path):
+        subprocess.run([
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"testsrc2=size={video['width']}x{video['height']}:rate={fps}",
+            "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=44100",
+            "-t", str(video["duration"]),
+            "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p", "-g", str(fps * 2),
+            "-c:a", "aac", "-shortest", "-y", path
+        ], check=True)
+    return path
+
+
+def cpu_seconds() -> float:
+    """CPU time of this process plus its reaped children (ffmpeg)"""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def current_rss() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+async def sample_rss(peak: List[int], interval: float = 0.05):
+    while True:
+        rss = current_rss()
+        if rss is not None:
+            peak[0] = max(peak[0], rss)
+        await asyncio.sleep(interval)
+
+
+def percentiles(latencies: List[float]) -> Dict[str, float]:
+    values = np.array(latencies) * 1000
+    return {
+        "p50": round(float(np.percentile(values, 50)), 1),
+        "p95": round(float(np.percentile(values, 95)), 1),
+        "p99": round(float(np.percentile(values, 99)), 1),
+        "mean": round(float(values.mean()), 1),
+        "max": round(float(values.max()), 1),
+    }
+
+
+async def run_level(client, video_path: str, concurrency: int, requests: int) -> Dict[str, Any]:
+    """Send `requests` uploads with `concurrency` in flight and collect timings"""
+    with open(video_path, "rb") as f:
+        data = f.read()
+    name = os.path.basename(video_path)
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    methods: Dict[str, int] = {}
+    queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(None)
+
+    async def worker():
+        while not queue.empty():
+            queue.get_nowait()
+            start = time.perf_counter()
+            response = await client.post("/analyze", files={"file": (name, data, "video/mp4")})
+            latencies.append(time.perf_counter() - start)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+            if response.status_code == 200:
+                method = response.json()["method"]
+                methods[method] = methods.get(method, 0) + 1
+
+    rss_peak = [current_rss() or 0]
+    rss_start = rss_peak[0]
+    sampler = asyncio.create_task(sample_rss(rss_peak))
+    cpu_start = cpu_seconds()
+    wall_start = time.perf_counter()
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        sampler.cancel()
+    wall = time.perf_counter() - wall_start
+    cpu = cpu_seconds() - cpu_start
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(requests / wall, 3),
+        "latency_ms": percentiles(latencies),
+        "cpu_ms_per_request": round(cpu / requests * 1000, 1),
+        "peak_rss_mb": round(rss_peak[0] / 2**20, 1) if rss_peak[0] else None,
+        "rss_growth_mb": round((rss_peak[0] - rss_start) / 2**20, 1) if rss_peak[0] else None,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "status_counts": statuses,
+        "methods": methods,
+    }
+
+
+def install_fakes(main, args):
+    """Point the app at the fake backends and switch off result reuse"""
+    gemini = FakeGeminiModel(
+        BackendProfile(args.gemini_latency, args.gemini_failure_rate, args.jitter, args.seed + 2), args.nsfw_rate
+    )
+    main.genai.GenerativeModel = lambda name: gemini
+    whisper = BackendProfile(args.whisper_latency, 0.0, args.jitter, args.seed + 3)
+
+    async def transcribe(audio):
+        await asyncio.sleep(whisper.delay())
+        return "Fake transcript of a short tone."
+
+    main.whisper_pool.transcribe = transcribe
+    if not args.keep_cache:
+        # Identical synthetic uploads would otherwise be answered from the cache or fingerprint index
+        main.result_cache = None
+        main.fingerprint_index = None
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions beyond tolerance in p95 latency, throughput or CPU per request"""
+    previous = {(run["video"], run["concurrency"]): run for run in baseline.get("runs", [])}
+    regressions = []
+    for run in results["runs"]:
+        old = previous.get((run["video"], run["concurrency"]))
+        if not old:
+            continue
+        label = f"{run['video']} c={run['concurrency']}"
+        checks = [
+            ("p95 latency", old["latency_ms"]["p95"], run["latency_ms"]["p95"], True),
+            ("throughput", old["throughput_rps"], run["throughput_rps"], False),
+            ("cpu/request", old["cpu_ms_per_request"], run["cpu_ms_per_request"], True),
+        ]
+        for metric, before, after, higher_is_worse in checks:
+            if not before:
+                continue
+            change = (after - before) / before
+            print(f"{label:<28} {metric:<12} {before:>10.1f} -> {after:>10.1f}  {change:+.1%}")
+            if (change > tolerance) if higher_is_worse else (change < -tolerance):
+                regressions.append(f"{label} {metric} {change:+.1%}")
+    return regressions
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_benchmark(main, args, videos: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    import httpx
+
+    runs = []
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for video in videos:
+            for _ in range(args.warmup):
+                await run_level(client, video["path"], 1, 1)
+            for concurrency in args.concurrency:
+                result = await run_level(client, video["path"], concurrency, max(args.requests, concurrency))
+                result["video"] = video["spec"]
+                runs.append(result)
+                latency = result["latency_ms"]
+                print(f"{video['spec']:<18} {concurrency:>4} {result['throughput_rps']:>8.2f} "
+                      f"{latency['p50']:>9.0f} {latency['p95']:>9.0f} {latency['p99']:>9.0f} "
+                      f"{result['cpu_ms_per_request']:>9.0f} {result['peak_rss_mb'] or 0:>8.0f}")
+        await main.http_client.close()
+    return runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--videos", default="640x360@10,1280x720@30", help="Comma-separated WIDTHxHEIGHT@SECONDS")
+    parser.add_argument("--concurrency", default="1,4,16", type=lambda value: [int(c) for c in value.split(",")])
+    parser.add_argument("--requests", type=int, default=20, help="Requests per video and concurrency level")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed requests per video")
+    parser.add_argument("--video-dir", default=os.path.join(tempfile.gettempdir(), "nsfw-bench-videos"))
+    parser.add_argument("--gemini-latency", type=float, default=1.0)
+    parser.add_argument("--gemini-failure-rate", type=float, default=0.0)
+    parser.add_argument("--replicate-latency", type=float, default=1.5)
+    parser.add_argument("--replicate-failure-rate", type=float, default=0.0)
+    parser.add_argument("--grok-latency", type=float, default=1.0)
+    parser.add_argument("--grok-failure-rate", type=float, default=0.0)
+    parser.add_argument("--whisper-latency", type=float, default=0.5)
+    parser.add_argument("--nsfw-rate", type=float, default=0.1, help="Fraction of Gemini clips flagged nsfw")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Lognormal sigma applied to every latency, 0 for fixed")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep-cache", action="store_true", help="Leave the result cache and fingerprint index on")
+    parser.add_argument("--output", default="bench_pipeline.json")
+    parser.add_argument("--baseline", help="Earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative regression vs baseline")
+    args = parser.parse_args()
+
+    os.makedirs(args.video_dir, exist_ok=True)
+    videos = [parse_video_spec(spec) for spec in args.videos.split(",")]
+    for video in videos:
+        video["path"] = make_video(video, args.video_dir)
+
+    port = free_port()
+    server = multiprocessing.Process(target=serve_fake_providers, daemon=True, args=(
+        port,
+        {"latency": args.replicate_latency, "failure_rate": args.replicate_failure_rate, "jitter": args.jitter},
+        {"latency": args.grok_latency, "failure_rate": args.grok_failure_rate, "jitter": args.jitter},
+        args.seed,
+    ))
+    server.start()
+    wait_for_port(port)
+
+    # main reads its configuration at import time
+    os.environ.update({
+        "GEMINI_API_KEY": "bench", "REPLICATE_API_KEY": "bench", "GROK_API_KEY": "bench",
+        "REPLICATE_API_BASE": f"http://127.0.0.1:{port}/v1", "GROK_API_BASE": f"http://127.0.0.1:{port}/v1",
+        "REPLICATE_POLL_INTERVAL": "0.05", "WHISPER_PRELOAD": "false",
+    })
+    import logging
+    import main as app_main
+    logging.getLogger().setLevel(logging.WARNING)
+    install_fakes(app_main, args)
+
+    print(f"{'video':<18} {'conc':>4} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'cpu ms':>9} {'rss MB':>8}")
+    try:
+        runs = asyncio.run(run_benchmark(app_main, args, videos))
+    finally:
+        server.terminate()
+        server.join()
+
+    results = {
+        "version": RESULT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpu_count": os.cpu_count()},
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "video_dir")},
+        "videos": [{key: value for key, value in video.items() if key != "path"} for video in videos],
+        "runs": runs,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("Regressions beyond tolerance:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
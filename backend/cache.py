@@ -0,0 +1,159 @@
+import json
+import sqlite3
+import hashlib
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+from metrics import CACHE_LOOKUPS, CACHE_STORES
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(content_hash: str, config: Dict[str, Any]) -> str:
+    """Combine the content hash with the analysis config into one cache key"""
+    config_blob = json.dumps(config, sort_keys=True, separators=(",", ":"))
+    config_hash = hashlib.sha256(config_blob.encode("utf-8")).hexdigest()[:16]
+    return f"{content_hash}:{config_hash}"
+
+
+class ResultCache:
+    """Two-tier result cache: in-process LRU plus an optional shared SQLite store
+
+    Values are JSON-serialisable dicts. The SQLite tier is opened in WAL mode so
+    several uvicorn worker processes can share it and it survives restarts.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 86400,
+                 db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path or None
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_local = threading.local()
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+        }
+
+        if self.db_path:
+            conn = self._connect()
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.commit()
+            logger.info(f"Result cache disk tier enabled at {self.db_path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        """Get the SQLite connection for the calling thread"""
+        conn = getattr(self._db_local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._db_local.conn = conn
+        return conn
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - created_at > self.ttl_seconds
+
+    def _memory_get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            created_at, value = entry
+            if self._expired(created_at):
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return value
+
+    def _memory_put(self, key: str, value: Dict[str, Any], created_at: float):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._memory[key] = (created_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _disk_get(self, key: str) -> Optional[tuple]:
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT value, created_at FROM results WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, created_at = row
+        if self._expired(created_at):
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            conn.commit()
+            return None
+        return created_at, json.loads(value)
+
+    def _disk_put(self, key: str, value: Dict[str, Any], created_at: float):
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO results (key, value, created_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), created_at)
+        )
+        conn.commit()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up a cached result, promoting disk hits into the LRU tier"""
+        value = self._memory_get(key)
+        if value is not None:
+            self.stats["memory_hits"] += 1
+            CACHE_LOOKUPS.labels("memory_hit").inc()
+            return value
+
+        if self.db_path:
+            try:
+                loop = asyncio.get_event_loop()
+                entry = await loop.run_in_executor(None, self._disk_get, key)
+            except Exception as e:
+                logger.error(f"Result cache disk lookup failed: {e}")
+                entry = None
+            if entry is not None:
+                created_at, value = entry
+                self._memory_put(key, value, created_at)
+                self.stats["disk_hits"] += 1
+                CACHE_LOOKUPS.labels("disk_hit").inc()
+                return value
+
+        self.stats["misses"] += 1
+        CACHE_LOOKUPS.labels("miss").inc()
+        return None
+
+    async def set(self, key: str, value: Dict[str, Any]):
+        """Store a result in both tiers"""
+        created_at = time.time()
+        self._memory_put(key, value, created_at)
+        self.stats["stores"] += 1
+        CACHE_STORES.inc()
+
+        if self.db_path:
+            try:
+                loop = asyncio.get_event_loop()
+                await loop.run_in_executor(None, self._disk_put, key, value, created_at)
+            except Exception as e:
+                logger.error(f"Result cache disk store failed: {e}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters and sizes for health reporting"""
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        lookups = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_enabled": bool(self.db_path),
+        }
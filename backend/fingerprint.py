@@ -0,0 +1,308 @@
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from typing import Optional, Dict, Any, List, Tuple
+
+import cv2
+import numpy as np
+
+from media_tools import run_media_tool
+
+logger = logging.getLogger(__name__)
+
+# dHash compares horizontally adjacent pixels of a 9x8 greyscale thumbnail: 8x8 = 64 bits
+HASH_WIDTH, HASH_HEIGHT = 9, 8
+
+# Multi-index hashing: the 64-bit hash is split into 4 16-bit substrings. If two hashes
+# are within distance d, at least one substring is within d // 4 (pigeonhole), so only
+# the buckets near each query substring need to be checked.
+NUM_CHUNKS = 4
+CHUNK_BITS = 16
+NUM_BUCKETS = 1 << CHUNK_BITS
+
+# Recent inserts are scanned brute force until there are this many, then indexed
+TAIL_LIMIT = 32768
+
+
+def popcount64(values: np.ndarray) -> np.ndarray:
+    """Number of set bits in each element of a uint64 array"""
+    values = values.astype(np.uint64)
+    values -= (values >> np.uint64(1)) & np.uint64(0x5555555555555555)
+    values = (values & np.uint64(0x3333333333333333)) + ((values >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    values = (values + (values >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (values * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+async def decode_hash_frames(file_path: str, fps: float, max_seconds: Optional[float] = None) -> np.ndarray:
+    """Decode greyscale 9x8 thumbnails at a fixed frame rate, shape (N, 8, 9)"""
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error"]
+    if max_seconds:
+        cmd += ["-t", str(max_seconds)]
+    cmd += [
+        "-i", file_path, "-an",
+        "-vf", f"fps={fps},scale={HASH_WIDTH}:{HASH_HEIGHT}:flags=area",
+        "-f", "rawvideo", "-pix_fmt", "gray", "-"
+    ]
+    result = await run_media_tool(cmd)
+    frame_bytes = HASH_WIDTH * HASH_HEIGHT
+    count = len(result.stdout) // frame_bytes
+    return np.frombuffer(result.stdout[:count * frame_bytes], dtype=np.uint8).reshape(count, HASH_HEIGHT, HASH_WIDTH)
+
+
+def hash_thumbnails(thumbs: np.ndarray) -> np.ndarray:
+    """Greyscale 9x8 thumbnails from larger RGB ones (such as a request's shared thumbnails), shape (N, 8, 9)"""
+    return np.stack([
+        cv2.resize(cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY), (HASH_WIDTH, HASH_HEIGHT), interpolation=cv2.INTER_AREA)
+        for frame in thumbs
+    ]) if len(thumbs) else np.zeros((0, HASH_HEIGHT, HASH_WIDTH), np.uint8)
+
+
+def dhash(thumbs: np.ndarray, min_contrast: int = 8) -> np.ndarray:
+    """64-bit difference hashes of (N, 8, 9) thumbnails, skipping near-uniform frames
+
+    Blank and fade frames hash to noise and would match each other across
+    unrelated videos, so frames with less than min_contrast grey levels of
+    range are dropped.
+    """
+    pixels = thumbs.astype(np.int16)
+    contrast = pixels.max(axis=(1, 2)) - pixels.min(axis=(1, 2))
+    bits = (pixels[:, :, 1:] > pixels[:, :, :-1])[contrast >= min_contrast].reshape(-1, 64)
+    return np.packbits(bits, axis=1).view(">u8").ravel().astype(np.uint64)
+
+
+async def compute_fingerprint(file_path: str, fps: float = 1.0, max_seconds: Optional[float] = None,
+                              thumbs: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+    """Distinct per-frame dHashes of a video in playback order, or None if it could not be decoded
+
+    Hashes the given RGB thumbnails when there are some, else decodes its own.
+    """
+    try:
+        if thumbs is not None:
+            hashes = dhash(hash_thumbnails(thumbs))
+        else:
+            hashes = dhash(await decode_hash_frames(file_path, fps, max_seconds))
+    except Exception as e:
+        logger.error(f"Fingerprinting failed: {e}")
+        return None
+    if len(hashes) == 0:
+        return None
+    _, first = np.unique(hashes, return_index=True)
+    return hashes[np.sort(first)]
+
+
+class FingerprintIndex:
+    """Near-duplicate video index over per-frame perceptual hashes
+
+    Frame hashes of every known video live in flat NumPy arrays. Most of them
+    are indexed by multi-index hashing (one CSR bucket table per 16-bit
+    substring); the newest TAIL_LIMIT are scanned directly and folded into the
+    index in one O(n) rebuild when the tail fills up. A video matches when at
+    least match_threshold of the query's frames (and at least min_matches
+    frames) have a hash within max_distance bits in it. Trimmed copies still
+    match their source, but the reverse doesn't hold: splicing new footage
+    onto a known video dilutes the score, so it can't inherit the verdict.
+
+    With db_path set, fingerprints and verdicts are stored in SQLite and rows
+    written by other worker processes are picked up every refresh_seconds.
+    """
+
+    def __init__(self, max_distance: int = 8, match_threshold: float = 0.8, min_matches: int = 3,
+                 db_path: Optional[str] = None, namespace: str = "", refresh_seconds: float = 30):
+        self.max_distance = max_distance
+        self.match_threshold = match_threshold
+        self.min_matches = min_matches
+        self.db_path = db_path or None
+        self.namespace = namespace
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._db_local = threading.local()
+
+        radius = max_distance // NUM_CHUNKS
+        values = np.arange(NUM_BUCKETS, dtype=np.int64)
+        self._probes = values[popcount64(values) <= radius]
+
+        self._hashes = np.zeros(1024, dtype=np.uint64)
+        self._owners = np.zeros(1024, dtype=np.int32)
+        self._results: List[str] = []
+        self._size = 0
+        # (size, indexed, orders, starts) as seen by readers, swapped atomically
+        self._view: Tuple[int, int, List[np.ndarray], List[np.ndarray]] = (0, 0, [], [])
+
+        self._last_row = 0
+        self._own_rows = set()
+        self._last_refresh = 0.0
+        self.stats = {"lookups": 0, "hits": 0, "adds": 0, "rebuilds": 0}
+
+        if self.db_path:
+            conn = self._connect()
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS fingerprints ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, namespace TEXT NOT NULL, sha256 TEXT, "
+                "hashes BLOB NOT NULL, result TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS fingerprints_namespace ON fingerprints (namespace, id)")
+            conn.commit()
+            logger.info(f"Fingerprint index persisted at {self.db_path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        """Get the SQLite connection for the calling thread"""
+        conn = getattr(self._db_local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._db_local.conn = conn
+        return conn
+
+    def _append(self, hashes: np.ndarray, result: str):
+        """Add one video's hashes to the arrays (caller holds the lock)"""
+        needed = self._size + len(hashes)
+        if needed > len(self._hashes):
+            capacity = max(needed, 2 * len(self._hashes))
+            # Readers keep using the old arrays, which still hold everything up to their view
+            self._hashes = np.concatenate([self._hashes[:self._size], np.zeros(capacity - self._size, np.uint64)])
+            self._owners = np.concatenate([self._owners[:self._size], np.zeros(capacity - self._size, np.int32)])
+
+        video_id = len(self._results)
+        self._hashes[self._size:needed] = hashes
+        self._owners[self._size:needed] = video_id
+        self._results.append(result)
+        self._size = needed
+
+    def _publish(self):
+        """Make appended hashes visible to lookups, rebuilding the index if the tail is full"""
+        _, indexed, orders, starts = self._view
+        if self._size - indexed > TAIL_LIMIT:
+            orders, starts = [], []
+            hashes = self._hashes[:self._size]
+            for chunk in range(NUM_CHUNKS):
+                keys = ((hashes >> np.uint64(chunk * CHUNK_BITS)) & np.uint64(NUM_BUCKETS - 1)).astype(np.uint16)
+                orders.append(np.argsort(keys, kind="stable").astype(np.uint32))
+                starts.append(np.concatenate([[0], np.cumsum(np.bincount(keys, minlength=NUM_BUCKETS))]))
+            indexed = self._size
+            self.stats["rebuilds"] += 1
+        self._view = (self._size, indexed, orders, starts)
+
+    def _refresh(self):
+        """Load fingerprints written by this or other processes since the last refresh"""
+        if not self.db_path or time.time() - self._last_refresh < self.refresh_seconds:
+            return
+        # Held across the read so concurrent refreshes can't both append the same rows
+        with self._lock:
+            if time.time() - self._last_refresh < self.refresh_seconds:
+                return
+            rows = self._connect().execute(
+                "SELECT id, hashes, result FROM fingerprints WHERE namespace = ? AND id > ? ORDER BY id",
+                (self.namespace, self._last_row)
+            ).fetchall()
+            for row_id, blob, result in rows:
+                if row_id not in self._own_rows:
+                    self._append(np.frombuffer(blob, dtype=np.uint64), result)
+                self._own_rows.discard(row_id)
+                self._last_row = row_id
+            self._publish()
+            self._last_refresh = time.time()
+        if rows:
+            logger.info(f"Fingerprint index loaded {len(rows)} new video(s), {self._size} hashes total")
+
+    def _candidates(self, query: np.ndarray, size: int, indexed: int,
+                    orders: List[np.ndarray], starts: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """(query index, hash position) pairs that might be within max_distance, possibly repeated"""
+        query_parts, position_parts = [], []
+        num_queries = len(query)
+
+        if indexed:
+            for chunk in range(NUM_CHUNKS):
+                chunk_values = ((query >> np.uint64(chunk * CHUNK_BITS)) & np.uint64(NUM_BUCKETS - 1)).astype(np.int64)
+                keys = (chunk_values[:, None] ^ self._probes[None, :]).ravel()
+                lo = starts[chunk][keys]
+                lengths = starts[chunk][keys + 1] - lo
+                total = int(lengths.sum())
+                if total == 0:
+                    continue
+                # Expand each bucket's [lo, lo + length) range into flat offsets
+                offsets = np.repeat(lo - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+                position_parts.append(orders[chunk][offsets].astype(np.int64))
+                query_parts.append(np.repeat(np.arange(num_queries).repeat(len(self._probes)), lengths))
+
+        if size > indexed:
+            tail = np.arange(indexed, size, dtype=np.int64)
+            position_parts.append(np.tile(tail, num_queries))
+            query_parts.append(np.arange(num_queries).repeat(len(tail)))
+
+        if not position_parts:
+            return np.zeros(0, np.int64), np.zeros(0, np.int64)
+        # A hash can turn up via several substrings; duplicates are collapsed after filtering
+        return np.concatenate(query_parts), np.concatenate(position_parts)
+
+    def _lookup_sync(self, query: np.ndarray) -> Optional[Tuple[Dict[str, Any], float]]:
+        self._refresh()
+        size, indexed, orders, starts = self._view
+        hashes, owners = self._hashes, self._owners
+        if size == 0 or len(query) == 0:
+            return None
+
+        query_index, positions = self._candidates(query, size, indexed, orders, starts)
+        close = popcount64(hashes[positions] ^ query[query_index]) <= self.max_distance
+        if not close.any():
+            return None
+
+        # Count distinct query frames matched per video
+        num_queries = len(query)
+        matched = np.unique(owners[positions[close]].astype(np.int64) * num_queries + query_index[close])
+        videos, counts = np.unique(matched // num_queries, return_counts=True)
+        scores = counts / num_queries
+        eligible = (counts >= self.min_matches) & (scores >= self.match_threshold)
+        if not eligible.any():
+            return None
+
+        best = int(np.argmax(np.where(eligible, scores, -1)))
+        return json.loads(self._results[int(videos[best])]), float(scores[best])
+
+    def _add_sync(self, hashes: np.ndarray, result: Dict[str, Any], sha256: Optional[str]):
+        blob = json.dumps(result)
+        with self._lock:
+            if self.db_path:
+                cursor = self._connect().execute(
+                    "INSERT INTO fingerprints (namespace, sha256, hashes, result, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (self.namespace, sha256, hashes.astype(np.uint64).tobytes(), blob, time.time())
+                )
+                self._connect().commit()
+                self._own_rows.add(cursor.lastrowid)
+            self._append(hashes, blob)
+            self._publish()
+
+    async def lookup(self, fingerprint: np.ndarray) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Verdict and match score of the closest known near-duplicate, if any"""
+        self.stats["lookups"] += 1
+        try:
+            loop = asyncio.get_event_loop()
+            match = await loop.run_in_executor(None, self._lookup_sync, fingerprint)
+        except Exception as e:
+            logger.error(f"Fingerprint lookup failed: {e}")
+            return None
+        if match:
+            self.stats["hits"] += 1
+        return match
+
+    async def add(self, fingerprint: np.ndarray, result: Dict[str, Any], sha256: Optional[str] = None):
+        """Remember a video's fingerprint together with its verdict"""
+        try:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, self._add_sync, fingerprint, result, sha256)
+            self.stats["adds"] += 1
+        except Exception as e:
+            logger.error(f"Fingerprint store failed: {e}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        size, indexed, _, _ = self._view
+        return {
+            **self.stats,
+            "videos": len(self._results),
+            "hashes": size,
+            "indexed_hashes": indexed,
+            "disk_enabled": bool(self.db_path),
+        }
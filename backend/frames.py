@@ -0,0 +1,136 @@
+import base64
+import logging
+from concurrent.futures import Executor, Future
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+FRAME_FORMATS = {
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY, "image/jpeg"),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY, "image/webp"),
+}
+
+
+class EncodedFrame:
+    """One encoded frame, ready to send to a model"""
+
+    __slots__ = ("data", "mime_type", "source_bytes")
+
+    def __init__(self, data: bytes, mime_type: str, source_bytes: int):
+        self.data = data
+        self.mime_type = mime_type
+        self.source_bytes = source_bytes  # Estimated size at the source resolution
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{base64.b64encode(self.data).decode('utf-8')}"
+
+
+class FrameEncoding:
+    """Target height, image format and quality for the frames sent to one provider
+
+    Frames taller than height are downscaled with INTER_AREA, never upscaled
+    (0 keeps the source size). The source size is estimated by scaling the
+    encoded size by the pixel ratio rather than encoding the frame twice, so
+    the bytes saved metric counts downscaling only and understates the
+    savings from a lower quality or WebP.
+    """
+
+    def __init__(self, height: int = 0, image_format: str = "jpeg", quality: int = 95):
+        if image_format not in FRAME_FORMATS:
+            raise ValueError(f"Unsupported frame format {image_format!r}, expected one of {', '.join(FRAME_FORMATS)}")
+        self.height = height
+        self.image_format = image_format
+        self.quality = quality
+
+    def encode(self, frame: np.ndarray) -> EncodedFrame:
+        """Downscale and encode a BGR frame (blocking)"""
+        source_pixels = frame.shape[0] * frame.shape[1]
+        if self.height and frame.shape[0] > self.height:
+            width = max(1, round(frame.shape[1] * self.height / frame.shape[0]))
+            frame = cv2.resize(frame, (width, self.height), interpolation=cv2.INTER_AREA)
+
+        extension, quality_flag, mime_type = FRAME_FORMATS[self.image_format]
+        ok, buffer = cv2.imencode(extension, frame, [quality_flag, self.quality])
+        if not ok:
+            raise ValueError(f"{self.image_format} encoding failed")
+        data = buffer.tobytes()
+        source_bytes = round(len(data) * source_pixels / (frame.shape[0] * frame.shape[1]))
+        return EncodedFrame(data, mime_type, source_bytes)
+
+
+def frame_targets(cap: cv2.VideoCapture, num_frames: int, timestamps: Optional[List[float]] = None) -> List[float]:
+    """Sorted target times in seconds: the given timestamps, or num_frames spread evenly over the video"""
+    total_frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    last = (total_frames - 1) / fps if total_frames > 0 and fps > 0 else None
+
+    if timestamps:
+        # Only an estimate, but keeps targets past the end from being dropped outright
+        return sorted(min(max(0.0, float(t)), last if last is not None else float(t)) for t in timestamps)
+
+    if last is None:
+        raise ValueError("Invalid video frame count")
+    return list(np.linspace(0, last, num_frames))
+
+
+def read_video_frames(file_path: str, num_frames: int = 5, timestamps: Optional[List[float]] = None,
+                      encode_executor: Optional[Executor] = None,
+                      encoding: Optional[FrameEncoding] = None) -> List[EncodedFrame]:
+    """Decode frames at the given timestamps (or even intervals) in one forward pass (blocking)
+
+    Every frame is grab()bed, which demuxes and decodes without the colour
+    conversion and copy, and only frames at a target time are retrieve()d.
+    Targets are matched on each frame's presentation time rather than its
+    index, so variable frame rate files land on the right frames and the
+    container's (often wrong) frame count is never relied on for seeking.
+    Downscaling and encoding (see FrameEncoding, full-size JPEG by default)
+    run on encode_executor while decoding continues.
+    """
+    encoding = encoding or FrameEncoding()
+    cap = cv2.VideoCapture(file_path)
+    try:
+        if not cap.isOpened():
+            raise ValueError("Could not open video")
+
+        targets = frame_targets(cap, num_frames, timestamps)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        # A target belongs to the first frame whose time is within half a frame of it
+        tolerance = 0.5 / fps if fps > 0 else 0.0
+
+        encoded: List[Optional[Future]] = [None] * len(targets)
+        raw: List[Optional[EncodedFrame]] = [None] * len(targets)
+        next_target = 0
+        while next_target < len(targets) and cap.grab():
+            position = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+            if targets[next_target] > position + tolerance:
+                continue
+
+            ret, frame = cap.retrieve()
+            while next_target < len(targets) and targets[next_target] <= position + tolerance:
+                if ret:
+                    if encode_executor is not None:
+                        encoded[next_target] = encode_executor.submit(encoding.encode, frame)
+                    else:
+                        raw[next_target] = encoding.encode(frame)
+                else:
+                    logger.warning(f"Failed to extract frame at {targets[next_target]:.2f}s")
+                next_target += 1
+
+        if next_target < len(targets):
+            logger.warning(f"Video ended before {len(targets) - next_target} of {len(targets)} frame(s)")
+
+        frames = []
+        for future, frame in zip(encoded, raw):
+            if future is not None:
+                frames.append(future.result())
+            elif frame is not None:
+                frames.append(frame)
+        return frames
+
+    finally:
+        cap.release()
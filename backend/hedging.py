@@ -0,0 +1,153 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Optional, Callable, Awaitable, Any, Dict, Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+HEDGE_OFF = "off"
+HEDGE_STATIC = "static"
+HEDGE_ADAPTIVE = "adaptive"
+
+
+def censored_percentile(samples: Iterable[Tuple[float, bool]], percentile: float) -> float:
+    """Kaplan-Meier percentile of (seconds, censored) samples
+
+    A censored sample is a lower bound: the primary was still running when it
+    was cancelled. If the percentile falls beyond the last finished sample the
+    largest observed time is returned, since the true value is at least that.
+    """
+    ordered = sorted(samples, key=lambda sample: (sample[0], sample[1]))
+    at_risk = len(ordered)
+    survival = 1.0
+    for seconds, censored in ordered:
+        if not censored:
+            survival *= 1 - 1 / at_risk
+            if 1 - survival >= percentile / 100 - 1e-9:
+                return seconds
+        at_risk -= 1
+    return ordered[-1][0]
+
+
+class HedgePolicy:
+    """Decides when to start the fallback path speculatively and tracks who wins
+
+    static: hedge after a fixed budget. adaptive: hedge at a percentile of recent
+    primary latencies, using the static budget until enough samples have been
+    seen. Primaries cancelled mid-flight count as censored samples, so slow
+    runs that lose the race still push the budget up.
+    """
+
+    def __init__(self, mode: str = HEDGE_OFF, after_seconds: float = 45.0,
+                 percentile: float = 95.0, window: int = 200, min_samples: int = 20):
+        self.mode = mode
+        self.after_seconds = after_seconds
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self.stats = {
+            "primary_wins": 0,
+            "fallback_wins": 0,
+            "hedges_started": 0,
+            "hedged_primary_wins": 0,
+            "hedged_fallback_wins": 0,
+            "both_failed": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in (HEDGE_STATIC, HEDGE_ADAPTIVE)
+
+    def budget(self) -> Optional[float]:
+        """Seconds to wait for the primary path before hedging, None when hedging is off"""
+        if not self.enabled:
+            return None
+        if self.mode == HEDGE_ADAPTIVE and len(self._latencies) >= self.min_samples:
+            return censored_percentile(self._latencies, self.percentile)
+        return self.after_seconds
+
+    def record_primary_latency(self, seconds: float, censored: bool = False):
+        self._latencies.append((seconds, censored))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "budget_seconds": round(self.budget(), 3) if self.enabled else None,
+            "samples": len(self._latencies),
+            "censored_samples": sum(1 for _, censored in self._latencies if censored),
+            **self.stats,
+        }
+
+
+async def _cancel(task: Optional[asyncio.Task]):
+    if task and not task.done():
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+async def hedged_race(primary: Callable[[], Awaitable[Any]], fallback: Callable[[], Awaitable[Any]],
+                      policy: HedgePolicy) -> Any:
+    """Run primary, starting fallback if it is slow or fails; return the first valid result
+
+    A falsy result or an exception counts as a failure. The losing path is
+    cancelled, and a primary cancelled mid-flight is recorded as a censored
+    latency. If both fail, the fallback's exception is re-raised (or None
+    returned) so callers keep their existing error handling.
+    """
+    start = time.perf_counter()
+    primary_task = asyncio.create_task(primary())
+    fallback_task = None
+    fallback_error = None
+
+    try:
+        budget = policy.budget()
+        done, _ = await asyncio.wait({primary_task}, timeout=budget)
+        hedged = not done
+
+        if hedged:
+            policy.stats["hedges_started"] += 1
+            logger.info(f"Primary analysis exceeded {budget:.1f}s budget, starting fallback speculatively")
+            fallback_task = asyncio.create_task(fallback())
+
+        pending = {primary_task} | ({fallback_task} if fallback_task else set())
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                try:
+                    result = task.result()
+                except Exception as e:
+                    if task is fallback_task:
+                        fallback_error = e
+                    else:
+                        logger.error(f"Primary analysis failed: {e}")
+                    result = None
+
+                if task is primary_task:
+                    if result:
+                        policy.record_primary_latency(time.perf_counter() - start)
+                        policy.stats["primary_wins"] += 1
+                        if hedged:
+                            policy.stats["hedged_primary_wins"] += 1
+                        return result
+                    if fallback_task is None:
+                        # Primary failed before the budget ran out, fall back normally
+                        fallback_task = asyncio.create_task(fallback())
+                        pending.add(fallback_task)
+                elif result:
+                    policy.stats["fallback_wins"] += 1
+                    if hedged:
+                        policy.stats["hedged_fallback_wins"] += 1
+                    return result
+
+        policy.stats["both_failed"] += 1
+        if fallback_error:
+            raise fallback_error
+        return None
+
+    finally:
+        if not primary_task.done():
+            policy.record_primary_latency(time.perf_counter() - start, censored=True)
+        await _cancel(primary_task)
+        await _cancel(fallback_task)
@@ -0,0 +1,159 @@
+import time
+import random
+import asyncio
+import logging
+from email.utils import parsedate_to_datetime
+from typing import Optional, Dict, Any
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from tracing import span, SPAN_KIND_CLIENT
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Statuses where the server refused the request before acting on it
+REJECTED_STATUSES = {429, 503}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class HttpResult:
+    """Status, headers and decoded JSON body of a finished request"""
+
+    def __init__(self, status: int, data: Any, headers: Dict[str, str]):
+        self.status = status
+        self.data = data
+        self.headers = headers
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status < 300
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After as seconds, from either delta-seconds or an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HttpClient:
+    """App-lifetime aiohttp session with pooled keep-alive connections and retries
+
+    Idempotent requests are retried on connection errors, timeouts, 429 and
+    5xx with full-jitter exponential backoff. Other methods (POST creating paid
+    predictions or completions) are only retried when the request provably
+    never ran: the connection could not be opened, or the server answered
+    429/503. A Retry-After header on the response takes precedence over the
+    computed delay (capped at backoff_max).
+    """
+
+    def __init__(self, limit: int = 100, limit_per_host: int = 20, timeout: float = 60,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 30):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.stats = {"requests": 0, "retries": 0, "errors": 0}
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=300,
+                keepalive_timeout=60
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def request_json(self, method: str, url: str, headers: Optional[Dict[str, str]] = None,
+                           json: Any = None, timeout: Optional[float] = None,
+                           retries: Optional[int] = None, idempotent: Optional[bool] = None) -> HttpResult:
+        """Send a request and decode the JSON response, retrying transient failures
+
+        idempotent defaults to whether the method is; pass True for POSTs that
+        are safe to repeat. Returns the last response once retries are
+        exhausted; raises only if the final attempt could not reach the server.
+        """
+        retries = self.max_retries if retries is None else retries
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        with span(f"HTTP {method}", SPAN_KIND_CLIENT) as traced:
+            if traced:
+                parts = urlsplit(url)  # Query strings can carry API keys, so they're left out
+                traced.attributes.update({"http.method": method, "server.address": parts.hostname or "",
+                                          "url.path": parts.path})
+            result = await self._request_json(method, url, headers, json, timeout, retries, idempotent, traced)
+            if traced:
+                traced.attributes["http.status_code"] = result.status
+        return result
+
+    async def _request_json(self, method: str, url: str, headers: Optional[Dict[str, str]], json: Any,
+                            timeout: Optional[float], retries: int, idempotent: bool, traced) -> HttpResult:
+        request_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else None
+        retry_statuses = RETRY_STATUSES if idempotent else REJECTED_STATUSES
+
+        for attempt in range(retries + 1):
+            self.stats["requests"] += 1
+            if traced:
+                traced.attributes["http.attempts"] = attempt + 1
+            try:
+                async with self.session.request(method, url, headers=headers, json=json,
+                                                timeout=request_timeout) as response:
+                    try:
+                        data = await response.json(content_type=None)
+                    except ValueError:
+                        data = None
+                    result = HttpResult(response.status, data, dict(response.headers))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # A timeout or dropped connection may come after the server acted on the request
+                retryable = idempotent or isinstance(e, aiohttp.ClientConnectorError)
+                if attempt >= retries or not retryable:
+                    self.stats["errors"] += 1
+                    raise
+                delay = self._backoff(attempt, None)
+                logger.warning(f"{method} {url} failed ({e!r}), retrying in {delay:.1f}s")
+                self.stats["retries"] += 1
+                await asyncio.sleep(delay)
+                continue
+
+            if result.status not in retry_statuses or attempt >= retries:
+                if not result.ok:
+                    self.stats["errors"] += 1
+                return result
+
+            delay = self._backoff(attempt, parse_retry_after(result.headers.get("Retry-After")))
+            logger.warning(f"{method} {url} returned {result.status}, retrying in {delay:.1f}s")
+            self.stats["retries"] += 1
+            await asyncio.sleep(delay)
+
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"limit": self.limit, "limit_per_host": self.limit_per_host, **self.stats}
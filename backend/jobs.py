@@ -0,0 +1,280 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import logging
+import threading
+from typing import Optional, Dict, Any, Callable, Awaitable, List
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+
+class JobStore:
+    """Persistent SQLite-backed job queue shared by all worker processes
+
+    A job is claimed with a lease, which the worker renews while the job runs.
+    If the process running it dies, the lease expires and another worker picks
+    the job up again, up to max_attempts. A job's upload is deleted once it
+    has finished, successfully or for good.
+    """
+
+    def __init__(self, db_path: str, lease_seconds: float = 600, max_attempts: int = 3):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, filename TEXT, file_path TEXT NOT NULL, "
+            "sha256 TEXT, probe TEXT, callback_url TEXT, result TEXT, error TEXT, "
+            "attempts INTEGER NOT NULL DEFAULT 0, lease_expires REAL, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+        conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Get the SQLite connection for the calling thread"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def submit(self, file_path: str, filename: Optional[str], sha256: Optional[str] = None,
+               probe: Optional[Dict[str, Any]] = None, callback_url: Optional[str] = None,
+               job_id: Optional[str] = None) -> str:
+        """Enqueue a saved upload and return its job ID"""
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        self._connect().execute(
+            "INSERT INTO jobs (id, status, filename, file_path, sha256, probe, callback_url, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, JOB_QUEUED, filename, file_path, sha256,
+             json.dumps(probe) if probe else None, callback_url, now, now)
+        )
+        return job_id
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """Atomically take the oldest queued job, or one whose lease has expired"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Jobs abandoned by a crashed worker too many times are given up on
+            abandoned = conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? "
+                "WHERE status = ? AND lease_expires < ? AND attempts >= ? RETURNING id, file_path",
+                (JOB_FAILED, "Job exceeded maximum attempts", now, JOB_RUNNING, now, self.max_attempts)
+            ).fetchall()
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? OR (status = ? AND lease_expires < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (JOB_QUEUED, JOB_RUNNING, now)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_expires = ?, updated_at = ? WHERE id = ?",
+                    (JOB_RUNNING, now + self.lease_seconds, now, row["id"])
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        
+        for job_id, file_path in abandoned:
+            logger.warning(f"Job {job_id} exceeded {self.max_attempts} attempts, giving up")
+            remove_upload(file_path)
+        if row is None:
+            return None
+        job = self._row_to_dict(row)
+        job["attempts"] += 1
+        return job
+
+    def renew(self, job_id: str, attempt: int) -> bool:
+        """Extend the lease of a running job; False if it is no longer this attempt's to run"""
+        cursor = self._connect().execute(
+            "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND status = ? AND attempts = ?",
+            (time.time() + self.lease_seconds, time.time(), job_id, JOB_RUNNING, attempt)
+        )
+        return cursor.rowcount == 1
+
+    def requeue(self, job_id: str):
+        """Put a job interrupted by a graceful shutdown back at the front of the queue"""
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, attempts = MAX(attempts - 1, 0), lease_expires = NULL, updated_at = ? "
+            "WHERE id = ? AND status = ?",
+            (JOB_QUEUED, time.time(), job_id, JOB_RUNNING)
+        )
+
+    def complete(self, job_id: str, result: Dict[str, Any]):
+        self._finish(job_id, JOB_SUCCEEDED, result=json.dumps(result))
+
+    def fail(self, job_id: str, error: str):
+        self._finish(job_id, JOB_FAILED, error=error)
+
+    def _finish(self, job_id: str, status: str, result: Optional[str] = None, error: Optional[str] = None):
+        row = self._connect().execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, lease_expires = NULL, updated_at = ? "
+            "WHERE id = ? RETURNING file_path",
+            (status, result, error, time.time(), job_id)
+        ).fetchone()
+        if row:
+            remove_upload(row["file_path"])
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def queue_depth(self) -> int:
+        """Number of jobs waiting or running"""
+        row = self._connect().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (JOB_QUEUED, JOB_RUNNING)
+        ).fetchone()
+        return row[0]
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["probe"] = json.loads(job["probe"]) if job["probe"] else None
+        return job
+
+
+def remove_upload(file_path: str):
+    try:
+        os.unlink(file_path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.error(f"Failed to remove job upload {file_path}: {e}")
+
+
+class JobWorkerPool:
+    """Runs queued jobs through an async handler with a fixed number of workers
+
+    While a job runs its lease is renewed every third of lease_seconds, so
+    long analyses aren't claimed and run a second time by another worker.
+    """
+
+    def __init__(self, store: JobStore, handler: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+                 concurrency: int = 2, poll_interval: float = 1.0,
+                 on_finished: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None):
+        self.store = store
+        self.handler = handler
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.on_finished = on_finished
+        self._tasks: List[asyncio.Task] = []
+        self._running: Dict[int, str] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.concurrency)]
+        logger.info(f"Started {self.concurrency} job workers")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        # Hand interrupted jobs straight back instead of waiting for their leases to expire
+        for job_id in self._running.values():
+            try:
+                self.store.requeue(job_id)
+                logger.info(f"Requeued interrupted job {job_id}")
+            except Exception as e:
+                logger.error(f"Failed to requeue job {job_id}: {e}")
+        self._running = {}
+
+    def notify(self):
+        """Wake idle workers in this process after a submit"""
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def _worker(self, index: int):
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                job = await loop.run_in_executor(None, self.store.claim)
+            except Exception as e:
+                logger.error(f"Job worker {index} failed to claim a job: {e}")
+                job = None
+
+            if job is None:
+                # Idle: wait for a local submit or poll for jobs from other processes
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            logger.info(f"Job worker {index} running job {job['id']} (attempt {job['attempts']})")
+            self._running[index] = job["id"]
+            heartbeat = asyncio.create_task(self._heartbeat(job))
+            try:
+                result = await self.handler(job)
+                await loop.run_in_executor(None, self.store.complete, job["id"], result)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                detail = getattr(e, "detail", None) or str(e)
+                logger.error(f"Job {job['id']} failed: {detail}")
+                await loop.run_in_executor(None, self.store.fail, job["id"], detail)
+            finally:
+                heartbeat.cancel()
+            self._running.pop(index, None)
+
+            if self.on_finished:
+                finished = await loop.run_in_executor(None, self.store.get, job["id"])
+                try:
+                    await self.on_finished(finished)
+                except Exception as e:
+                    logger.error(f"Job {job['id']} completion hook failed: {e}")
+
+
+    async def _heartbeat(self, job: Dict[str, Any]):
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.store.lease_seconds / 3)
+            try:
+                if not await loop.run_in_executor(None, self.store.renew, job["id"], job["attempts"]):
+                    logger.warning(f"Lost the lease on job {job['id']}, another worker may run it again")
+                    return
+            except Exception as e:
+                logger.error(f"Failed to renew the lease on job {job['id']}: {e}")
+
+
+async def post_job_callback(http_client, job: Dict[str, Any], timeout: float = 10):
+    """POST the finished job to its callback URL through the shared HTTP client"""
+    payload = {
+        "id": job["id"],
+        "status": job["status"],
+        "result": job["result"],
+        "error": job["error"],
+    }
+    try:
+        # Receivers dedupe on the job id, so redelivery after a timeout is safe
+        response = await http_client.request_json("POST", job["callback_url"], json=payload,
+                                                  timeout=timeout, idempotent=True)
+        if response.ok:
+            logger.info(f"Job {job['id']} callback delivered: {response.status}")
+        else:
+            logger.error(f"Job {job['id']} callback rejected: {response.status}")
+    except Exception as e:
+        logger.error(f"Giving up on callback for job {job['id']}: {e}")
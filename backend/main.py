@@ -1,37 +1,55 @@
 import os
 import logging
 import tempfile
-import subprocess
-import base64
+import shutil
 import json
 import asyncio
+import hashlib
+import uuid
 from typing import List, Optional, Dict, Any, Literal
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from contextvars import ContextVar
 from pathlib import Path
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, Field, field_validator
-import aiohttp
-import cv2
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST
+from pydantic import BaseModel, Field, ValidationError, field_validator
 import numpy as np
 from PIL import Image
 import io
-import replicate
 import google.generativeai as genai
 from dotenv import load_dotenv
-import whisper
+
+from cache import ResultCache, make_cache_key
+from http_client import HttpClient
+from media_tools import run_media_tool, MediaToolError
+from hedging import HedgePolicy, hedged_race
+from aggregation import EarlyExitPolicy
+from resilience import ProviderGuard, CircuitBreaker, AdaptiveLimiter, ProviderUnavailable
+from metrics import (
+    track_stage, timed_stage, record_analysis, record_upload, directory_size, metrics_payload, mark_worker_dead,
+    ANALYSES_IN_FLIGHT, ANALYSIS_FAILURES, TEMP_DISK_BYTES, JOB_QUEUE_DEPTH, CACHE_MEMORY_ENTRIES
+)
+from sampling import ScenePlan, Thumbnails, plan_scene_samples, decode_thumbnails, THUMB_SIZE
+from segments import Segment, LONG_VIDEO_SEGMENT, plan_segments, split_video, format_timestamp
+from frames import read_video_frames, FrameEncoding, EncodedFrame
+from fingerprint import FingerprintIndex, compute_fingerprint
+from prescreen import Prescreener, load_classifier
+from jobs import JobStore, JobWorkerPool, JOB_QUEUED, post_job_callback
+from whisper_service import WhisperPool, SAMPLE_RATE, preload_count
+from tracing import TracingMiddleware, set_attribute
+from workspace import WorkspaceManager, WorkspaceFull, Workspace, current_workspace, scratch_dir
+from upload_limits import UploadSizeLimitMiddleware
 
 # Load environment variables
 load_dotenv()
 
-# Configure replicate API token
+# Check replicate API token
 replicate_key = os.getenv("REPLICATE_API_KEY")
 if replicate_key:
-    # Set both the environment variable and the replicate.api_token
-    os.environ["REPLICATE_API_TOKEN"] = replicate_key
-    replicate.api_token = replicate_key
     print(f"✅ Replicate API token configured (length: {len(replicate_key)})")
 else:
     print("❌ Replicate API token not found in environment")
@@ -62,15 +80,198 @@ app.add_middleware(
 )
 
 # Configuration
-MAX_VIDEO_DURATION = 60  # seconds
+MAX_VIDEO_DURATION = 60  # seconds analyzed as one piece
+
+# Longer videos are split into segments analyzed in parallel ("segment"), or cut to the first MAX_VIDEO_DURATION ("trim")
+LONG_VIDEO_MODE = os.getenv("LONG_VIDEO_MODE", "segment")
+LONG_VIDEO_SEGMENT_SECONDS = float(os.getenv("LONG_VIDEO_SEGMENT_SECONDS", str(MAX_VIDEO_DURATION)))
+LONG_VIDEO_MAX_MODEL_CALLS = int(os.getenv("LONG_VIDEO_MAX_MODEL_CALLS", "30"))  # Clips (and fallback frames) per video, 0 for unlimited
+LONG_VIDEO_CONCURRENCY = int(os.getenv("LONG_VIDEO_CONCURRENCY", str(os.cpu_count() or 2)))  # Segments in flight per video
 TEMP_DIR = os.getenv("TEMP_DIR", "./temp")
 Path(TEMP_DIR).mkdir(exist_ok=True)
 
+# Per-request temp workspaces
+TEMP_RAM_DIR = os.getenv("TEMP_RAM_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else "")  # tmpfs for small uploads, empty disables
+TEMP_RAM_MAX_FILE_BYTES = int(os.getenv("TEMP_RAM_MAX_FILE_BYTES", str(32 * 1024 * 1024)))
+TEMP_RAM_BUDGET_BYTES = int(os.getenv("TEMP_RAM_BUDGET_BYTES", str(128 * 1024 * 1024)))  # Per worker process
+TEMP_MIN_FREE_BYTES = int(os.getenv("TEMP_MIN_FREE_BYTES", str(512 * 1024 * 1024)))  # Free space kept on TEMP_DIR's disk
+TEMP_QUOTA_WAIT_SECONDS = float(os.getenv("TEMP_QUOTA_WAIT_SECONDS", "10"))  # Wait for space before rejecting
+TEMP_ORPHAN_AGE_SECONDS = float(os.getenv("TEMP_ORPHAN_AGE_SECONDS", "3600"))
+TEMP_SWEEP_INTERVAL = float(os.getenv("TEMP_SWEEP_INTERVAL", "300"))
+
+workspaces = WorkspaceManager(
+    TEMP_DIR,
+    ram_dir=TEMP_RAM_DIR,
+    ram_max_file_bytes=TEMP_RAM_MAX_FILE_BYTES,
+    ram_budget_bytes=TEMP_RAM_BUDGET_BYTES,
+    min_free_bytes=TEMP_MIN_FREE_BYTES,
+    wait_seconds=TEMP_QUOTA_WAIT_SECONDS,
+    orphan_age=TEMP_ORPHAN_AGE_SECONDS,
+    sweep_interval=TEMP_SWEEP_INTERVAL
+)
+
+async def open_workspace(expected_bytes: Optional[int] = None) -> Workspace:
+    """New request workspace, or a 503 when temp space has run out"""
+    try:
+        return await workspaces.create(expected_bytes)
+    except WorkspaceFull as e:
+        logger.error(f"Rejecting request: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="Server is low on temporary storage. Please retry later.",
+            headers={"Retry-After": "30"}
+        )
+
 # API Keys - Load from environment variables
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
 REPLICATE_API_KEY = os.getenv("REPLICATE_API_KEY", "")
 GROK_API_KEY = os.getenv("GROK_API_KEY", "")
 
+# Upload configuration
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(100 * 1024 * 1024)))  # bytes, matches nginx client_max_body_size
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MiB
+PROBE_HEADER_BYTES = 2 * 1024 * 1024  # Start probing once this much of the upload is on disk
+HEADER_DURATION_FORMATS = {"mov", "mp4", "matroska", "webm", "avi"}  # Containers whose header carries the duration
+
+# Clip extraction configuration
+PROBE_TIMEOUT = float(os.getenv("PROBE_TIMEOUT", "30"))  # seconds per ffprobe call
+CLIP_DURATION = 2  # seconds per clip (or less for very short videos)
+STREAM_COPY_CODECS = {"h264", "hevc", "vp9", "av1"}  # Codecs that can be cut into MP4 without re-encoding
+STREAM_COPY_MAX_OVERSHOOT = 3  # Re-encode when a copied clip is this many times its expected size
+
+# Fallback pipeline stage timeouts (seconds)
+FALLBACK_FRAME_TIMEOUT = float(os.getenv("FALLBACK_FRAME_TIMEOUT", "60"))
+FALLBACK_TRANSCRIBE_TIMEOUT = float(os.getenv("FALLBACK_TRANSCRIBE_TIMEOUT", "120"))
+FALLBACK_CAPTION_TIMEOUT = float(os.getenv("FALLBACK_CAPTION_TIMEOUT", "90"))
+FALLBACK_GROK_TIMEOUT = float(os.getenv("FALLBACK_GROK_TIMEOUT", "60"))
+
+# Hedging: start the fallback pipeline speculatively when Gemini is slow
+HEDGE_MODE = os.getenv("HEDGE_MODE", "off")  # "off", "static" or "adaptive"
+HEDGE_AFTER_SECONDS = float(os.getenv("HEDGE_AFTER_SECONDS", "45"))
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+
+hedge_policy = HedgePolicy(mode=HEDGE_MODE, after_seconds=HEDGE_AFTER_SECONDS, percentile=HEDGE_PERCENTILE)
+
+# Early-exit aggregation: stop waiting for clips once the verdict can't change
+EARLY_EXIT_MODE = os.getenv("EARLY_EXIT_MODE", "max_severity")  # "off", "max_severity", "first_nsfw" or "quorum"
+EARLY_EXIT_BLOCK_SEVERITY = int(os.getenv("EARLY_EXIT_BLOCK_SEVERITY", "5"))
+EARLY_EXIT_QUORUM = int(os.getenv("EARLY_EXIT_QUORUM", "2"))  # nsfw clips needed in quorum mode
+
+early_exit_policy = EarlyExitPolicy(mode=EARLY_EXIT_MODE, block_severity=EARLY_EXIT_BLOCK_SEVERITY, quorum=EARLY_EXIT_QUORUM)
+
+# Batch analysis configuration
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "50"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))  # Files in flight per batch request
+
+# Reject oversized bodies before Starlette spools the multipart form to disk
+UPLOAD_FORM_OVERHEAD = 1024 * 1024  # Multipart boundaries, headers and small form fields
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_bytes=MAX_UPLOAD_SIZE + UPLOAD_FORM_OVERHEAD,
+    path_limits={"/analyze/batch": BATCH_MAX_FILES * (MAX_UPLOAD_SIZE + UPLOAD_FORM_OVERHEAD)}
+)
+
+# Background job configuration
+JOB_DIR = os.getenv("JOB_DIR", "./jobs")  # Must persist across restarts
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join(JOB_DIR, "jobs.db"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))  # Per uvicorn worker process
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "100"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "600"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+Path(JOB_DIR).mkdir(parents=True, exist_ok=True)
+
+# Scene-aware sampling: pick the most distinct shots instead of fixed start/middle/end
+SCENE_SAMPLING = os.getenv("SCENE_SAMPLING", "true").lower() == "true"
+SCENE_ANALYSIS_FPS = float(os.getenv("SCENE_ANALYSIS_FPS", "2"))  # Thumbnails per second decoded for analysis
+SCENE_CUT_THRESHOLD = float(os.getenv("SCENE_CUT_THRESHOLD", "0.35"))  # Histogram distance that starts a new shot
+SCENE_DUPLICATE_THRESHOLD = float(os.getenv("SCENE_DUPLICATE_THRESHOLD", "0.15"))  # Closer picks are dropped as duplicates
+SCENE_MIN_SAMPLES = int(os.getenv("SCENE_MIN_SAMPLES", "1"))  # Evenly spaced samples top up to this many
+
+# Local CPU pre-screen that settles blank/static or clearly explicit videos without a paid model call
+PRESCREEN_ENABLED = os.getenv("PRESCREEN_ENABLED", "true").lower() == "true"
+PRESCREEN_FPS = float(os.getenv("PRESCREEN_FPS", "1"))
+PRESCREEN_BLANK_STD = float(os.getenv("PRESCREEN_BLANK_STD", "6"))  # Grey-level std below which a frame is blank
+PRESCREEN_MIN_ENTROPY = float(os.getenv("PRESCREEN_MIN_ENTROPY", "2.0"))  # Histogram entropy (bits) below which a frame is a plain slide
+PRESCREEN_MAX_SKIN_RATIO = float(os.getenv("PRESCREEN_MAX_SKIN_RATIO", "0.05"))
+PRESCREEN_REQUIRE_SILENT = os.getenv("PRESCREEN_REQUIRE_SILENT", "true").lower() == "true"
+PRESCREEN_ONNX_MODEL = os.getenv("PRESCREEN_ONNX_MODEL", "")  # Optional CPU classifier, needs onnxruntime
+PRESCREEN_ONNX_NSFW_CLASSES = [int(c) for c in os.getenv("PRESCREEN_ONNX_NSFW_CLASSES", "1").split(",")]
+PRESCREEN_ONNX_INPUT_SIZE = int(os.getenv("PRESCREEN_ONNX_INPUT_SIZE", "224"))
+PRESCREEN_SAFE_THRESHOLD = float(os.getenv("PRESCREEN_SAFE_THRESHOLD", "0.05"))
+PRESCREEN_NSFW_THRESHOLD = float(os.getenv("PRESCREEN_NSFW_THRESHOLD", "0.95"))
+
+prescreener = Prescreener(
+    fps=PRESCREEN_FPS,
+    blank_std=PRESCREEN_BLANK_STD,
+    min_entropy=PRESCREEN_MIN_ENTROPY,
+    max_skin_ratio=PRESCREEN_MAX_SKIN_RATIO,
+    require_silent=PRESCREEN_REQUIRE_SILENT,
+    classifier=load_classifier(PRESCREEN_ONNX_MODEL, PRESCREEN_ONNX_NSFW_CLASSES, PRESCREEN_ONNX_INPUT_SIZE),
+    safe_threshold=PRESCREEN_SAFE_THRESHOLD,
+    nsfw_threshold=PRESCREEN_NSFW_THRESHOLD
+) if PRESCREEN_ENABLED else None
+
+# Fallback frames are JPEG-encoded on their own threads while decoding continues
+FRAME_ENCODE_WORKERS = int(os.getenv("FRAME_ENCODE_WORKERS", "4"))
+frame_encode_executor = ThreadPoolExecutor(max_workers=FRAME_ENCODE_WORKERS, thread_name_prefix="frame-encode")
+
+# Per-provider media preprocessing: media is downscaled to what each model needs, never upscaled (0 keeps the source)
+GEMINI_CLIP_HEIGHT = int(os.getenv("GEMINI_CLIP_HEIGHT", "720"))  # Taller sources are re-encoded instead of stream-copied
+GEMINI_CLIP_FPS = float(os.getenv("GEMINI_CLIP_FPS", "0"))  # Gemini samples video at 1 fps
+GEMINI_CLIP_CRF = int(os.getenv("GEMINI_CLIP_CRF", "23"))  # libx264 quality for re-encoded clips, higher is smaller
+REPLICATE_FRAME_HEIGHT = int(os.getenv("REPLICATE_FRAME_HEIGHT", "720"))
+REPLICATE_FRAME_FORMAT = os.getenv("REPLICATE_FRAME_FORMAT", "jpeg")  # "jpeg" or "webp"
+REPLICATE_FRAME_QUALITY = int(os.getenv("REPLICATE_FRAME_QUALITY", "85"))  # 0-100
+
+replicate_frame_encoding = FrameEncoding(
+    height=REPLICATE_FRAME_HEIGHT, image_format=REPLICATE_FRAME_FORMAT, quality=REPLICATE_FRAME_QUALITY
+)
+
+# Model configuration
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-pro-preview-05-06")
+GROK_MODEL = os.getenv("GROK_MODEL", "grok-3-mini")
+NUM_CLIPS = 3
+NUM_FALLBACK_FRAMES = 3
+PROMPT_VERSION = "1"  # Bump whenever the analysis prompts change to invalidate cached results
+
+# Result cache configuration
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "86400"))
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", "")  # Empty disables the shared on-disk tier
+
+result_cache = ResultCache(
+    max_entries=CACHE_MAX_ENTRIES,
+    ttl_seconds=CACHE_TTL_SECONDS,
+    db_path=CACHE_DB_PATH or None
+) if CACHE_ENABLED else None
+
+# Perceptual fingerprint index: reuses verdicts for re-encoded, cropped or trimmed re-uploads
+FINGERPRINT_ENABLED = os.getenv("FINGERPRINT_ENABLED", "true").lower() == "true"
+FINGERPRINT_FPS = float(os.getenv("FINGERPRINT_FPS", "1"))  # Frames hashed per second of video
+FINGERPRINT_MAX_DISTANCE = int(os.getenv("FINGERPRINT_MAX_DISTANCE", "8"))  # Max differing bits of 64 per frame
+FINGERPRINT_MATCH_THRESHOLD = float(os.getenv("FINGERPRINT_MATCH_THRESHOLD", "0.8"))  # Fraction of the upload's frames that must match a known video
+FINGERPRINT_MIN_MATCHES = int(os.getenv("FINGERPRINT_MIN_MATCHES", "3"))
+FINGERPRINT_DB_PATH = os.getenv("FINGERPRINT_DB_PATH", "")  # Empty keeps the index in memory only
+
+# Thumbnails decoded once per request and shared by the pre-screen, scene sampler and fingerprint
+# The scene sampler's 64 px is plenty for histograms, blank checks and hashes; only the
+# optional classifier wants more detail, and the scene sampler shrinks back down for it
+THUMBNAIL_SIZE = prescreener.frame_size if prescreener and prescreener.classifier else THUMB_SIZE  # pixels square
+THUMBNAIL_MAX_FRAMES = 1200  # About 15 MB at 64 px; very long videos are decoded at a lower rate instead
+
+# Maximum Gemini requests in flight per worker process, shared across all requests
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "6"))
+gemini_semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+
+# Gemini request mode: "per_clip" sends one request per clip; "combined" sends every clip in one request
+# and "proxy" joins them into one small re-encoded video first, so the prompt is only paid for once
+GEMINI_REQUEST_MODE = os.getenv("GEMINI_REQUEST_MODE", "per_clip")
+GEMINI_PROXY_HEIGHT = int(os.getenv("GEMINI_PROXY_HEIGHT", "360"))  # pixels, never upscaled, 0 keeps the source size
+GEMINI_PROXY_FPS = float(os.getenv("GEMINI_PROXY_FPS", "2"))  # Gemini samples video at 1 fps, 0 keeps the source rate
+GEMINI_PROXY_CRF = int(os.getenv("GEMINI_PROXY_CRF", "32"))  # libx264 quality, higher is smaller
+GEMINI_PROXY_AUDIO_BITRATE = "32k"  # Mono, enough to catch spoken profanity
+
 # Configure Gemini API
 if GEMINI_API_KEY:
     genai.configure(api_key=GEMINI_API_KEY)
@@ -78,25 +279,127 @@ if GEMINI_API_KEY:
 else:
     logger.warning("❌ Gemini API key not found")
 
-# Initialize Whisper model
-whisper_model = None
+# External API endpoints
+GROK_API_BASE = os.getenv("GROK_API_BASE", "https://api.x.ai/v1")
+REPLICATE_API_BASE = os.getenv("REPLICATE_API_BASE", "https://api.replicate.com/v1")
+JOY_CAPTION_VERSION = "86674ddd559dbdde6ed40e0bdfc0720c84d82971e288149fcf2c35c538272617"  # pipi32167/joy-caption
+REPLICATE_WAIT_SECONDS = int(os.getenv("REPLICATE_WAIT_SECONDS", "60"))  # Sync-mode wait, max 60
+REPLICATE_POLL_INTERVAL = float(os.getenv("REPLICATE_POLL_INTERVAL", "1"))
+REPLICATE_PREDICTION_TIMEOUT = float(os.getenv("REPLICATE_PREDICTION_TIMEOUT", "300"))
+
+# Per-provider circuit breakers and adaptive (AIMD) concurrency limits
+PROVIDER_BREAKER_FAILURES = int(os.getenv("PROVIDER_BREAKER_FAILURES", "5"))  # Consecutive failures that open a circuit, 0 disables
+PROVIDER_BREAKER_RESET_SECONDS = float(os.getenv("PROVIDER_BREAKER_RESET_SECONDS", "30"))  # Open time before a probe call
+PROVIDER_LATENCY_TOLERANCE = float(os.getenv("PROVIDER_LATENCY_TOLERANCE", "2.0"))  # Calls this many times slower than usual shrink the limit, 0 disables
+PROVIDER_MIN_CONCURRENCY = int(os.getenv("PROVIDER_MIN_CONCURRENCY", "1"))
+REPLICATE_MAX_CONCURRENCY = int(os.getenv("REPLICATE_MAX_CONCURRENCY", "16"))  # Joy Caption predictions in flight per worker
+GROK_MAX_CONCURRENCY = int(os.getenv("GROK_MAX_CONCURRENCY", "16"))
+
+def make_provider_guard(name: str, max_concurrency: int) -> ProviderGuard:
+    return ProviderGuard(
+        name,
+        CircuitBreaker(failure_threshold=PROVIDER_BREAKER_FAILURES, reset_seconds=PROVIDER_BREAKER_RESET_SECONDS),
+        AdaptiveLimiter(
+            min_limit=PROVIDER_MIN_CONCURRENCY,
+            max_limit=max_concurrency,
+            latency_tolerance=PROVIDER_LATENCY_TOLERANCE
+        )
+    )
+
+gemini_guard = make_provider_guard("gemini", GEMINI_MAX_CONCURRENCY)
+replicate_guard = make_provider_guard("replicate", REPLICATE_MAX_CONCURRENCY)
+grok_guard = make_provider_guard("grok", GROK_MAX_CONCURRENCY)
+
+# Shared HTTP client for Grok, Replicate and job callbacks
+http_client = HttpClient(
+    limit=int(os.getenv("HTTP_POOL_LIMIT", "100")),
+    limit_per_host=int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "20")),
+    timeout=float(os.getenv("HTTP_TIMEOUT", "90")),
+    max_retries=int(os.getenv("HTTP_MAX_RETRIES", "3"))
+)
+
+# Per-request tracing, opted in with the trace header or by sampling
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "false").lower() == "true"
+TRACE_HEADER = os.getenv("TRACE_HEADER", "X-Trace")  # Send "X-Trace: 1" to trace one request
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))  # Fraction of requests traced without the header
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")  # OTLP JSON lines appended here
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "")  # e.g. http://collector:4318/v1/traces
+TRACE_PROFILER = os.getenv("TRACE_PROFILER", "").lower()  # "", "cprofile" or "pyinstrument"
+TRACE_PROFILE_DIR = os.getenv("TRACE_PROFILE_DIR", str(log_dir / "profiles"))
+
+def append_trace_line(path: str, line: str):
+    with open(path, "a") as f:
+        f.write(line + "\n")
+
+async def export_trace(payload: Dict[str, Any]):
+    """Write a finished trace to the JSON lines file and/or the OTLP collector"""
+    if TRACE_EXPORT_PATH:
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, append_trace_line, TRACE_EXPORT_PATH, json.dumps(payload))
+    if TRACE_OTLP_ENDPOINT:
+        result = await http_client.request_json("POST", TRACE_OTLP_ENDPOINT, json=payload, timeout=10, retries=1,
+                                                 idempotent=True)
+        if not result.ok:
+            logger.warning(f"Trace collector returned {result.status}")
 
-def get_whisper_model():
-    """Get or initialize Whisper model"""
-    global whisper_model
-    if whisper_model is None:
-        logger.info("Loading Whisper base.en model...")
-        whisper_model = whisper.load_model("base.en")
-        logger.info("Whisper model loaded successfully")
-    return whisper_model
+if TRACE_ENABLED:
+    if TRACE_PROFILER:
+        Path(TRACE_PROFILE_DIR).mkdir(parents=True, exist_ok=True)
+    app.add_middleware(
+        TracingMiddleware,
+        header=TRACE_HEADER,
+        sample_rate=TRACE_SAMPLE_RATE,
+        exporter=export_trace if TRACE_EXPORT_PATH or TRACE_OTLP_ENDPOINT else None,
+        profiler=TRACE_PROFILER,
+        profile_dir=TRACE_PROFILE_DIR
+    )
+
+# Whisper inference pool
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base.en")
+WHISPER_POOL_SIZE = int(os.getenv("WHISPER_POOL_SIZE", "1"))  # Model instances per worker process
+WHISPER_DEVICE = os.getenv("WHISPER_DEVICE", "")  # Empty picks CUDA when available, else CPU
+WHISPER_FP16 = os.getenv("WHISPER_FP16", "false").lower() == "true"  # Half precision, GPU only
+WHISPER_BATCH_SIZE = int(os.getenv("WHISPER_BATCH_SIZE", "1"))  # >1 batches concurrent transcriptions
+WHISPER_THREADS = int(os.getenv("WHISPER_THREADS", "0"))  # torch CPU threads, 0 keeps the default
+WHISPER_PRELOAD = os.getenv("WHISPER_PRELOAD", "auto")  # "auto" warms one instance of tiny/base models per worker, "true" the whole pool, "false" none
+
+whisper_pool = WhisperPool(
+    model_name=WHISPER_MODEL,
+    pool_size=WHISPER_POOL_SIZE,
+    device=WHISPER_DEVICE or None,
+    fp16=WHISPER_FP16,
+    batch_size=WHISPER_BATCH_SIZE,
+    threads=WHISPER_THREADS
+)
 
 # Response Models
+class SegmentVerdict(BaseModel):
+    start: float  # seconds
+    end: float
+    categories: List[str]
+    severity: int
+    description: str
+
 class AnalysisResult(BaseModel):
     method: str
     status: str  # "safe" or "nsfw"
     categories: List[str]  # ["pornography", "violence", "self-harm", "weapons", "profanity", "other"]
     severity: int  # 0-5
     description: str  # Brief 1-2 sentence description
+    flagged_segments: Optional[List[SegmentVerdict]] = None  # Long videos: time ranges of each flagged segment
+
+class JobSubmitted(BaseModel):
+    id: str
+    status: str
+
+class JobStatus(BaseModel):
+    id: str
+    status: str  # "queued", "running", "succeeded" or "failed"
+    filename: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    result: Optional[AnalysisResult] = None
+    error: Optional[str] = None
 
 class ErrorResponse(BaseModel):
     error: str
@@ -119,95 +422,258 @@ class GeminiResponse(BaseModel):
             return ['other']
         return filtered_categories
 
+class GeminiSegmentResponse(GeminiResponse):
+    index: int = Field(ge=0)
+
+class GeminiCombinedResponse(BaseModel):
+    segments: List[GeminiSegmentResponse] = Field(min_length=1)
+
+# Analysis prompt
+GEMINI_PROMPT = """You are a strict content-safety engine. Analyze the video content and determine if it's safe or NSFW.
+
+IMPORTANT: If you detect ANY profanity, swearing, strong language, or curse words (including implied, censored, or abbreviated forms), you MUST categorize it as "profanity".
+
+Return your analysis in this exact JSON format (no markdown, just pure JSON):
+{
+    "status": "safe" or "nsfw",
+    "categories": ["pornography", "violence", "self-harm", "weapons", "profanity", "other"],
+    "severity": 0-5,
+    "description": "brief 1-2 sentence description"
+}
+
+Severity scale:
+0 = safe content
+1 = suggestive
+2 = mature
+3 = explicit
+4 = extreme
+5 = illegal
+
+Categories (choose ALL that apply):
+- pornography (sexual/nudity)
+- violence (harm/gore)
+- self-harm (suicide/injury)
+- weapons (guns/knives/explosives)
+- profanity (ANY strong language, swearing, curse words, f-words, s-words, etc.)
+- other (hate speech/drugs/disturbing content that doesn't fit above)
+
+CRITICAL: If you mention profanity, swearing, strong language, or curse words in your description, you MUST include "profanity" in the categories array.
+
+Multiple categories allowed if applicable."""
+
+# Appended to GEMINI_PROMPT when every clip goes to Gemini in a single request
+GEMINI_COMBINED_PROMPT = """
+
+The content is {count} clip(s) sampled from the same video, numbered from 0 in the order given{layout}. Judge each clip on its own. Instead of a single object, return one verdict per clip in this exact JSON format (no markdown, just pure JSON):
+{{
+    "segments": [
+        {{"index": 0, "status": "safe" or "nsfw", "categories": [...], "severity": 0-5, "description": "brief 1-2 sentence description"}}
+    ]
+}}"""
+
 # Utility Functions
-async def get_video_duration(file_path: str) -> float:
-    """Get video duration using ffprobe"""
+@timed_stage("probe")
+async def probe_video(file_path: str) -> Dict[str, Any]:
+    """Get duration, container format, primary video codec, size and frame rate and audio presence with a single ffprobe call"""
+    info = {"duration": 0.0, "format_name": "", "video_codec": None, "height": None, "fps": None, "has_audio": None}
     try:
         cmd = [
-            "ffprobe", "-v", "error", "-show_entries",
-            "format=duration", "-of", "default=noprint_wrappers=1:nokey=1",
+            "ffprobe", "-v", "error",
+            "-show_entries", "format=duration,format_name:stream=codec_type,codec_name,height,avg_frame_rate",
+            "-of", "json",
             file_path
         ]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        return float(result.stdout.strip())
+        result = await run_media_tool(cmd, timeout=PROBE_TIMEOUT)
+        data = json.loads(result.text or "{}")
+        info["duration"] = float(data.get("format", {}).get("duration", 0) or 0)
+        info["format_name"] = data.get("format", {}).get("format_name", "")
+        streams = data.get("streams", [])
+        for stream in streams:
+            if stream.get("codec_type") == "video":
+                info["video_codec"] = stream.get("codec_name")
+                info["height"] = stream.get("height")
+                num, _, den = stream.get("avg_frame_rate", "0/0").partition("/")
+                info["fps"] = float(num) / float(den) if float(den or 0) else None
+                break
+        info["has_audio"] = any(stream.get("codec_type") == "audio" for stream in streams)
     except Exception as e:
-        logger.error(f"Error getting video duration: {e}")
-        return 0
+        logger.error(f"Error probing video: {e}")
+    return info
+
+def clip_timestamps(duration: float, num_clips: int, centers: Optional[List[float]] = None) -> tuple:
+    """Clip start times: around the given scene centers, or evenly spaced (start/middle/end for 3 clips)"""
+    clip_duration = min(CLIP_DURATION, duration / num_clips)
+    if centers:
+        last_start = max(0.0, duration - clip_duration)
+        return [min(max(0.0, c - clip_duration / 2), last_start) for c in centers], clip_duration
+    if num_clips == 1:
+        return [0.0], clip_duration
+    last_start = max(0.0, duration - clip_duration)
+    return [float(t) for t in np.linspace(0, last_start, num_clips)], clip_duration
 
-async def extract_video_clips(file_path: str, num_clips: int = 3) -> List[str]:
-    """Extract clips from video at different timestamps"""
-    clips = []
-    duration = await get_video_duration(file_path)
+def downscale_filters(height: int, fps: float) -> List[str]:
+    """ffmpeg video filters capping the frame rate and height (never upscaling), 0 leaves either as is"""
+    filters = []
+    if fps:
+        filters.append(f"fps={fps:g}")
+    if height:
+        filters.append(f"scale=-2:'min({height},ih)'")
+    return filters
+
+def exceeds_clip_target(info: Dict[str, Any]) -> bool:
+    """Whether the source is taller or faster than Gemini clips should be, so copying its streams won't do"""
+    return bool(
+        (GEMINI_CLIP_HEIGHT and (info.get("height") or 0) > GEMINI_CLIP_HEIGHT)
+        or (GEMINI_CLIP_FPS and (info.get("fps") or 0) > GEMINI_CLIP_FPS)
+    )
+
+def build_clip_command(file_path: str, timestamps: List[float], clip_duration: float,
+                       output_paths: List[str], stream_copy: bool) -> List[str]:
+    """Build one ffmpeg invocation that cuts every clip using input-side seeking"""
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error"]
+    for start_time in timestamps:
+        # -ss/-t before -i seek in the demuxer instead of decoding up to the timestamp
+        cmd += ["-ss", f"{start_time:.3f}", "-t", f"{clip_duration:.3f}", "-i", file_path]
+    
+    for i, output_path in enumerate(output_paths):
+        cmd += ["-map", f"{i}:v:0", "-map", f"{i}:a:0?"]
+        if stream_copy:
+            # Keyframe-aligned cut, no decode/encode
+            cmd += ["-c", "copy", "-avoid_negative_ts", "make_zero"]
+        else:
+            filters = downscale_filters(GEMINI_CLIP_HEIGHT, GEMINI_CLIP_FPS)
+            if filters:
+                cmd += ["-vf", ",".join(filters)]
+            cmd += ["-c:v", "libx264", "-preset", "veryfast", "-crf", str(GEMINI_CLIP_CRF), "-c:a", "aac"]
+        cmd += ["-movflags", "+faststart", "-y", output_path]
+    return cmd
+
+@timed_stage("extract_video_clips")
+async def extract_video_clips(file_path: str, num_clips: int = 3,
+                              probe: Optional[Dict[str, Any]] = None,
+                              centers: Optional[List[float]] = None) -> List[bytes]:
+    """Extract clips from video at different timestamps as raw MP4 bytes"""
+    info = probe or await probe_video(file_path)
+    duration = info["duration"]
     
     if duration <= 0:
         raise ValueError("Invalid video duration")
     
     # Calculate timestamps for clips
-    clip_duration = min(2, duration / num_clips)  # 2 seconds per clip or less
-    timestamps = [
-        0,  # Start
-        duration / 2 - clip_duration / 2,  # Middle
-        max(0, duration - clip_duration)  # End
-    ]
+    timestamps, clip_duration = clip_timestamps(duration, num_clips, centers)
     
-    for i, start_time in enumerate(timestamps):
-        output_path = os.path.join(TEMP_DIR, f"clip_{i}_{datetime.now().timestamp()}.mp4")
-        
-        cmd = [
-            "ffmpeg", "-i", file_path,
-            "-ss", str(start_time),
-            "-t", str(clip_duration),
-            "-c:v", "libx264",
-            "-c:a", "aac",
-            "-strict", "experimental",
-            "-y", output_path
-        ]
+    # Stream copy only works when the source codec can be muxed into MP4 as-is and needs no downscaling
+    stream_copy = info["video_codec"] in STREAM_COPY_CODECS and not exceeds_clip_target(info)
+    expected_clip_bytes = os.path.getsize(file_path) * clip_duration / duration
+    max_copy_bytes = int(expected_clip_bytes * STREAM_COPY_MAX_OVERSHOOT) + 64 * 1024
+    
+    with tempfile.TemporaryDirectory(dir=scratch_dir(TEMP_DIR), prefix="clips_") as clip_dir:
+        output_paths = [os.path.join(clip_dir, f"clip_{i}.mp4") for i in range(len(timestamps))]
         
-        try:
-            subprocess.run(cmd, capture_output=True, check=True)
+        for copy_mode in ([True, False] if stream_copy else [False]):
+            cmd = build_clip_command(file_path, timestamps, clip_duration, output_paths, copy_mode)
+            try:
+                await run_media_tool(cmd, capture_stdout=False)
+            except MediaToolError as e:
+                logger.error(f"Error extracting clips (stream copy: {copy_mode}): {e}")
+                continue
             
-            # Convert to base64
-            with open(output_path, "rb") as f:
-                clip_base64 = base64.b64encode(f.read()).decode('utf-8')
-                clips.append(clip_base64)
+            sizes = [os.path.getsize(p) if os.path.exists(p) else 0 for p in output_paths]
+            if copy_mode and max(sizes) > max_copy_bytes:
+                # Keyframes are too sparse, the copied clips drag in long stretches before each cut
+                logger.info(f"Stream-copied clips too large ({max(sizes)} > {max_copy_bytes} bytes), re-encoding")
+                continue
             
-            # Clean up
-            os.unlink(output_path)
+            clips = []
+            for output_path, size in zip(output_paths, sizes):
+                if size > 0:
+                    with open(output_path, "rb") as f:
+                        clips.append(f.read())
             
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Error extracting clip {i}: {e}")
-            continue
+            if clips:
+                logger.info(f"Extracted {len(clips)} clips in one pass (stream copy: {copy_mode})")
+                record_upload("gemini", sum(len(clip) for clip in clips), int(expected_clip_bytes * len(clips)))
+                return clips
     
-    return clips
+    return []
 
-async def extract_video_frames(file_path: str, num_frames: int = 5) -> List[str]:
-    """Extract frames from video at even intervals"""
-    frames = []
-    cap = cv2.VideoCapture(file_path)
+def build_proxy_command(file_path: str, timestamps: List[float], clip_duration: float,
+                        output_path: str, with_audio: bool) -> List[str]:
+    """Build one ffmpeg invocation that joins every clip into a single downscaled, low-bitrate video"""
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error"]
+    for start_time in timestamps:
+        cmd += ["-ss", f"{start_time:.3f}", "-t", f"{clip_duration:.3f}", "-i", file_path]
     
-    try:
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        if total_frames <= 0:
-            raise ValueError("Invalid video frame count")
-        
-        # Calculate frame indices to extract
-        indices = np.linspace(0, total_frames - 1, num_frames, dtype=int)
+    video_filters = downscale_filters(GEMINI_PROXY_HEIGHT, GEMINI_PROXY_FPS) + ["setsar=1", "format=yuv420p"]
+    
+    graph, inputs = [], ""
+    for i in range(len(timestamps)):
+        graph.append(f"[{i}:v:0]{','.join(video_filters)}[v{i}]")
+        inputs += f"[v{i}]"
+        if with_audio:
+            graph.append(f"[{i}:a:0]aresample=16000,aformat=channel_layouts=mono[a{i}]")
+            inputs += f"[a{i}]"
+    graph.append(f"{inputs}concat=n={len(timestamps)}:v=1:a={int(with_audio)}[v]" + ("[a]" if with_audio else ""))
+    
+    cmd += ["-filter_complex", ";".join(graph), "-map", "[v]"]
+    if with_audio:
+        cmd += ["-map", "[a]", "-c:a", "aac", "-b:a", GEMINI_PROXY_AUDIO_BITRATE]
+    cmd += [
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", str(GEMINI_PROXY_CRF),
+        "-movflags", "+faststart", "-y", output_path
+    ]
+    return cmd
+
+@timed_stage("extract_gemini_proxy")
+async def extract_gemini_proxy(file_path: str, num_clips: int = 3,
+                               probe: Optional[Dict[str, Any]] = None,
+                               centers: Optional[List[float]] = None) -> Optional[tuple]:
+    """Join the sampled clips into one proxy video, returns its MP4 bytes and a description of its layout"""
+    info = probe or await probe_video(file_path)
+    duration = info["duration"]
+    
+    if duration <= 0:
+        raise ValueError("Invalid video duration")
+    
+    timestamps, clip_duration = clip_timestamps(duration, num_clips, centers)
+    
+    with tempfile.TemporaryDirectory(dir=scratch_dir(TEMP_DIR), prefix="proxy_") as proxy_dir:
+        output_path = os.path.join(proxy_dir, "proxy.mp4")
         
-        for idx in indices:
-            cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
-            ret, frame = cap.read()
+        # An unknown audio layout is tried with audio first, the concat fails if a clip has none
+        for with_audio in ([True, False] if info.get("has_audio") is not False else [False]):
+            cmd = build_proxy_command(file_path, timestamps, clip_duration, output_path, with_audio)
+            try:
+                await run_media_tool(cmd, capture_stdout=False)
+            except MediaToolError as e:
+                logger.error(f"Error building Gemini proxy (audio: {with_audio}): {e}")
+                continue
             
-            if ret:
-                # Convert frame to base64
-                _, buffer = cv2.imencode('.jpg', frame)
-                frame_base64 = base64.b64encode(buffer).decode('utf-8')
-                frames.append(frame_base64)
-            else:
-                logger.warning(f"Failed to extract frame at index {idx}")
-    
-    finally:
-        cap.release()
+            with open(output_path, "rb") as f:
+                proxy = f.read()
+            if proxy:
+                logger.info(f"Built {len(proxy)} byte Gemini proxy from {len(timestamps)} clips")
+                source_bytes = os.path.getsize(file_path) * clip_duration * len(timestamps) / duration
+                record_upload("gemini", len(proxy), int(source_bytes))
+                layout = ", joined back to back into one video: " + "; ".join(
+                    f"clip {i} is {i * clip_duration:.1f}-{(i + 1) * clip_duration:.1f}s of it"
+                    f" ({start:.1f}-{start + clip_duration:.1f}s of the original)"
+                    for i, start in enumerate(timestamps)
+                )
+                return proxy, len(timestamps), layout
     
+    return None
+
+@timed_stage("extract_video_frames")
+async def extract_video_frames(file_path: str, num_frames: int = 5,
+                               timestamps: Optional[List[float]] = None) -> List[EncodedFrame]:
+    """Extract frames from video at the given timestamps or at even intervals, sized for Joy Caption"""
+    # Decoding runs in a thread so other pipeline stages keep making progress
+    loop = asyncio.get_event_loop()
+    frames = await loop.run_in_executor(
+        None, read_video_frames, file_path, num_frames, timestamps, frame_encode_executor, replicate_frame_encoding
+    )
+    record_upload("replicate", sum(len(frame.data) for frame in frames), sum(frame.source_bytes for frame in frames))
     return frames
 
 def extract_json_from_markdown(text: str) -> str:
@@ -229,7 +695,64 @@ def extract_json_from_markdown(text: str) -> str:
     # Return original text if no code blocks found
     return text.strip()
 
-async def analyze_with_gemini(video_clips: List[str]) -> Optional[AnalysisResult]:
+# Progress events for the streaming endpoint; only set inside a /analyze/stream request
+analysis_events: ContextVar[Optional[asyncio.Queue]] = ContextVar("analysis_events", default=None)
+
+def emit_event(event: str, data: Dict[str, Any]):
+    """Publish a progress event to the current request's stream, if it has one"""
+    queue = analysis_events.get()
+    if queue is not None:
+        queue.put_nowait((event, data))
+
+@timed_stage("gemini_clip")
+async def analyze_clip_with_gemini(model, clip: bytes, index: int) -> Optional[GeminiResponse]:
+    """Analyze a single clip with Gemini, bounded by the global Gemini concurrency limit"""
+    set_attribute("clip.index", index)
+    set_attribute("clip.bytes", len(clip))
+    try:
+        # Create content parts
+        content = [
+            GEMINI_PROMPT,
+            {
+                "mime_type": "video/mp4",
+                "data": clip
+            }
+        ]
+        
+        # Generate content without blocking the event loop
+        async with gemini_guard.slot(), gemini_semaphore:
+            response = await model.generate_content_async(content)
+        
+        if not (response and response.text):
+            return None
+        
+        # Extract JSON from markdown if needed
+        json_text = extract_json_from_markdown(response.text)
+        logger.info(f"Extracted JSON for clip {index}: {json_text[:200]}...")
+        
+        # Parse JSON response
+        try:
+            # Log the raw JSON before parsing
+            logger.info(f"Raw JSON response for clip {index}: {json_text}")
+            
+            result = GeminiResponse.model_validate_json(json_text)
+            
+            # Log the parsed result
+            logger.info(f"Parsed result for clip {index}: status={result.status}, categories={result.categories}, severity={result.severity}")
+            logger.info(f"Successfully parsed clip {index} result")
+            emit_event("clip", {"index": index, **result.model_dump()})
+            return result
+        except Exception as e:
+            logger.error(f"Failed to parse Gemini response for clip {index}: {e}")
+            logger.error(f"Raw response: {response.text}")
+            return None
+    
+    except Exception as e:
+        logger.error(f"Error processing clip {index}: {e}")
+        return None
+
+@timed_stage("gemini")
+async def analyze_with_gemini(video_clips: List[bytes]) -> Optional[AnalysisResult]:
     """Analyze video clips using Google Gemini API"""
     if not GEMINI_API_KEY:
         logger.error("Gemini API key not configured")
@@ -239,85 +762,27 @@ async def analyze_with_gemini(video_clips: List[str]) -> Optional[AnalysisResult
     
     try:
         # Get the model
-        model = genai.GenerativeModel('gemini-2.5-pro-preview-05-06')
+        model = genai.GenerativeModel(GEMINI_MODEL)
         
-        # Prepare the prompt
-        prompt = """You are a strict content-safety engine. Analyze the video content and determine if it's safe or NSFW.
-
-IMPORTANT: If you detect ANY profanity, swearing, strong language, or curse words (including implied, censored, or abbreviated forms), you MUST categorize it as "profanity".
-
-Return your analysis in this exact JSON format (no markdown, just pure JSON):
-{
-    "status": "safe" or "nsfw",
-    "categories": ["pornography", "violence", "self-harm", "weapons", "profanity", "other"],
-    "severity": 0-5,
-    "description": "brief 1-2 sentence description"
-}
-
-Severity scale:
-0 = safe content
-1 = suggestive
-2 = mature
-3 = explicit
-4 = extreme
-5 = illegal
-
-Categories (choose ALL that apply):
-- pornography (sexual/nudity)
-- violence (harm/gore)
-- self-harm (suicide/injury)
-- weapons (guns/knives/explosives)
-- profanity (ANY strong language, swearing, curse words, f-words, s-words, etc.)
-- other (hate speech/drugs/disturbing content that doesn't fit above)
-
-CRITICAL: If you mention profanity, swearing, strong language, or curse words in your description, you MUST include "profanity" in the categories array.
-
-Multiple categories allowed if applicable."""
-        
-        # Process each clip
+        # Process all clips concurrently, stopping early once the verdict is settled
+        pending = {
+            asyncio.create_task(analyze_clip_with_gemini(model, clip, i))
+            for i, clip in enumerate(video_clips)
+        }
         results = []
-        for i, clip in enumerate(video_clips):
-            try:
-                # Convert base64 to bytes
-                video_bytes = base64.b64decode(clip)
-                
-                # Create content parts
-                content = [
-                    prompt,
-                    {
-                        "mime_type": "video/mp4",
-                        "data": video_bytes
-                    }
-                ]
-                
-                # Generate content
-                response = model.generate_content(content)
-                
-                if response and response.text:
-                    # Extract JSON from markdown if needed
-                    json_text = extract_json_from_markdown(response.text)
-                    logger.info(f"Extracted JSON for clip {i}: {json_text[:200]}...")
-                    
-                    # Parse JSON response
-                    try:
-                        # Log the raw JSON before parsing
-                        logger.info(f"Raw JSON response for clip {i}: {json_text}")
-                        
-                        result = GeminiResponse.model_validate_json(json_text)
-                        
-                        # Log the parsed result
-                        logger.info(f"Parsed result for clip {i}: status={result.status}, categories={result.categories}, severity={result.severity}")
-                        
-                        results.append(result)
-                        logger.info(f"Successfully parsed clip {i} result")
-                    except Exception as e:
-                        logger.error(f"Failed to parse Gemini response for clip {i}: {e}")
-                        logger.error(f"Raw response: {response.text}")
-                        continue
-                
-            except Exception as e:
-                logger.error(f"Error processing clip {i}: {e}")
-                continue
+        try:
+            while pending and not early_exit_policy.decided(results):
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                results.extend(task.result() for task in done if task.result() is not None)
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        
+        early = bool(pending)
+        early_exit_policy.record(early, len(pending))
+        if early:
+            logger.info(f"Verdict settled after {len(results)} of {len(video_clips)} clips ({early_exit_policy.mode}), cancelled the rest")
         
         if not results:
             logger.error("No valid results from Gemini analysis")
@@ -341,46 +806,165 @@ Multiple categories allowed if applicable."""
         logger.error(f"Gemini analysis failed: {e}")
         return None
 
-async def analyze_with_joy_caption(frame_base64: str) -> Optional[str]:
-    """Analyze a single frame using Joy Caption on Replicate"""
+@timed_stage("gemini_combined")
+async def analyze_combined_with_gemini(videos: List[bytes], count: int, layout: str = "") -> Optional[AnalysisResult]:
+    """Analyze every clip in a single Gemini request, one verdict per clip in the response
+
+    videos is either the clips themselves or one proxy video joining count
+    clips, described by layout. A reply with a single overall verdict is
+    accepted as the verdict for the whole video.
+    """
+    if not GEMINI_API_KEY:
+        logger.error("Gemini API key not configured")
+        return None
+    
+    set_attribute("clip.count", count)
+    set_attribute("clip.bytes", sum(len(video) for video in videos))
+    logger.info(f"Starting combined Gemini analysis of {count} clips")
+    
+    try:
+        model = genai.GenerativeModel(GEMINI_MODEL)
+        content = [GEMINI_PROMPT + GEMINI_COMBINED_PROMPT.format(count=count, layout=layout)]
+        content += [{"mime_type": "video/mp4", "data": video} for video in videos]
+        
+        async with gemini_guard.slot(), gemini_semaphore:
+            response = await model.generate_content_async(content)
+        
+        if not (response and response.text):
+            return None
+        
+        json_text = extract_json_from_markdown(response.text)
+        logger.info(f"Raw combined JSON response: {json_text}")
+        try:
+            segments = GeminiCombinedResponse.model_validate_json(json_text).segments
+        except ValidationError:
+            try:
+                # The model answered with one overall verdict, still valid for the whole video
+                segments = [GeminiSegmentResponse(index=0, **GeminiResponse.model_validate_json(json_text).model_dump())]
+            except ValidationError as e:
+                logger.error(f"Failed to parse combined Gemini response: {e}")
+                logger.error(f"Raw response: {response.text}")
+                return None
+        
+        segments = [segment for segment in segments if segment.index < count]
+        if not segments:
+            logger.error(f"Combined Gemini response has no verdicts for clips 0-{count - 1}")
+            return None
+        for segment in segments:
+            emit_event("clip", segment.model_dump())
+        
+        # Combine results (take the most severe result)
+        final_result = max(segments, key=lambda x: x.severity)
+        logger.info(f"Combined Gemini verdicts for {len(segments)} of {count} clips, worst severity {final_result.severity}")
+        return AnalysisResult(
+            method="gemini",
+            status=final_result.status,
+            categories=final_result.categories,
+            severity=final_result.severity,
+            description=final_result.description
+        )
+    
+    except Exception as e:
+        logger.error(f"Combined Gemini analysis failed: {e}")
+        return None
+
+def normalize_replicate_output(output: Any) -> Optional[str]:
+    """Joy Caption output arrives either as a string or as a list of streamed text chunks"""
+    if output is None:
+        return None
+    if isinstance(output, list):
+        return "".join(str(part) for part in output)
+    return str(output)
+
+@timed_stage("joy_caption")
+async def analyze_with_joy_caption(image: str) -> Optional[str]:
+    """Analyze a single frame (as a data URL) using Joy Caption on Replicate"""
     if not REPLICATE_API_KEY:
         logger.error("Replicate API key not configured")
         return None
     
-    logger.info(f"Joy Caption: API key present: {bool(REPLICATE_API_KEY)}, replicate.api_token set: {bool(replicate.api_token)}")
+    try:
+        async with replicate_guard.slot() as slot:
+            caption = await run_joy_caption_prediction(image)
+            if caption is None:
+                slot.fail()
+        return caption
+    except ProviderUnavailable:
+        logger.warning("Replicate circuit is open, skipping Joy Caption")
+        return None
+
+async def run_joy_caption_prediction(image: str) -> Optional[str]:
+    """Create a Joy Caption prediction and poll it to completion"""
+    headers = {
+        "Authorization": f"Bearer {REPLICATE_API_KEY}",
+        "Content-Type": "application/json",
+        # Let Replicate hold the request open until the prediction finishes (up to 60s)
+        "Prefer": f"wait={REPLICATE_WAIT_SECONDS}"
+    }
     
+    prediction = None
     try:
         # Run Joy Caption model
-        input_data = {
-            "image": f"data:image/jpeg;base64,{frame_base64}"
+        payload = {
+            "version": JOY_CAPTION_VERSION,
+            "input": {
+                "image": image
+            }
         }
         
         logger.info(f"Calling replicate with model: pipi32167/joy-caption")
-        logger.info(f"Input data keys: {list(input_data.keys())}")
+        response = await http_client.request_json(
+            "POST", f"{REPLICATE_API_BASE}/predictions", headers=headers, json=payload
+        )
+        if not response.ok or not response.data:
+            logger.error(f"Replicate API error: {response.status}")
+            return None
+        prediction = response.data
         
-        # Run the model in thread pool to avoid blocking the async event loop
-        import asyncio
+        # Poll without tying up a thread until the prediction reaches a terminal state
         loop = asyncio.get_event_loop()
+        deadline = loop.time() + REPLICATE_PREDICTION_TIMEOUT
+        while prediction.get("status") not in ("succeeded", "failed", "canceled"):
+            if loop.time() > deadline:
+                logger.error(f"Joy Caption prediction {prediction.get('id')} timed out")
+                await cancel_replicate_prediction(prediction)
+                return None
+            await asyncio.sleep(REPLICATE_POLL_INTERVAL)
+            poll_url = prediction.get("urls", {}).get("get") or f"{REPLICATE_API_BASE}/predictions/{prediction['id']}"
+            response = await http_client.request_json("GET", poll_url, headers={"Authorization": headers["Authorization"]})
+            if response.ok and response.data:
+                prediction = response.data
         
-        def run_replicate():
-            # Ensure token is set in this thread
-            if not replicate.api_token and os.getenv("REPLICATE_API_TOKEN"):
-                replicate.api_token = os.getenv("REPLICATE_API_TOKEN")
-            
-            return replicate.run(
-                "pipi32167/joy-caption:86674ddd559dbdde6ed40e0bdfc0720c84d82971e288149fcf2c35c538272617",
-                input=input_data
-            )
-        
-        output = await loop.run_in_executor(None, run_replicate)
+        if prediction["status"] != "succeeded":
+            logger.error(f"Joy Caption prediction {prediction['status']}: {prediction.get('error')}")
+            return None
         
-        logger.info(f"Joy Caption output type: {type(output)}, length: {len(str(output)) if output else 0}")
+        output = normalize_replicate_output(prediction.get("output"))
+        logger.info(f"Joy Caption output length: {len(output) if output else 0}")
         return output
         
+    except asyncio.CancelledError:
+        # Don't leave a paid prediction running for a request nobody is waiting on
+        if prediction:
+            asyncio.create_task(cancel_replicate_prediction(prediction))
+        raise
     except Exception as e:
         logger.error(f"Joy Caption analysis failed: {e}")
         return None
 
+async def cancel_replicate_prediction(prediction: Dict[str, Any]):
+    """Best-effort cancel of an unfinished Replicate prediction"""
+    if prediction.get("status") in ("succeeded", "failed", "canceled"):
+        return
+    cancel_url = prediction.get("urls", {}).get("cancel") or f"{REPLICATE_API_BASE}/predictions/{prediction.get('id')}/cancel"
+    try:
+        await http_client.request_json(
+            "POST", cancel_url, headers={"Authorization": f"Bearer {REPLICATE_API_KEY}"}, retries=0
+        )
+    except Exception as e:
+        logger.warning(f"Failed to cancel Replicate prediction {prediction.get('id')}: {e}")
+
+@timed_stage("grok")
 async def analyze_with_grok(analysis_texts: List[str]) -> Optional[AnalysisResult]:
     """Analyze combined visual and audio content using Grok API"""
     if not GROK_API_KEY:
@@ -398,7 +982,7 @@ async def analyze_with_grok(analysis_texts: List[str]) -> Optional[AnalysisResul
     combined_text = "\n\n".join(analysis_texts)
     
     payload = {
-        "model": "grok-3-mini",
+        "model": GROK_MODEL,
         "messages": [
             {
                 "role": "system",
@@ -420,70 +1004,64 @@ async def analyze_with_grok(analysis_texts: List[str]) -> Optional[AnalysisResul
     }
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "https://api.x.ai/v1/chat/completions",
-                headers=headers,
-                json=payload
-            ) as response:
-                if response.status != 200:
-                    logger.error(f"Grok API error: {response.status}")
-                    return None
-                
-                data = await response.json()
-                content = data['choices'][0]['message']['content']
-                
-                # Parse JSON response
-                try:
-                    result = GeminiResponse.model_validate_json(content)
-                    return AnalysisResult(
-                        method="joycaption-whisper-grok",
-                        status=result.status,
-                        categories=result.categories,
-                        severity=result.severity,
-                        description=result.description
-                    )
-                except Exception as e:
-                    logger.error(f"Failed to parse Grok response: {e}")
-                    return None
+        async with grok_guard.slot() as slot:
+            response = await http_client.request_json(
+                "POST", f"{GROK_API_BASE}/chat/completions", headers=headers, json=payload
+            )
+            if not response.ok:
+                slot.fail()
+        if response.status != 200:
+            logger.error(f"Grok API error: {response.status}")
+            return None
+        
+        content = response.data['choices'][0]['message']['content']
+        
+        # Parse JSON response
+        try:
+            result = GeminiResponse.model_validate_json(content)
+            return AnalysisResult(
+                method="joycaption-whisper-grok",
+                status=result.status,
+                categories=result.categories,
+                severity=result.severity,
+                description=result.description
+            )
+        except Exception as e:
+            logger.error(f"Failed to parse Grok response: {e}")
+            return None
     
     except Exception as e:
         logger.error(f"Grok analysis failed: {e}")
         return None
 
+@timed_stage("transcribe_audio")
 async def transcribe_audio(video_path: str) -> Optional[str]:
     """Extract and transcribe audio from video using Whisper"""
     try:
-        # Extract audio to temporary file
-        temp_audio = os.path.join(TEMP_DIR, f"audio_{datetime.now().timestamp()}.wav")
-        
+        # Decode audio straight to raw PCM on stdout, no intermediate WAV file
         cmd = [
-            "ffmpeg", "-i", video_path,
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-i", video_path,
             "-vn",  # No video
             "-acodec", "pcm_s16le",  # PCM 16-bit
-            "-ar", "16000",  # 16kHz sample rate
+            "-ar", str(SAMPLE_RATE),  # 16kHz sample rate
             "-ac", "1",  # Mono
-            "-y", temp_audio
+            "-f", "s16le", "-"
         ]
         
         try:
-            subprocess.run(cmd, capture_output=True, check=True)
-        except subprocess.CalledProcessError as e:
+            result = await run_media_tool(cmd)
+        except MediaToolError as e:
             logger.error(f"Error extracting audio: {e}")
             return None
         
-        # Run Whisper in thread pool
-        loop = asyncio.get_event_loop()
-        
-        def run_whisper():
-            model = get_whisper_model()
-            result = model.transcribe(temp_audio)
-            return result["text"]
-        
-        transcript = await loop.run_in_executor(None, run_whisper)
+        if not result.stdout:
+            return None
+        audio = np.frombuffer(result.stdout, dtype=np.int16).astype(np.float32) / 32768.0
         
-        # Clean up
-        os.unlink(temp_audio)
+        # Run Whisper on the shared inference pool
+        with track_stage("whisper"):
+            set_attribute("audio.seconds", round(len(audio) / SAMPLE_RATE, 3))
+            transcript = await whisper_pool.transcribe(audio)
         
         return transcript.strip() if transcript else None
         
@@ -491,99 +1069,536 @@ async def transcribe_audio(video_path: str) -> Optional[str]:
         logger.error(f"Whisper transcription failed: {e}")
         return None
 
-# API Endpoints
-@app.post("/analyze", response_model=AnalysisResult)
-async def analyze_video(file: UploadFile = File(...)):
-    """Main endpoint to analyze uploaded video"""
-    temp_file_path = None
+class UploadInfo:
+    """An upload streamed to disk, with its content hash and early probe result"""
+
+    def __init__(self, path: str, size: int, sha256: str, probe: Dict[str, Any]):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.probe = probe
+
+@timed_stage("upload_write")
+async def ingest_upload(file: UploadFile, dest_path: str) -> UploadInfo:
+    """Stream an upload to disk in fixed-size chunks, hashing as it goes
+
+    Enforces MAX_UPLOAD_SIZE and starts the ffprobe duration check as soon as
+    the first PROBE_HEADER_BYTES are on disk, overlapping it with the copy.
+    Starlette has already spooled the multipart body by the time this runs,
+    so the copy is from its temp file rather than the network;
+    UploadSizeLimitMiddleware is what stops oversized bodies early.
+    """
+    if file.size is not None and file.size > MAX_UPLOAD_SIZE:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds maximum size of {MAX_UPLOAD_SIZE} bytes")
+    
+    digest = hashlib.sha256()
+    size = 0
+    probe_task = None
     
     try:
-        # Log request
-        logger.info(f"Received video for analysis: {file.filename}, size: {file.size}")
+        with open(dest_path, "wb") as f:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                
+                size += len(chunk)
+                if size > MAX_UPLOAD_SIZE:
+                    raise HTTPException(status_code=413, detail=f"Upload exceeds maximum size of {MAX_UPLOAD_SIZE} bytes")
+                
+                digest.update(chunk)
+                f.write(chunk)
+                
+                if probe_task is None and size >= PROBE_HEADER_BYTES:
+                    # Container header is on disk, probe it while the rest is copied
+                    f.flush()
+                    probe_task = asyncio.create_task(probe_video(dest_path))
         
-        # Save uploaded file
-        temp_file_path = os.path.join(TEMP_DIR, f"{datetime.now().timestamp()}_{file.filename}")
-        with open(temp_file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        probe = await probe_task if probe_task else None
+        set_attribute("upload.bytes", size)
+    except BaseException:
+        if probe_task and not probe_task.done():
+            probe_task.cancel()
+        raise
+    
+    # Only trust a partial-file probe for containers that store duration in the header
+    formats = set(probe["format_name"].split(",")) if probe else set()
+    if not probe or probe["duration"] <= 0 or not formats & HEADER_DURATION_FORMATS:
+        probe = await probe_video(dest_path)
+    
+    return UploadInfo(dest_path, size, digest.hexdigest(), probe)
+
+async def run_stage(name: str, coro, timeout: float):
+    """Await one pipeline stage with a timeout, returning None instead of raising"""
+    try:
+        return await asyncio.wait_for(coro, timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.error(f"Stage {name} timed out after {timeout}s")
+    except Exception as e:
+        logger.error(f"Stage {name} failed: {e}")
+    return None
+
+@timed_stage("fallback_pipeline")
+async def run_fallback_pipeline(video_path: str, scene_plan: Optional[ScenePlan] = None,
+                                num_frames: int = NUM_FALLBACK_FRAMES) -> AnalysisResult:
+    """Joy Caption + Whisper + Grok analysis with the independent stages run concurrently
+
+    Audio extraction/Whisper runs alongside frame extraction and all Joy Caption
+    calls; only Grok waits for both. A stage that fails or times out is dropped
+    and the analysis continues with whatever the other stages produced.
+    """
+    logger.info("Falling back to Joy Caption + Whisper + Grok analysis")
+    
+    # Grok is required and captions almost always are, so don't start work that can't finish
+    unavailable = [guard.name for guard in (replicate_guard, grok_guard) if not guard.available()]
+    if unavailable:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Analysis providers temporarily unavailable ({', '.join(unavailable)} circuit open)"
+        )
+    
+    async def transcribe() -> Optional[str]:
+        transcript = await run_stage("transcribe_audio", transcribe_audio(video_path), FALLBACK_TRANSCRIBE_TIMEOUT)
+        emit_event("transcript", {"text": transcript})
+        return transcript
+    
+    async def caption(index: int, frame: EncodedFrame) -> Optional[str]:
+        text = await run_stage(f"joy_caption[{index}]", analyze_with_joy_caption(frame.data_url), FALLBACK_CAPTION_TIMEOUT)
+        if text:
+            emit_event("caption", {"index": index, "caption": text})
+        return text
+    
+    # Get audio analysis from Whisper in the background
+    transcript_task = asyncio.create_task(transcribe())
+    
+    try:
+        # Get visual analysis from frames
+        frames = await run_stage(
+            "extract_video_frames",
+            extract_video_frames(
+                video_path,
+                num_frames=num_frames,
+                timestamps=scene_plan.top(num_frames) if scene_plan else None
+            ),
+            FALLBACK_FRAME_TIMEOUT
+        )
+        if not frames:
+            raise HTTPException(status_code=500, detail="Failed to extract frames from video")
         
-        # Check video duration and trim if necessary
-        duration = await get_video_duration(temp_file_path)
+        # Analyze all frames with Joy Caption at once
+        logger.info(f"Analyzing {len(frames)} frames with Joy Caption")
+        frame_captions = await asyncio.gather(*[caption(i, frame) for i, frame in enumerate(frames)])
+        captions = [caption for caption in frame_captions if caption]
+        
+        if not captions:
+            raise HTTPException(status_code=500, detail="Failed to generate captions for frames")
+        
+        transcript = await transcript_task
+    finally:
+        if not transcript_task.done():
+            transcript_task.cancel()
+    
+    # Combine visual and audio analysis for Grok
+    analysis_text = "\n\n".join([
+        "Visual Analysis:",
+        *[f"Frame {i+1}: {caption}" for i, caption in enumerate(captions)],
+        "\nAudio Analysis:",
+        transcript if transcript else "No audio transcript available"
+    ])
+    
+    # Analyze combined content with Grok
+    result = await run_stage("grok", analyze_with_grok([analysis_text]), FALLBACK_GROK_TIMEOUT)
+    if result:
+        logger.info(f"Grok analysis successful: {result.status}")
+        return result
+    
+    # If all methods fail, return error
+    raise HTTPException(
+        status_code=500,
+        detail="All analysis methods failed. Please try again later."
+    )
+
+def analysis_config() -> Dict[str, Any]:
+    """Analysis settings that affect the verdict and therefore the cache key"""
+    return {
+        "gemini_model": GEMINI_MODEL,
+        "grok_model": GROK_MODEL,
+        "num_clips": NUM_CLIPS,
+        "num_fallback_frames": NUM_FALLBACK_FRAMES,
+        "prompt_version": PROMPT_VERSION,
+        "max_duration": MAX_VIDEO_DURATION,
+        "preprocess": [
+            GEMINI_CLIP_HEIGHT, GEMINI_CLIP_FPS, GEMINI_CLIP_CRF,
+            REPLICATE_FRAME_HEIGHT, REPLICATE_FRAME_FORMAT, REPLICATE_FRAME_QUALITY
+        ],
+        "gemini_request": [GEMINI_REQUEST_MODE, GEMINI_PROXY_HEIGHT, GEMINI_PROXY_FPS, GEMINI_PROXY_CRF],
+        "long_video": [LONG_VIDEO_MODE, LONG_VIDEO_SEGMENT_SECONDS, LONG_VIDEO_MAX_MODEL_CALLS],
+        "scene_sampling": [SCENE_SAMPLING, SCENE_ANALYSIS_FPS, SCENE_CUT_THRESHOLD, SCENE_DUPLICATE_THRESHOLD, SCENE_MIN_SAMPLES],
+        "early_exit": [EARLY_EXIT_MODE, EARLY_EXIT_BLOCK_SEVERITY, EARLY_EXIT_QUORUM],
+        "prescreen": [
+            PRESCREEN_ENABLED, PRESCREEN_FPS, PRESCREEN_BLANK_STD, PRESCREEN_MIN_ENTROPY, PRESCREEN_MAX_SKIN_RATIO,
+            PRESCREEN_REQUIRE_SILENT, PRESCREEN_ONNX_MODEL, PRESCREEN_ONNX_NSFW_CLASSES,
+            PRESCREEN_SAFE_THRESHOLD, PRESCREEN_NSFW_THRESHOLD
+        ],
+    }
+
+fingerprint_index = FingerprintIndex(
+    max_distance=FINGERPRINT_MAX_DISTANCE,
+    match_threshold=FINGERPRINT_MATCH_THRESHOLD,
+    min_matches=FINGERPRINT_MIN_MATCHES,
+    db_path=FINGERPRINT_DB_PATH or None,
+    namespace=make_cache_key("fingerprint", analysis_config())
+) if FINGERPRINT_ENABLED else None
+
+async def analyze_video_file(video_path: str, filename: Optional[str], probe: Dict[str, Any],
+                             num_clips: int = NUM_CLIPS, num_frames: int = NUM_FALLBACK_FRAMES,
+                             thumbnails: Optional[Thumbnails] = None) -> AnalysisResult:
+    """Pre-screen -> Gemini -> Joy Caption/Whisper/Grok analysis of one video (or segment) of at most MAX_VIDEO_DURATION"""
+    # Settle trivially safe (or clearly explicit) videos locally before any paid model call
+    if prescreener:
+        with track_stage("prescreen"):
+            verdict = await prescreener.screen(
+                video_path, probe.get("has_audio"), thumbnails.at_fps(PRESCREEN_FPS).frames if thumbnails else None
+            )
+        if verdict:
+            logger.info(f"Pre-screen settled {filename} locally: {verdict['status']}")
+            return AnalysisResult(method="local", **verdict)
+    
+    # Pick the most distinct shots once, shared by the Gemini and fallback paths
+    scene_plan = None
+    if SCENE_SAMPLING:
+        with track_stage("scene_plan"):
+            scene_plan = await plan_scene_samples(
+                video_path,
+                budget=max(num_clips, num_frames),
+                fps=SCENE_ANALYSIS_FPS,
+                cut_threshold=SCENE_CUT_THRESHOLD,
+                duplicate_threshold=SCENE_DUPLICATE_THRESHOLD,
+                min_picks=SCENE_MIN_SAMPLES,
+                thumbnails=thumbnails
+            )
+    
+    async def gemini_path() -> Optional[AnalysisResult]:
+        # Step 1: Try Gemini analysis, unless its circuit is open
+        if not gemini_guard.available():
+            logger.warning("Gemini circuit is open, going straight to the fallback pipeline")
+            return None
+        centers = scene_plan.top(num_clips) if scene_plan else None
+        result = None
+        if GEMINI_REQUEST_MODE == "proxy":
+            proxy = await extract_gemini_proxy(video_path, num_clips=num_clips, probe=probe, centers=centers)
+            if proxy:
+                data, count, layout = proxy
+                result = await analyze_combined_with_gemini([data], count, layout)
+        else:
+            video_clips = await extract_video_clips(video_path, num_clips=num_clips, probe=probe, centers=centers)
+            if video_clips and GEMINI_REQUEST_MODE == "combined":
+                result = await analyze_combined_with_gemini(video_clips, len(video_clips))
+            elif video_clips:
+                result = await analyze_with_gemini(video_clips)
+        if result:
+            logger.info(f"Gemini analysis successful: {result.status}")
+        return result
+    
+    # Step 2: Fallback to Joy Caption + Whisper + Grok, started early if Gemini is slow
+    result = await hedged_race(
+        gemini_path, lambda: run_fallback_pipeline(video_path, scene_plan, num_frames=num_frames), hedge_policy
+    )
+    if result:
+        return result
+    
+    raise HTTPException(
+        status_code=500,
+        detail="All analysis methods failed. Please try again later."
+    )
+
+def merge_segment_results(results: List[tuple], failed: int, total: int, duration: float) -> AnalysisResult:
+    """One verdict for a segmented video: the most severe segment, with every flagged time range"""
+    flagged = sorted(((segment, result) for segment, result in results if result.status == "nsfw"),
+                     key=lambda item: item[0].start)
+    if not flagged:
+        if failed:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Analysis failed for {failed} of {total} video segments. Please try again later."
+            )
+        methods = [result.method for _, result in results]
+        return AnalysisResult(
+            method=max(set(methods), key=methods.count),
+            status="safe",
+            categories=[],
+            severity=0,
+            description=f"No unsafe content found in any of the {total} segments covering {format_timestamp(duration)}."
+        )
+    
+    _, worst = max(flagged, key=lambda item: item[1].severity)
+    categories = list(dict.fromkeys(category for _, result in flagged for category in result.categories))
+    ranges = ", ".join(f"{format_timestamp(segment.start)}-{format_timestamp(segment.end)}" for segment, _ in flagged)
+    return AnalysisResult(
+        method=worst.method,
+        status="nsfw",
+        categories=categories,
+        severity=worst.severity,
+        description=f"Flagged at {ranges}. {worst.description}",
+        flagged_segments=[
+            SegmentVerdict(start=round(segment.start, 3), end=round(segment.end, 3), categories=result.categories,
+                           severity=result.severity, description=result.description)
+            for segment, result in flagged
+        ]
+    )
+
+async def analyze_long_video(video_path: str, filename: Optional[str], probe: Dict[str, Any],
+                             thumbnails: Optional[Thumbnails] = None) -> AnalysisResult:
+    """Split a long video into segments, analyze them in parallel and merge the verdicts
+
+    The per-video LONG_VIDEO_MAX_MODEL_CALLS budget sets how many clips (and
+    fallback frames) each segment gets. Segments run LONG_VIDEO_CONCURRENCY
+    at a time and stop early, like clips, once the verdict is settled.
+    """
+    duration = probe["duration"]
+    segment_seconds, num_clips, num_frames = plan_segments(
+        duration, LONG_VIDEO_SEGMENT_SECONDS, LONG_VIDEO_MAX_MODEL_CALLS, NUM_CLIPS, NUM_FALLBACK_FRAMES
+    )
+    segment_dir = tempfile.mkdtemp(dir=scratch_dir(TEMP_DIR), prefix="segments_")
+    try:
+        with track_stage("segment_split"):
+            segments = await split_video(video_path, segment_dir, segment_seconds)
+        if not segments:
+            raise HTTPException(status_code=500, detail="Failed to split video into segments for analysis")
+        logger.info(f"Analyzing {duration:.0f}s video as {len(segments)} segments of ~{segment_seconds}s "
+                    f"({num_clips} clips each)")
+        
+        semaphore = asyncio.Semaphore(LONG_VIDEO_CONCURRENCY)
+        
+        async def run(segment: Segment) -> tuple:
+            async with semaphore:
+                result = await analyze_video_file(
+                    segment.path, filename, {**probe, "duration": segment.duration}, num_clips, num_frames,
+                    thumbnails.between(segment.start, segment.end) if thumbnails else None
+                )
+            emit_event("segment", {"start": segment.start, "end": segment.end, **result.model_dump()})
+            return segment, result
+        
+        pending = {asyncio.create_task(run(segment)) for segment in segments}
+        results = []
+        failed = 0
+        try:
+            while pending and not early_exit_policy.decided([result for _, result in results]):
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        results.append(task.result())
+                    except Exception as e:
+                        failed += 1
+                        logger.error(f"Segment analysis failed: {getattr(e, 'detail', e)}")
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        
+        if pending:
+            logger.info(f"Verdict settled after {len(results)} of {len(segments)} segments, cancelled the rest")
+        return merge_segment_results(results, failed, len(segments), duration)
+    finally:
+        shutil.rmtree(segment_dir, ignore_errors=True)
+
+@timed_stage("analysis_pipeline")
+async def run_analysis_pipeline(video_path: str, filename: Optional[str] = None,
+                                probe: Optional[Dict[str, Any]] = None,
+                                thumbnails: Optional[Thumbnails] = None) -> AnalysisResult:
+    """Run the full trim/segment -> Gemini -> Joy Caption/Whisper/Grok pipeline on a saved video"""
+    trimmed_file_path = None
+    
+    try:
+        if probe is None:
+            probe = await probe_video(video_path)
+        duration = probe["duration"]
         logger.info(f"Original video duration: {duration}s")
         
+        if duration > MAX_VIDEO_DURATION and LONG_VIDEO_MODE == LONG_VIDEO_SEGMENT:
+            return await analyze_long_video(video_path, filename, probe, thumbnails)
+        
         if duration > MAX_VIDEO_DURATION:
             logger.info(f"Video is {duration}s, trimming to first {MAX_VIDEO_DURATION}s for analysis")
-            # Create trimmed version
-            trimmed_file_path = os.path.join(TEMP_DIR, f"trimmed_{datetime.now().timestamp()}_{file.filename}")
+            # Create trimmed version in the same container as the source, so the streams can be copied
+            suffix = os.path.splitext(video_path)[1] or ".mp4"
+            trimmed_file_path = os.path.join(scratch_dir(TEMP_DIR), f"trimmed_{uuid.uuid4().hex}{suffix}")
             
             cmd = [
-                "ffmpeg", "-i", temp_file_path,
+                "ffmpeg", "-hide_banner", "-loglevel", "error", "-i", video_path,
                 "-t", str(MAX_VIDEO_DURATION),  # Trim to first 60 seconds
                 "-c", "copy",  # Copy streams without re-encoding for speed
                 "-y", trimmed_file_path
             ]
             
             try:
-                subprocess.run(cmd, capture_output=True, check=True)
-                # Replace original with trimmed version
-                os.unlink(temp_file_path)
-                temp_file_path = trimmed_file_path
+                with track_stage("trim"):
+                    await run_media_tool(cmd, capture_stdout=False)
+                # Analyze the trimmed version instead of the original
+                video_path = trimmed_file_path
+                probe = {**probe, "duration": float(MAX_VIDEO_DURATION)}
+                thumbnails = thumbnails.between(0, MAX_VIDEO_DURATION) if thumbnails else None
                 logger.info(f"Successfully trimmed video to {MAX_VIDEO_DURATION}s")
-            except subprocess.CalledProcessError as e:
+            except MediaToolError as e:
                 logger.error(f"Error trimming video: {e}")
                 # Continue with original video if trimming fails
-                if os.path.exists(trimmed_file_path):
-                    os.unlink(trimmed_file_path)
-        
-        # Step 1: Try Gemini analysis
-        video_clips = await extract_video_clips(temp_file_path)
-        if video_clips:
-            result = await analyze_with_gemini(video_clips)
-            if result:
-                logger.info(f"Gemini analysis successful: {result.status}")
-                return result
-        
-        # Step 2: Fallback to Joy Caption + Whisper + Grok
-        logger.info("Falling back to Joy Caption + Whisper + Grok analysis")
-        
-        # Get visual analysis from frames
-        frames = await extract_video_frames(temp_file_path, num_frames=3)
-        if not frames:
-            raise HTTPException(status_code=500, detail="Failed to extract frames from video")
-        
-        # Get audio analysis from Whisper
-        transcript = await transcribe_audio(temp_file_path)
-        
-        # Analyze frames with Joy Caption
-        captions = []
-        for i, frame in enumerate(frames):
-            logger.info(f"Analyzing frame {i+1}/{len(frames)} with Joy Caption")
-            caption = await analyze_with_joy_caption(frame)
-            if caption:
-                captions.append(caption)
-        
-        if not captions:
-            raise HTTPException(status_code=500, detail="Failed to generate captions for frames")
-        
-        # Combine visual and audio analysis for Grok
-        analysis_text = "\n\n".join([
-            "Visual Analysis:",
-            *[f"Frame {i+1}: {caption}" for i, caption in enumerate(captions)],
-            "\nAudio Analysis:",
-            transcript if transcript else "No audio transcript available"
-        ])
         
-        # Analyze combined content with Grok
-        result = await analyze_with_grok([analysis_text])  # Pass as single item list
-        if result:
-            logger.info(f"Grok analysis successful: {result.status}")
-            return result
-        
-        # If all methods fail, return error
-        raise HTTPException(
-            status_code=500,
-            detail="All analysis methods failed. Please try again later."
-        )
+        return await analyze_video_file(video_path, filename, probe, thumbnails=thumbnails)
+    
+    finally:
+        # Clean up trimmed copy
+        if trimmed_file_path and os.path.exists(trimmed_file_path):
+            os.unlink(trimmed_file_path)
+
+async def decode_request_thumbnails(video_path: str, duration: float) -> Optional[Thumbnails]:
+    """One low-rate decode shared by the pre-screen, scene sampler and fingerprint, None if none is enabled or it fails"""
+    rates = [fps for enabled, fps in (
+        (prescreener is not None, PRESCREEN_FPS),
+        (SCENE_SAMPLING, SCENE_ANALYSIS_FPS),
+        (fingerprint_index is not None, FINGERPRINT_FPS),
+    ) if enabled]
+    if not rates:
+        return None
+    # Only the analysed part of a long video, unless it is analysed in segments
+    max_seconds = None if LONG_VIDEO_MODE == LONG_VIDEO_SEGMENT else MAX_VIDEO_DURATION
+    seconds = min(duration, max_seconds or duration)
+    fps = min(max(rates), THUMBNAIL_MAX_FRAMES / seconds) if seconds > 0 else max(rates)
+    try:
+        with track_stage("thumbnails"):
+            frames = await decode_thumbnails(video_path, fps, size=THUMBNAIL_SIZE, max_seconds=max_seconds)
+    except Exception as e:
+        logger.error(f"Thumbnail decode failed, stages will decode on their own: {e}")
+        return None
+    return Thumbnails(frames, fps) if len(frames) else None
+
+async def resolve_analysis(video_path: str, filename: Optional[str], sha256: Optional[str],
+                           probe: Optional[Dict[str, Any]] = None) -> tuple:
+    """Verdict for a saved video plus its source: cache, fingerprint or pipeline"""
+    # Check the result cache before doing any extraction or model calls
+    cache_key = None
+    if result_cache and sha256:
+        cache_key = make_cache_key(sha256, analysis_config())
+        cached = await result_cache.get(cache_key)
+        if cached:
+            logger.info(f"Result cache hit for {filename} ({sha256[:12]})")
+            return AnalysisResult(**cached), "cache"
+    
+    if probe is None:
+        probe = await probe_video(video_path)
+    thumbnails = await decode_request_thumbnails(video_path, probe["duration"])
+    
+    # Then look for a near-duplicate of a video we have already analysed
+    fingerprint = None
+    if fingerprint_index:
+        with track_stage("fingerprint"):
+            fingerprint = await compute_fingerprint(
+                video_path, fps=FINGERPRINT_FPS,
+                max_seconds=None if LONG_VIDEO_MODE == LONG_VIDEO_SEGMENT else MAX_VIDEO_DURATION,
+                thumbs=thumbnails.at_fps(FINGERPRINT_FPS).frames if thumbnails else None
+            )
+            match = await fingerprint_index.lookup(fingerprint) if fingerprint is not None else None
+        if match:
+            verdict, score = match
+            logger.info(f"Near-duplicate match for {filename} (score {score:.2f}), reusing verdict")
+            result = AnalysisResult(**verdict)
+            if result_cache and cache_key:
+                await result_cache.set(cache_key, result.model_dump())
+            return result, "fingerprint"
+    
+    result = await run_analysis_pipeline(video_path, filename, probe=probe, thumbnails=thumbnails)
+    
+    if result_cache and cache_key:
+        await result_cache.set(cache_key, result.model_dump())
+    if fingerprint is not None:
+        await fingerprint_index.add(fingerprint, result.model_dump(), sha256)
+    
+    return result, "pipeline"
+
+async def analyze_saved_video(video_path: str, filename: Optional[str], sha256: Optional[str],
+                              probe: Optional[Dict[str, Any]] = None) -> AnalysisResult:
+    """Analyze a video already on disk, consulting the result cache and fingerprint index first"""
+    ANALYSES_IN_FLIGHT.inc()
+    try:
+        result, source = await resolve_analysis(video_path, filename, sha256, probe)
+    except HTTPException as e:
+        ANALYSIS_FAILURES.labels(str(e.status_code)).inc()
+        raise
+    except asyncio.CancelledError:
+        ANALYSIS_FAILURES.labels("cancelled").inc()
+        raise
+    except Exception:
+        ANALYSIS_FAILURES.labels("error").inc()
+        raise
+    finally:
+        ANALYSES_IN_FLIGHT.dec()
+    
+    record_analysis(source, result.method, result.status, result.categories)
+    return result
+
+async def run_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Job worker handler: run the analysis pipeline on a queued upload
+
+    The upload is left in place: the job store deletes it once the job has
+    finished, and keeps it when the job is requeued by a graceful shutdown.
+    """
+    with await open_workspace():
+        result = await analyze_saved_video(job["file_path"], job["filename"], job["sha256"], job["probe"])
+    return result.model_dump()
+
+async def job_finished(job: Dict[str, Any]):
+    """Deliver the job result to its callback URL, if one was given"""
+    if job and job.get("callback_url"):
+        await post_job_callback(http_client, job)
+
+job_store = JobStore(JOB_DB_PATH, lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS)
+job_pool = JobWorkerPool(job_store, run_job, concurrency=JOB_WORKERS, on_finished=job_finished)
+
+@app.on_event("startup")
+async def start_job_workers():
+    if JOB_WORKERS > 0:
+        job_pool.start()
+
+@app.on_event("startup")
+async def preload_whisper():
+    # Load and warm up in the background so startup isn't delayed by model loading
+    count = preload_count(WHISPER_PRELOAD, WHISPER_MODEL, WHISPER_POOL_SIZE)
+    if count:
+        asyncio.create_task(whisper_pool.start(count))
+
+@app.on_event("startup")
+async def start_temp_sweeper():
+    workspaces.start_sweeper()
+
+@app.on_event("shutdown")
+async def stop_temp_sweeper():
+    await workspaces.stop_sweeper()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await job_pool.stop()
+
+@app.on_event("shutdown")
+async def close_http_client():
+    await http_client.close()
+
+@app.on_event("shutdown")
+async def retire_worker_metrics():
+    mark_worker_dead(os.getpid())
+
+# API Endpoints
+@app.post("/analyze", response_model=AnalysisResult)
+async def analyze_video(file: UploadFile = File(...)):
+    """Main endpoint to analyze uploaded video"""
+    # Log request
+    logger.info(f"Received video for analysis: {file.filename}, size: {file.size}")
+    
+    try:
+        # Everything for this request lives in its own workspace, removed when we're done
+        with await open_workspace(file.size) as workspace:
+            temp_file_path = workspace.file(file.filename)
+            upload = await ingest_upload(file, temp_file_path)
+            
+            return await analyze_saved_video(temp_file_path, file.filename, upload.sha256, upload.probe)
     
     except HTTPException:
         raise
@@ -593,15 +1608,205 @@ async def analyze_video(file: UploadFile = File(...)):
             status_code=500,
             detail=f"Analysis failed: {str(e)}"
         )
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_analysis_events(upload: UploadInfo, filename: Optional[str],
+                                 workspace: Optional[Workspace] = None):
+    """Run the analysis for one saved upload and yield its progress as server-sent events"""
+    queue: asyncio.Queue = asyncio.Queue()
     
+    async def run():
+        analysis_events.set(queue)  # Tasks get their own context, so this stays local to the request
+        current_workspace.set(workspace)
+        try:
+            result = await analyze_saved_video(upload.path, filename, upload.sha256, upload.probe)
+            queue.put_nowait(("result", result.model_dump()))
+        except HTTPException as e:
+            queue.put_nowait(("error", {"detail": e.detail}))
+        except Exception as e:
+            logger.error(f"Streaming analysis failed for {filename}: {e}")
+            queue.put_nowait(("error", {"detail": f"Analysis failed: {str(e)}"}))
+        finally:
+            queue.put_nowait(None)
+    
+    task = asyncio.create_task(run())
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            yield format_sse(*item)
     finally:
-        # Clean up
-        if temp_file_path and os.path.exists(temp_file_path):
-            os.unlink(temp_file_path)
+        # Client disconnected: cancelling kills in-flight ffmpeg and aborts model calls
+        if not task.done():
+            logger.info(f"Client cancelled streaming analysis of {filename}")
+            task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        if workspace:
+            workspace.close()
+        if os.path.exists(upload.path):
+            os.unlink(upload.path)
+
+@app.post("/analyze/stream")
+async def analyze_video_stream(file: UploadFile = File(...)):
+    """Analyze an uploaded video, streaming per-clip verdicts, captions and the transcript as SSE"""
+    logger.info(f"Received video for streaming analysis: {file.filename}, size: {file.size}")
+    workspace = await open_workspace(file.size)
+    try:
+        upload = await ingest_upload(file, workspace.file(file.filename))
+    except BaseException:
+        workspace.close()
+        raise
+    
+    return StreamingResponse(
+        stream_analysis_events(upload, file.filename, workspace),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def stream_batch_results(uploads: List[tuple]):
+    """Analyze saved uploads concurrently and yield one NDJSON line per file as it finishes"""
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    
+    async def run_one(index: int, filename: Optional[str], upload, workspace: Optional[Workspace]) -> Dict[str, Any]:
+        item = {"index": index, "filename": filename}
+        if isinstance(upload, HTTPException):
+            item["error"] = upload.detail
+            return item
+        
+        current_workspace.set(workspace)
+        try:
+            async with semaphore:
+                result = await analyze_saved_video(upload.path, filename, upload.sha256, upload.probe)
+            item["result"] = result.model_dump()
+        except HTTPException as e:
+            item["error"] = e.detail
+        except Exception as e:
+            logger.error(f"Batch analysis failed for {filename}: {e}")
+            item["error"] = f"Analysis failed: {str(e)}"
+        finally:
+            workspace.close()
+        return item
+    
+    tasks = [asyncio.create_task(run_one(*upload)) for upload in uploads]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            item = await next_done
+            yield json.dumps(item) + "\n"
+    finally:
+        # Client went away or the stream ended: stop outstanding work and drop its files
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        close_batch_workspaces(uploads)
+
+def close_batch_workspaces(uploads: List[tuple]):
+    for _, _, _, workspace in uploads:
+        if workspace:
+            workspace.close()
+
+@app.post("/analyze/batch")
+async def analyze_batch(files: List[UploadFile] = File(...)):
+    """Analyze many videos in one request, streaming per-file results as NDJSON"""
+    if len(files) > BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_FILES} files per batch")
+    
+    logger.info(f"Received batch of {len(files)} videos for analysis")
+    
+    # Stream every upload to disk before the response starts
+    uploads = []
+    try:
+        for index, file in enumerate(files):
+            workspace = None
+            try:
+                workspace = await open_workspace(file.size)
+                upload = await ingest_upload(file, workspace.file(file.filename))
+                uploads.append((index, file.filename, upload, workspace))
+            except HTTPException as e:
+                if workspace:
+                    workspace.close()
+                uploads.append((index, file.filename, e, None))
+            except BaseException:
+                if workspace:
+                    workspace.close()
+                raise
+    except BaseException:
+        close_batch_workspaces(uploads)
+        raise
+    
+    return StreamingResponse(stream_batch_results(uploads), media_type="application/x-ndjson")
+
+@app.post("/jobs", response_model=JobSubmitted, status_code=202)
+async def submit_job(file: UploadFile = File(...), callback_url: Optional[str] = Form(None)):
+    """Queue a video for background analysis and return a job ID immediately"""
+    if callback_url and not callback_url.startswith(("http://", "https://")):
+        raise HTTPException(status_code=400, detail="callback_url must be an http(s) URL")
+    
+    loop = asyncio.get_event_loop()
+    depth = await loop.run_in_executor(None, job_store.queue_depth)
+    if depth >= JOB_MAX_QUEUED:
+        raise HTTPException(
+            status_code=503,
+            detail="Job queue is full. Please retry later.",
+            headers={"Retry-After": "30"}
+        )
+    
+    job_id = uuid.uuid4().hex
+    suffix = Path(file.filename or "").suffix
+    job_file_path = os.path.join(JOB_DIR, f"{job_id}{suffix}")
+    
+    try:
+        logger.info(f"Received video for job {job_id}: {file.filename}, size: {file.size}")
+        upload = await ingest_upload(file, job_file_path)
+        await loop.run_in_executor(
+            None,
+            lambda: job_store.submit(job_file_path, file.filename, upload.sha256, upload.probe, callback_url, job_id)
+        )
+    except Exception:
+        if os.path.exists(job_file_path):
+            os.unlink(job_file_path)
+        raise
+    
+    job_pool.notify()
+    return JobSubmitted(id=job_id, status=JOB_QUEUED)
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    """Job status, plus the AnalysisResult once it has finished"""
+    loop = asyncio.get_event_loop()
+    job = await loop.run_in_executor(None, job_store.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobStatus(
+        id=job["id"],
+        status=job["status"],
+        filename=job["filename"],
+        created_at=datetime.fromtimestamp(job["created_at"]),
+        updated_at=datetime.fromtimestamp(job["updated_at"]),
+        result=AnalysisResult(**job["result"]) if job["result"] else None,
+        error=job["error"]
+    )
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics for every worker process (PROMETHEUS_MULTIPROC_DIR) or just this one"""
+    loop = asyncio.get_event_loop()
+    TEMP_DISK_BYTES.labels("temp").set(await loop.run_in_executor(None, directory_size, TEMP_DIR))
+    if workspaces.ram_root:
+        TEMP_DISK_BYTES.labels("ram").set(await loop.run_in_executor(None, directory_size, workspaces.ram_root))
+    TEMP_DISK_BYTES.labels("jobs").set(await loop.run_in_executor(None, directory_size, JOB_DIR))
+    JOB_QUEUE_DEPTH.set(await loop.run_in_executor(None, job_store.queue_depth))
+    if result_cache:
+        CACHE_MEMORY_ENTRIES.set(result_cache.snapshot()["memory_entries"])
+    return Response(metrics_payload(), media_type=CONTENT_TYPE_LATEST)
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
+    loop = asyncio.get_event_loop()
+    queue_depth = await loop.run_in_executor(None, job_store.queue_depth)
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
@@ -609,6 +1814,19 @@ async def health_check():
             "gemini": bool(GEMINI_API_KEY),
             "replicate": bool(REPLICATE_API_KEY),
             "grok": bool(GROK_API_KEY)
+        },
+        "cache": result_cache.snapshot() if result_cache else {"enabled": False},
+        "fingerprints": fingerprint_index.snapshot() if fingerprint_index else {"enabled": False},
+        "prescreen": prescreener.snapshot() if prescreener else {"enabled": False},
+        "workspaces": workspaces.snapshot(),
+        "hedging": hedge_policy.snapshot(),
+        "providers": {guard.name: guard.snapshot() for guard in (gemini_guard, replicate_guard, grok_guard)},
+        "early_exit": early_exit_policy.snapshot(),
+        "whisper": whisper_pool.snapshot(),
+        "http": http_client.snapshot(),
+        "jobs": {
+            "workers": JOB_WORKERS,
+            "queue_depth": queue_depth
         }
     }
 
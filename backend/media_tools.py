@@ -0,0 +1,145 @@
+import os
+import time
+import asyncio
+import logging
+import resource
+from typing import List, Optional
+
+from tracing import span, SPAN_KIND_CLIENT
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+MEDIA_TOOL_MAX_PROCS = int(os.getenv("MEDIA_TOOL_MAX_PROCS", str(os.cpu_count() or 2)))
+MEDIA_TOOL_TIMEOUT = float(os.getenv("MEDIA_TOOL_TIMEOUT", "120"))  # seconds
+STDERR_TAIL_BYTES = 4096
+
+# Caps concurrent ffmpeg/ffprobe processes per worker, shared by every request
+media_tool_semaphore = asyncio.Semaphore(MEDIA_TOOL_MAX_PROCS)
+
+
+class MediaToolError(Exception):
+    """Raised when ffmpeg/ffprobe exits non-zero or times out"""
+
+    def __init__(self, cmd: List[str], returncode: Optional[int], stderr: str, timed_out: bool = False):
+        self.cmd = cmd
+        self.returncode = returncode
+        self.stderr = stderr
+        self.timed_out = timed_out
+        reason = "timed out" if timed_out else f"exited with code {returncode}"
+        super().__init__(f"{cmd[0]} {reason}: {stderr[-500:]}")
+
+
+class MediaToolResult:
+    """Outcome of a finished media tool run"""
+
+    def __init__(self, returncode: int, stdout: bytes, stderr: str, elapsed: float):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.elapsed = elapsed
+
+    @property
+    def text(self) -> str:
+        return self.stdout.decode("utf-8", "replace")
+
+
+def _stderr_tail(stderr: Optional[bytes]) -> str:
+    if not stderr:
+        return ""
+    return bytes(stderr[-STDERR_TAIL_BYTES:]).decode("utf-8", "replace").strip()
+
+
+async def _drain(stream: asyncio.StreamReader, buffer: bytearray, keep: Optional[int] = None):
+    """Read a pipe to EOF into buffer, keeping only the last keep bytes if given
+
+    Reading into a caller-owned buffer means whatever arrived before a
+    timeout or cancellation is still there afterwards.
+    """
+    while True:
+        chunk = await stream.read(64 * 1024)
+        if not chunk:
+            return
+        buffer += chunk
+        if keep is not None and len(buffer) > keep:
+            del buffer[:-keep]
+
+
+async def _kill(proc: asyncio.subprocess.Process, readers: asyncio.Future, grace: float = 1.0):
+    """Kill a child process, reap it so it never outlives its request and let the pipe readers finish"""
+    if proc.returncode is None:
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+    await proc.wait()
+    # The pipes close with the process; the grace period only matters if something else holds them open
+    await asyncio.wait([readers], timeout=grace)
+    readers.cancel()
+    await asyncio.gather(readers, return_exceptions=True)
+
+
+async def run_media_tool(cmd: List[str], timeout: Optional[float] = None,
+                         check: bool = True, capture_stdout: bool = True) -> MediaToolResult:
+    """Run ffmpeg/ffprobe without blocking the event loop
+
+    Concurrency is bounded by MEDIA_TOOL_MAX_PROCS. The process is killed on
+    timeout or when the awaiting task is cancelled. stderr is always captured
+    so failures can be diagnosed from the logs, including the tail written
+    before a timeout.
+    """
+    timeout = MEDIA_TOOL_TIMEOUT if timeout is None else timeout
+
+    with span(f"subprocess {os.path.basename(cmd[0])}", SPAN_KIND_CLIENT) as traced:
+        result = await _run(cmd, timeout, capture_stdout, traced)
+    if check and result.returncode != 0:
+        raise MediaToolError(cmd, result.returncode, result.stderr)
+    return result
+
+
+async def _run(cmd: List[str], timeout: float, capture_stdout: bool, traced) -> MediaToolResult:
+    queued = time.perf_counter()
+    async with media_tool_semaphore:
+        start = time.perf_counter()
+        # Children's CPU time, only sampled when tracing; approximate if other tools finish meanwhile
+        cpu_before = resource.getrusage(resource.RUSAGE_CHILDREN) if traced else None
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE if capture_stdout else asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+
+        stdout, stderr = bytearray(), bytearray()
+        pipes = [_drain(proc.stderr, stderr, STDERR_TAIL_BYTES)]
+        if capture_stdout:
+            pipes.append(_drain(proc.stdout, stdout))
+        readers = asyncio.gather(*pipes)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.gather(readers, proc.wait())), timeout=timeout)
+        except asyncio.TimeoutError:
+            await _kill(proc, readers)
+            tail = _stderr_tail(stderr)
+            logger.error(f"{cmd[0]} timed out after {timeout}s and was killed: {tail[-500:]}")
+            raise MediaToolError(cmd, None, tail, timed_out=True)
+        except asyncio.CancelledError:
+            await _kill(proc, readers, grace=0)
+            raise
+
+        elapsed = time.perf_counter() - start
+
+    result = MediaToolResult(proc.returncode, bytes(stdout), _stderr_tail(stderr), elapsed)
+    if traced:
+        cpu_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        traced.attributes.update({
+            "process.command": " ".join(cmd)[:1000],
+            "process.exit_code": proc.returncode,
+            "process.queue_seconds": round(start - queued, 6),
+            "process.wall_seconds": round(elapsed, 6),
+            "process.cpu_seconds": round(
+                (cpu_after.ru_utime - cpu_before.ru_utime) + (cpu_after.ru_stime - cpu_before.ru_stime), 6
+            ),
+            "process.stdout_bytes": len(result.stdout),
+        })
+    return result
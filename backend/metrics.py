@@ -0,0 +1,149 @@
+import os
+import time
+import asyncio
+import functools
+from typing import Optional, List
+
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, generate_latest, multiprocess
+
+from tracing import span, current_span
+
+OUTCOME_OK = "ok"
+OUTCOME_EMPTY = "empty"  # Stage returned nothing usable (None or an empty list)
+OUTCOME_ERROR = "error"
+OUTCOME_TIMEOUT = "timeout"
+OUTCOME_CANCELLED = "cancelled"
+
+# Set (before start) when several uvicorn workers serve /metrics, so each scrape aggregates all of them
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, float("inf"))
+
+BYTE_BUCKETS = tuple(float(2 ** power) for power in range(14, 28, 2)) + (float("inf"),)  # 16 KiB - 64 MiB
+
+STAGE_SECONDS = Histogram(
+    "nsfw_stage_duration_seconds", "Time spent in each pipeline stage",
+    ["stage", "outcome"], buckets=STAGE_BUCKETS
+)
+STAGE_IN_FLIGHT = Gauge("nsfw_stage_in_flight", "Pipeline stages currently running", ["stage"],
+                        multiprocess_mode="livesum")
+ANALYSES = Counter(
+    "nsfw_analyses_total", "Finished analyses by where the verdict came from, method and status",
+    ["source", "method", "status"]
+)
+ANALYSIS_CATEGORIES = Counter("nsfw_analysis_categories_total", "Categories reported in verdicts", ["category"])
+ANALYSIS_FAILURES = Counter("nsfw_analysis_failures_total", "Analyses that ended in an error", ["reason"])
+ANALYSES_IN_FLIGHT = Gauge("nsfw_analyses_in_flight", "Videos currently being analysed", multiprocess_mode="livesum")
+# Measured by whichever worker serves the scrape, the directories are shared
+TEMP_DISK_BYTES = Gauge("nsfw_temp_disk_bytes", "Bytes held in working directories", ["directory"],
+                        multiprocess_mode="livemostrecent")
+UPLOAD_BYTES = Counter("nsfw_provider_upload_bytes_total", "Media bytes sent to each provider", ["provider"])
+PREPROCESS_BYTES_SAVED = Histogram(
+    "nsfw_preprocess_bytes_saved", "Media bytes preprocessing saved per upload batch, against sending source-resolution media",
+    ["provider"], buckets=BYTE_BUCKETS
+)
+JOB_QUEUE_DEPTH = Gauge("nsfw_job_queue_depth", "Background jobs queued or running", multiprocess_mode="livemostrecent")
+CACHE_LOOKUPS = Counter("nsfw_cache_lookups_total", "Result cache lookups by outcome", ["result"])  # memory_hit, disk_hit, miss
+CACHE_STORES = Counter("nsfw_cache_stores_total", "Results written to the result cache")
+CACHE_MEMORY_ENTRIES = Gauge("nsfw_cache_memory_entries", "Results held in the in-process cache tiers",
+                             multiprocess_mode="livesum")
+
+
+def exception_outcome(exc_type) -> str:
+    if issubclass(exc_type, asyncio.CancelledError):
+        return OUTCOME_CANCELLED
+    if issubclass(exc_type, asyncio.TimeoutError):
+        return OUTCOME_TIMEOUT
+    return OUTCOME_ERROR
+
+
+class track_stage:
+    """Time a block into STAGE_SECONDS and count it in flight
+
+    Usable as `with track_stage("trim"):` around sync or awaited code. The
+    outcome label comes from the exception, if any; call mark() to record a
+    different one (e.g. OUTCOME_EMPTY) for a block that swallows its failures.
+    In a traced request the block is also recorded as a span.
+    """
+
+    __slots__ = ("stage", "outcome", "_start", "_gauge", "_span")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.outcome: Optional[str] = None
+        self._span = None
+
+    def mark(self, outcome: str):
+        self.outcome = outcome
+
+    def __enter__(self):
+        self._gauge = STAGE_IN_FLIGHT.labels(self.stage)
+        self._gauge.inc()
+        if current_span.get() is not None:
+            self._span = span(self.stage)
+            self._span.__enter__()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._start
+        self._gauge.dec()
+        outcome = exception_outcome(exc_type) if exc_type else (self.outcome or OUTCOME_OK)
+        STAGE_SECONDS.labels(self.stage, outcome).observe(elapsed)
+        if self._span is not None:
+            current_span.get().attributes["outcome"] = outcome
+            self._span.__exit__(exc_type, exc, tb)
+        return False
+
+
+def timed_stage(stage: str):
+    """Decorator form of track_stage for coroutines; None or [] results count as empty"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with track_stage(stage) as tracked:
+                result = await func(*args, **kwargs)
+                if result is None or (isinstance(result, list) and not result):
+                    tracked.mark(OUTCOME_EMPTY)
+                return result
+        return wrapper
+    return decorator
+
+
+def record_analysis(source: str, method: str, status: str, categories: List[str]):
+    ANALYSES.labels(source, method, status).inc()
+    for category in categories:
+        ANALYSIS_CATEGORIES.labels(category).inc()
+
+
+def record_upload(provider: str, sent_bytes: int, source_bytes: int):
+    """Count media about to be sent to a provider and how much downscaling/transcoding saved"""
+    UPLOAD_BYTES.labels(provider).inc(sent_bytes)
+    PREPROCESS_BYTES_SAVED.labels(provider).observe(max(0, source_bytes - sent_bytes))
+
+
+def metrics_payload() -> bytes:
+    """Exposition text for /metrics, aggregated over every worker in multiprocess mode"""
+    if not MULTIPROC_DIR:
+        return generate_latest()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=MULTIPROC_DIR)
+    return generate_latest(registry)
+
+
+def mark_worker_dead(pid: int):
+    """Drop an exiting worker's live gauges from the multiprocess files"""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid, path=MULTIPROC_DIR)
+
+
+def directory_size(path: str) -> int:
+    """Total size of the regular files under path (blocking)"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.stat(os.path.join(root, name)).st_size
+            except OSError:
+                pass  # Removed while we were walking
+    return total
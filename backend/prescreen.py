@@ -0,0 +1,188 @@
+import asyncio
+import logging
+from typing import List, Optional, Dict, Any
+
+import cv2
+import numpy as np
+
+from sampling import decode_thumbnails
+
+try:
+    import onnxruntime
+except ImportError:  # Optional: only needed for the classifier stage
+    onnxruntime = None
+
+logger = logging.getLogger(__name__)
+
+PRESCREEN_SAFE = "safe"
+PRESCREEN_NSFW = "nsfw"
+
+
+def frame_entropy(gray: np.ndarray) -> np.ndarray:
+    """Shannon entropy in bits of each greyscale frame's histogram, shape (N,)"""
+    flat = gray.reshape(len(gray), -1)
+    offsets = (np.arange(len(gray)) * 256)[:, None]
+    counts = np.bincount((flat.astype(np.int64) + offsets).ravel(), minlength=len(gray) * 256)
+    probs = counts.reshape(len(gray), 256) / flat.shape[1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return -np.nansum(np.where(probs > 0, probs * np.log2(probs), 0), axis=1)
+
+
+def skin_ratio(thumbs: np.ndarray) -> np.ndarray:
+    """Fraction of skin-toned pixels per RGB frame using the classic YCrCb box rule, shape (N,)"""
+    rgb = thumbs.astype(np.float32)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    y = 0.299 * r + 0.587 * g + 0.114 * b
+    cr = (r - y) * 0.713 + 128
+    cb = (b - y) * 0.564 + 128
+    skin = (cr >= 133) & (cr <= 173) & (cb >= 77) & (cb <= 127) & (y > 40)
+    return skin.reshape(len(thumbs), -1).mean(axis=1)
+
+
+class OnnxFrameClassifier:
+    """Small image classifier run on CPU through onnxruntime
+
+    The NSFW score of a frame is the summed probability of nsfw_classes. Both
+    NCHW and NHWC inputs are supported; logits are softmaxed if the outputs
+    don't already look like probabilities.
+    """
+
+    def __init__(self, model_path: str, nsfw_classes: List[int], input_size: int = 224, threads: int = 1):
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input = self.session.get_inputs()[0]
+        self.channels_first = len(self.input.shape) == 4 and self.input.shape[1] == 3
+        self.nsfw_classes = nsfw_classes
+        self.input_size = input_size
+
+    def nsfw_scores(self, thumbs: np.ndarray) -> np.ndarray:
+        batch = np.stack([
+            cv2.resize(frame, (self.input_size, self.input_size), interpolation=cv2.INTER_AREA)
+            for frame in thumbs
+        ]).astype(np.float32) / 255.0
+        if self.channels_first:
+            batch = batch.transpose(0, 3, 1, 2)
+        outputs = self.session.run(None, {self.input.name: batch})[0]
+        if outputs.min() < 0 or not np.allclose(outputs.sum(axis=1), 1, atol=1e-2):
+            exp = np.exp(outputs - outputs.max(axis=1, keepdims=True))
+            outputs = exp / exp.sum(axis=1, keepdims=True)
+        return outputs[:, self.nsfw_classes].sum(axis=1)
+
+
+class Prescreener:
+    """CPU-only first pass that settles obviously safe or unsafe videos locally
+
+    Frames sampled at a low rate (normally the request's shared thumbnails)
+    are run through these checks:
+    - blank/low-entropy: every frame is near-uniform or a simple slide, so
+      there's nothing to moderate visually.
+    - classifier (optional ONNX model): any frame at or above nsfw_threshold
+      is flagged unsafe; all frames at or below safe_threshold with little
+      skin on screen count as safe.
+    Local safe verdicts need a silent video unless require_silent is off,
+    because audio (profanity) can only be judged by the full pipeline.
+    Anything else escalates.
+    """
+
+    def __init__(self, fps: float = 1.0, frame_size: int = 128, blank_std: float = 6.0,
+                 min_entropy: float = 2.0, max_skin_ratio: float = 0.05, require_silent: bool = True,
+                 classifier: Optional[OnnxFrameClassifier] = None, safe_threshold: float = 0.05,
+                 nsfw_threshold: float = 0.95):
+        self.fps = fps
+        self.frame_size = frame_size
+        self.blank_std = blank_std
+        self.min_entropy = min_entropy
+        self.max_skin_ratio = max_skin_ratio
+        self.require_silent = require_silent
+        self.classifier = classifier
+        self.safe_threshold = safe_threshold
+        self.nsfw_threshold = nsfw_threshold
+        self.stats = {"screened": 0, "local_safe": 0, "local_nsfw": 0, "escalated": 0, "errors": 0}
+
+    def evaluate(self, thumbs: np.ndarray, has_audio: Optional[bool]) -> Optional[Dict[str, Any]]:
+        """Verdict for decoded RGB frames, or None to escalate (blocking)"""
+        if len(thumbs) == 0:
+            return None
+        gray = thumbs.mean(axis=-1)
+        uninformative = (gray.reshape(len(gray), -1).std(axis=1) < self.blank_std) | \
+                        (frame_entropy(gray.astype(np.uint8)) < self.min_entropy)
+        silent = has_audio is False or not self.require_silent
+
+        scores = self.classifier.nsfw_scores(thumbs) if self.classifier else None
+        if scores is not None and scores.max() >= self.nsfw_threshold:
+            peak = float(scores.max())
+            return {
+                "status": PRESCREEN_NSFW,
+                "categories": ["pornography"],
+                "severity": min(5, max(3, int(round(peak * 5)))),
+                "description": f"Local classifier flagged explicit content (score {peak:.2f}) in a sampled frame.",
+            }
+
+        if not silent:
+            return None
+
+        if uninformative.all():
+            return {
+                "status": PRESCREEN_SAFE,
+                "categories": [],
+                "severity": 0,
+                "description": "Video is blank, near-uniform or a simple static slide with no audio.",
+            }
+
+        # Skin tone only backs up the classifier, on its own it says too little either way
+        if scores is not None and scores.max() <= self.safe_threshold and skin_ratio(thumbs).max() <= self.max_skin_ratio:
+            return {
+                "status": PRESCREEN_SAFE,
+                "categories": [],
+                "severity": 0,
+                "description": "Local classifier found no explicit content and little exposed skin in any sampled frame.",
+            }
+
+        return None
+
+    async def screen(self, file_path: str, has_audio: Optional[bool],
+                     thumbs: Optional[np.ndarray] = None) -> Optional[Dict[str, Any]]:
+        """Return a confident verdict for the request's shared thumbnails (or a fresh decode), or None to escalate"""
+        self.stats["screened"] += 1
+        try:
+            if thumbs is None:
+                thumbs = await decode_thumbnails(file_path, self.fps, size=self.frame_size)
+            verdict = await asyncio.get_running_loop().run_in_executor(None, self.evaluate, thumbs, has_audio)
+        except Exception as e:
+            logger.error(f"Pre-screen failed, escalating: {e}")
+            self.stats["errors"] += 1
+            verdict = None
+
+        if verdict is None:
+            self.stats["escalated"] += 1
+        elif verdict["status"] == PRESCREEN_SAFE:
+            self.stats["local_safe"] += 1
+        else:
+            self.stats["local_nsfw"] += 1
+        return verdict
+
+    def snapshot(self) -> Dict[str, Any]:
+        screened = self.stats["screened"]
+        return {
+            **self.stats,
+            "escalation_rate": round(self.stats["escalated"] / screened, 4) if screened else 0.0,
+            "classifier": self.classifier is not None,
+        }
+
+
+def load_classifier(model_path: str, nsfw_classes: List[int], input_size: int = 224,
+                    threads: int = 1) -> Optional[OnnxFrameClassifier]:
+    """Load the optional ONNX classifier, or None if it isn't configured or available"""
+    if not model_path:
+        return None
+    if onnxruntime is None:
+        logger.warning("PRESCREEN_ONNX_MODEL is set but onnxruntime is not installed; classifier disabled")
+        return None
+    try:
+        classifier = OnnxFrameClassifier(model_path, nsfw_classes, input_size=input_size, threads=threads)
+        logger.info(f"Pre-screen classifier loaded from {model_path}")
+        return classifier
+    except Exception as e:
+        logger.error(f"Failed to load pre-screen classifier: {e}")
+        return None
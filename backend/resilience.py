@@ -0,0 +1,263 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half_open"
+
+
+class ProviderUnavailable(Exception):
+    """Raised instead of calling a provider whose circuit is open"""
+
+    def __init__(self, provider: str):
+        super().__init__(f"{provider} circuit is open")
+        self.provider = provider
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a half-open probe
+
+    After failure_threshold failures in a row the circuit opens and calls are
+    rejected for reset_seconds. Then up to half_open_calls probe calls are let
+    through: a success closes the circuit, a failure re-opens it. A threshold
+    of 0 disables the breaker.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0, half_open_calls: int = 1):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.half_open_calls = half_open_calls
+        self.state = BREAKER_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        self.stats = {"opened": 0, "rejected": 0}
+
+    def _refresh(self):
+        if self.state == BREAKER_OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.state = BREAKER_HALF_OPEN
+            self.probes = 0
+
+    def available(self) -> bool:
+        """Whether a call would be let through right now"""
+        self._refresh()
+        if self.state == BREAKER_OPEN:
+            return False
+        return self.state == BREAKER_CLOSED or self.probes < self.half_open_calls
+
+    def acquire(self) -> bool:
+        if not self.available():
+            self.stats["rejected"] += 1
+            return False
+        if self.state == BREAKER_HALF_OPEN:
+            self.probes += 1
+        return True
+
+    def record_success(self):
+        if self.state != BREAKER_CLOSED:
+            logger.info("Circuit closed after a successful probe")
+        self.state = BREAKER_CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == BREAKER_HALF_OPEN or (
+            self.failure_threshold and self.state == BREAKER_CLOSED and self.failures >= self.failure_threshold
+        ):
+            self.state = BREAKER_OPEN
+            self.opened_at = time.monotonic()
+            self.stats["opened"] += 1
+
+    def release_probe(self):
+        """A half-open probe ended without an outcome (cancelled)"""
+        if self.state == BREAKER_HALF_OPEN and self.probes:
+            self.probes -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        self._refresh()
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "retry_in_seconds": round(max(0.0, self.opened_at + self.reset_seconds - time.monotonic()), 1)
+            if self.state == BREAKER_OPEN else None,
+            **self.stats,
+        }
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit: grows by ~1 per limit's worth of good calls, shrinks on errors or slow calls
+
+    A call is slow when its latency exceeds latency_tolerance times the EWMA
+    of recent successful latencies (0 disables the latency signal). Decreases
+    happen at most once per cooldown seconds so one burst of concurrent
+    failures doesn't collapse the limit to the floor.
+    """
+
+    def __init__(self, min_limit: int = 1, max_limit: int = 16, initial_limit: Optional[int] = None,
+                 decrease_factor: float = 0.5, latency_tolerance: float = 2.0,
+                 min_samples: int = 20, cooldown: float = 1.0):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(self.max_limit, initial_limit or self.max_limit))
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.latency_ewma: Optional[float] = None
+        self.samples = 0
+        self._last_decrease = 0.0
+        self._waiters = deque()  # Futures, not a Condition, so the limiter isn't tied to one event loop
+        self.stats = {"increases": 0, "decreases": 0}
+
+    async def acquire(self):
+        if not self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we were cancelled, pass it on
+                self.release()
+            else:
+                self._waiters.remove(future)
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            future = self._waiters.popleft()
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+
+    def slow(self, latency: float) -> bool:
+        return bool(self.latency_tolerance and self.samples >= self.min_samples
+                    and latency > self.latency_tolerance * self.latency_ewma)
+
+    def record_success(self, latency: float):
+        if self.slow(latency):
+            self.record_congestion()
+            return
+        self.latency_ewma = latency if self.latency_ewma is None else 0.95 * self.latency_ewma + 0.05 * latency
+        self.samples += 1
+        if self.limit < self.max_limit:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.stats["increases"] += 1
+            self._wake()
+
+    def record_congestion(self):
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        new_limit = max(self.min_limit, self.limit * self.decrease_factor)
+        if new_limit < self.limit:
+            self.limit = new_limit
+            self.stats["decreases"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "limit": int(self.limit),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "latency_ewma_seconds": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+            **self.stats,
+        }
+
+
+class ProviderSlot:
+    """One guarded call; the outcome comes from the exception, or fail() for error responses"""
+
+    __slots__ = ("guard", "failed", "_start")
+
+    def __init__(self, guard: "ProviderGuard"):
+        self.guard = guard
+        self.failed = False
+
+    def fail(self):
+        self.failed = True
+
+    async def __aenter__(self):
+        if not self.guard.breaker.acquire():
+            raise ProviderUnavailable(self.guard.name)
+        try:
+            await self.guard.limiter.acquire()
+        except BaseException:
+            self.guard.breaker.release_probe()
+            raise
+        if self.guard.breaker.state == BREAKER_OPEN:
+            # The circuit opened while we were queued, don't pile onto the outage
+            self.guard.limiter.release()
+            self.guard.breaker.stats["rejected"] += 1
+            raise ProviderUnavailable(self.guard.name)
+        self._start = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        latency = time.monotonic() - self._start
+        self.guard.limiter.release()
+        self.guard.record(exc_type, self.failed, latency)
+        return False
+
+
+class ProviderGuard:
+    """Circuit breaker plus adaptive concurrency limit around one external provider
+
+    Wrap each call in `async with guard.slot() as slot:`. Exceptions and
+    slot.fail() count as failures. Cancellation (a timeout or a client going
+    away) is not a provider failure, but a call cancelled after running slow
+    still shrinks the limit.
+    """
+
+    def __init__(self, name: str, breaker: CircuitBreaker, limiter: AdaptiveLimiter):
+        self.name = name
+        self.breaker = breaker
+        self.limiter = limiter
+        self.stats = {"calls": 0, "successes": 0, "failures": 0, "cancelled": 0}
+
+    def available(self) -> bool:
+        return self.breaker.available()
+
+    def slot(self) -> ProviderSlot:
+        return ProviderSlot(self)
+
+    def record(self, exc_type, failed: bool, latency: float):
+        self.stats["calls"] += 1
+        if exc_type is not None and issubclass(exc_type, asyncio.CancelledError):
+            self.stats["cancelled"] += 1
+            self.breaker.release_probe()
+            if self.limiter.slow(latency):
+                self.limiter.record_congestion()
+        elif exc_type is not None or failed:
+            self.stats["failures"] += 1
+            was_open = self.breaker.state == BREAKER_OPEN
+            self.breaker.record_failure()
+            self.limiter.record_congestion()
+            if not was_open and self.breaker.state == BREAKER_OPEN:
+                logger.warning(f"{self.name} circuit opened after {self.breaker.failures} failures, "
+                               f"skipping it for {self.breaker.reset_seconds:.0f}s")
+        else:
+            self.stats["successes"] += 1
+            self.breaker.record_success()
+            self.limiter.record_success(latency)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "circuit": self.breaker.snapshot(),
+            "concurrency": self.limiter.snapshot(),
+            **self.stats,
+        }
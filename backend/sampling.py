@@ -0,0 +1,208 @@
+import math
+import asyncio
+import logging
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+from media_tools import run_media_tool
+
+logger = logging.getLogger(__name__)
+
+# Thumbnail size and histogram quantisation used for scene analysis
+THUMB_SIZE = 64
+HUE_BINS, SAT_BINS, VAL_BINS = 8, 4, 4
+HIST_BINS = HUE_BINS * SAT_BINS * VAL_BINS
+
+
+class ScenePlan:
+    """Timestamps of the most distinct shots in a video, most important first"""
+
+    def __init__(self, timestamps: List[float], num_samples: int, num_shots: int):
+        self.timestamps = timestamps
+        self.num_samples = num_samples
+        self.num_shots = num_shots
+
+    def top(self, k: int) -> List[float]:
+        """The k most distinct timestamps in chronological order"""
+        return sorted(self.timestamps[:k])
+
+
+class Thumbnails:
+    """Low-rate RGB thumbnails of a video, decoded once per request and shared
+
+    The pre-screen, scene sampler and fingerprint all work from the same
+    decode; each takes the time range and frame rate it needs.
+    """
+
+    def __init__(self, frames: np.ndarray, fps: float):
+        self.frames = frames
+        self.fps = fps
+
+    def between(self, start: float, end: Optional[float] = None) -> "Thumbnails":
+        """The thumbnails in [start, end), e.g. one segment of a long video"""
+        first = math.ceil(start * self.fps - 1e-6)
+        last = len(self.frames) if end is None else math.ceil(end * self.fps - 1e-6)
+        return Thumbnails(self.frames[first:last], self.fps)
+
+    def at_fps(self, fps: float) -> "Thumbnails":
+        """Every nth thumbnail, for a consumer that wants a lower frame rate"""
+        step = max(1, int(round(self.fps / fps))) if fps else 1
+        return Thumbnails(self.frames[::step], self.fps / step)
+
+    def shrink(self, size: int) -> "Thumbnails":
+        """Area-downscaled to size square if larger, for a consumer that needs less detail (blocking)"""
+        if len(self.frames) == 0 or self.frames.shape[1] <= size:
+            return self
+        frames = np.stack([cv2.resize(frame, (size, size), interpolation=cv2.INTER_AREA) for frame in self.frames])
+        return Thumbnails(frames, self.fps)
+
+
+async def decode_thumbnails(file_path: str, fps: float, size: int = THUMB_SIZE,
+                            max_seconds: Optional[float] = None) -> np.ndarray:
+    """Decode the video at a low frame rate into tiny RGB thumbnails, shape (N, size, size, 3)
+
+    ffmpeg does the decode, frame-rate reduction and area downscale in one
+    pass and pipes raw frames, so nothing full-resolution reaches Python.
+    """
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error"]
+    if max_seconds:
+        cmd += ["-t", str(max_seconds)]
+    cmd += [
+        "-i", file_path,
+        "-an", "-vf", f"fps={fps},scale={size}:{size}:flags=area",
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-"
+    ]
+    result = await run_media_tool(cmd)
+    frame_bytes = size * size * 3
+    count = len(result.stdout) // frame_bytes
+    return np.frombuffer(result.stdout[:count * frame_bytes], dtype=np.uint8).reshape(count, size, size, 3)
+
+
+def color_histograms(thumbs: np.ndarray) -> np.ndarray:
+    """Normalised HSV-ish colour histograms for every thumbnail at once, shape (N, HIST_BINS)"""
+    rgb = thumbs.reshape(len(thumbs), -1, 3).astype(np.float32) / 255.0
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    max_c = rgb.max(axis=-1)
+    min_c = rgb.min(axis=-1)
+    delta = max_c - min_c
+    safe_delta = np.where(delta == 0, 1, delta)
+
+    # Vectorised RGB -> HSV
+    hue = np.where(max_c == r, ((g - b) / safe_delta) % 6,
+          np.where(max_c == g, (b - r) / safe_delta + 2, (r - g) / safe_delta + 4)) / 6.0
+    hue = np.where(delta == 0, 0, hue)
+    sat = np.where(max_c == 0, 0, delta / np.where(max_c == 0, 1, max_c))
+    val = max_c
+
+    h_idx = np.minimum((hue * HUE_BINS).astype(np.int64), HUE_BINS - 1)
+    s_idx = np.minimum((sat * SAT_BINS).astype(np.int64), SAT_BINS - 1)
+    v_idx = np.minimum((val * VAL_BINS).astype(np.int64), VAL_BINS - 1)
+    bins = (h_idx * SAT_BINS + s_idx) * VAL_BINS + v_idx
+
+    # One bincount for all frames: offset each frame's bins into its own range
+    offsets = (np.arange(len(thumbs)) * HIST_BINS)[:, None]
+    counts = np.bincount((bins + offsets).ravel(), minlength=len(thumbs) * HIST_BINS)
+    hist = counts.reshape(len(thumbs), HIST_BINS).astype(np.float32)
+    return hist / hist.sum(axis=1, keepdims=True)
+
+
+def histogram_distance(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Total variation distance between histograms, 0 (identical) to 1 (disjoint)"""
+    return 0.5 * np.abs(a - b).sum(axis=-1)
+
+
+def evenly_spaced(duration: float, count: int) -> List[float]:
+    """count timestamps spread from the start to the end of the video, like fixed sampling"""
+    if count == 1:
+        return [duration / 2]
+    return [float(t) for t in np.linspace(0, duration, count)]
+
+
+def select_distinct_shots(hists: np.ndarray, fps: float, budget: int, cut_threshold: float,
+                          duplicate_threshold: float, long_shot_seconds: float = 10.0,
+                          min_picks: int = 1) -> ScenePlan:
+    """Pick up to budget timestamps covering the most visually distinct shots
+
+    Shots are split where consecutive histograms differ by more than
+    cut_threshold. Each shot contributes its middle frame (long shots one
+    every long_shot_seconds). Candidates are then chosen by farthest-point
+    selection, stopping as soon as the best remaining candidate is within
+    duplicate_threshold of one already chosen, so a static video yields
+    fewer samples than budget. If that leaves fewer than min_picks, evenly
+    spaced timestamps are added after the distinct ones.
+    """
+    n = len(hists)
+    if n == 0:
+        return ScenePlan([], 0, 0)
+
+    diffs = histogram_distance(hists[1:], hists[:-1])
+    cuts = np.flatnonzero(diffs > cut_threshold) + 1
+    bounds = np.concatenate([[0], cuts, [n]])
+
+    candidates, lengths = [], []
+    step = max(1, int(long_shot_seconds * fps))
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        if end - start > step:
+            picks = list(range(start + step // 2, end, step))
+        else:
+            picks = [(start + end - 1) // 2]
+        candidates.extend(picks)
+        lengths.extend([end - start] * len(picks))
+
+    candidates = np.array(candidates)
+    cand_hists = hists[candidates]
+
+    # Seed with the longest shot, then greedily add whatever is least like the picks so far
+    chosen = [int(np.argmax(lengths))]
+    min_dist = histogram_distance(cand_hists, cand_hists[chosen[0]])
+    while len(chosen) < min(budget, len(candidates)):
+        best = int(np.argmax(min_dist))
+        if min_dist[best] <= duplicate_threshold:
+            break
+        chosen.append(best)
+        min_dist = np.minimum(min_dist, histogram_distance(cand_hists, cand_hists[best]))
+
+    timestamps = [float(candidates[i] / fps) for i in chosen]
+    floor = min(budget, min_picks)
+    if len(timestamps) < floor:
+        # Top up, skipping spots already covered by a distinct pick
+        for t in evenly_spaced((n - 1) / fps, floor):
+            if len(timestamps) >= floor:
+                break
+            if all(abs(t - picked) >= 1 / fps for picked in timestamps):
+                timestamps.append(t)
+    return ScenePlan(timestamps, n, len(bounds) - 1)
+
+
+async def plan_scene_samples(file_path: str, budget: int, fps: float = 2.0, cut_threshold: float = 0.35,
+                             duplicate_threshold: float = 0.15, min_picks: int = 1,
+                             thumbnails: Optional[Thumbnails] = None) -> Optional[ScenePlan]:
+    """Scene-aware sample timestamps for a video, or None if it could not be analysed
+
+    Uses the request's shared thumbnails when given, else decodes its own.
+    Histograms and selection run in the default executor, off the event loop.
+    """
+    try:
+        if thumbnails is None:
+            thumbnails = Thumbnails(await decode_thumbnails(file_path, fps), fps)
+        else:
+            thumbnails = thumbnails.at_fps(fps)
+        if len(thumbnails.frames) == 0:
+            return None
+        def select() -> ScenePlan:
+            return select_distinct_shots(
+                color_histograms(thumbnails.shrink(THUMB_SIZE).frames), thumbnails.fps, budget, cut_threshold, duplicate_threshold,
+                min_picks=min_picks
+            )
+
+        plan = await asyncio.get_running_loop().run_in_executor(None, select)
+        logger.info(
+            f"Scene sampler: {plan.num_samples} samples, {plan.num_shots} shots, "
+            f"{len(plan.timestamps)} distinct picks at {[round(t, 2) for t in plan.top(budget)]}"
+        )
+        return plan
+    except Exception as e:
+        logger.error(f"Scene sampling failed: {e}")
+        return None
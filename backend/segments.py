@@ -0,0 +1,108 @@
+import os
+import csv
+import math
+import logging
+from typing import List, Tuple
+
+from media_tools import run_media_tool, MediaToolError
+
+logger = logging.getLogger(__name__)
+
+LONG_VIDEO_TRIM = "trim"
+LONG_VIDEO_SEGMENT = "segment"
+
+SEGMENT_LIST = "segments.csv"
+MAX_SEGMENT_OVERSHOOT = 2  # Re-encode when a copied segment is this many times the target length
+
+
+class Segment:
+    """One time slice of a long video, cut to its own file"""
+
+    def __init__(self, path: str, start: float, end: float):
+        self.path = path
+        self.start = start
+        self.end = end
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+def plan_segments(duration: float, segment_seconds: float, max_model_calls: int,
+                  num_clips: int, num_frames: int) -> Tuple[float, int, int]:
+    """Segment length plus clips and fallback frames per segment for a per-video call budget
+
+    Segments are balanced (a 61s video is two ~31s halves, not 60s + 1s) and
+    get longer when there would be more of them than the budget allows. The
+    budget is spread evenly, capped at the usual per-video clip and frame
+    counts. max_model_calls of 0 means unlimited.
+    """
+    count = math.ceil(duration / segment_seconds)
+    if max_model_calls:
+        count = min(count, max_model_calls)
+    segment_seconds = math.ceil(duration / count)
+    count = math.ceil(duration / segment_seconds)
+    per_segment = max(1, max_model_calls // count) if max_model_calls else max(num_clips, num_frames)
+    return segment_seconds, min(num_clips, per_segment), min(num_frames, per_segment)
+
+
+def format_timestamp(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours}:{rest // 60:02d}:{rest % 60:02d}" if hours else f"{rest // 60:02d}:{rest % 60:02d}"
+
+
+def build_segment_command(file_path: str, out_dir: str, segment_seconds: float, stream_copy: bool) -> List[str]:
+    """One ffmpeg pass that cuts the whole video into segment files and lists their times"""
+    suffix = os.path.splitext(file_path)[1] if stream_copy else ".mp4"
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", file_path, "-map", "0:v:0", "-map", "0:a:0?"]
+    if stream_copy:
+        # Cuts land on the first keyframe at or after each boundary
+        cmd += ["-c", "copy"]
+    else:
+        cmd += [
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", "23", "-pix_fmt", "yuv420p",
+            "-force_key_frames", f"expr:gte(t,n_forced*{segment_seconds})",
+            "-c:a", "aac"
+        ]
+    cmd += [
+        "-f", "segment", "-segment_time", str(segment_seconds), "-reset_timestamps", "1",
+        "-segment_list", os.path.join(out_dir, SEGMENT_LIST), "-segment_list_type", "csv",
+        "-y", os.path.join(out_dir, f"segment_%05d{suffix or '.mp4'}")
+    ]
+    return cmd
+
+
+def read_segment_list(out_dir: str) -> List[Segment]:
+    segments = []
+    with open(os.path.join(out_dir, SEGMENT_LIST), newline="") as f:
+        for name, start, end in csv.reader(f):
+            if float(end) > float(start):
+                segments.append(Segment(os.path.join(out_dir, name), float(start), float(end)))
+    return segments
+
+
+async def split_video(file_path: str, out_dir: str, segment_seconds: float) -> List[Segment]:
+    """Cut a video into consecutive segments, stream-copied when keyframes allow
+
+    Copying is tried first. If keyframes are so sparse that a segment runs
+    past MAX_SEGMENT_OVERSHOOT times the target length, the video is
+    re-encoded with a forced keyframe at every boundary instead.
+    """
+    for stream_copy in (True, False):
+        for name in os.listdir(out_dir):
+            os.unlink(os.path.join(out_dir, name))
+        try:
+            await run_media_tool(build_segment_command(file_path, out_dir, segment_seconds, stream_copy),
+                                 capture_stdout=False)
+            segments = read_segment_list(out_dir)
+        except (MediaToolError, OSError, ValueError) as e:
+            logger.error(f"Error splitting video (stream copy: {stream_copy}): {e}")
+            continue
+
+        longest = max((segment.duration for segment in segments), default=0)
+        if stream_copy and longest > segment_seconds * MAX_SEGMENT_OVERSHOOT:
+            logger.info(f"Keyframes too sparse to split by copying ({longest:.0f}s segment), re-encoding")
+            continue
+        return segments
+    return []
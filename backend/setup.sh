@@ -65,8 +65,10 @@ pip install -r requirements.txt
 echo -e "\n${YELLOW}📂 Creating required directories...${NC}"
 sudo mkdir -p /var/log/nsfw-analyzer
 sudo mkdir -p /tmp/nsfw-analyzer
+sudo mkdir -p /var/lib/nsfw-analyzer/jobs
 sudo chown www-data:www-data /var/log/nsfw-analyzer
 sudo chown www-data:www-data /tmp/nsfw-analyzer
+sudo chown -R www-data:www-data /var/lib/nsfw-analyzer
 
 # Step 5: Setup environment variables
 echo -e "\n${YELLOW}🔑 Setting up environment variables...${NC}"
@@ -105,6 +107,8 @@ WorkingDirectory=${BACKEND_DIR}
 Environment="PATH=${BACKEND_DIR}/venv/bin:/usr/local/bin:/usr/bin:/bin"
 Environment="PYTHONPATH=${BACKEND_DIR}"
 EnvironmentFile=${BACKEND_DIR}/.env
+Environment="PROMETHEUS_MULTIPROC_DIR=/run/nsfw-analyzer-metrics"
+RuntimeDirectory=nsfw-analyzer-metrics
 ExecStart=${BACKEND_DIR}/venv/bin/uvicorn main:app --host 127.0.0.1 --port 8005 --workers 2
 
 Restart=always
@@ -118,7 +122,7 @@ NoNewPrivileges=true
 PrivateTmp=true
 ProtectSystem=strict
 ProtectHome=true
-ReadWritePaths=/tmp/nsfw-analyzer /var/log/nsfw-analyzer
+ReadWritePaths=/tmp/nsfw-analyzer /var/log/nsfw-analyzer /var/lib/nsfw-analyzer
 
 [Install]
 WantedBy=multi-user.target
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Tests for the two-tier result cache: LRU eviction, TTL expiry, disk promotion and cache keys
+"""
+
+import asyncio
+import time
+
+import cache as cache_module
+from cache import ResultCache, make_cache_key
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_lru_evicts_the_least_recently_used_entry():
+    cache = ResultCache(max_entries=2)
+
+    async def scenario():
+        await cache.set("a", {"v": "a"})
+        await cache.set("b", {"v": "b"})
+        await cache.get("a")  # a is now more recent than b
+        await cache.set("c", {"v": "c"})
+        return [await cache.get(key) for key in ("a", "b", "c")]
+
+    assert run(scenario()) == [{"v": "a"}, None, {"v": "c"}]
+    assert cache.snapshot()["memory_entries"] == 2
+
+
+def test_entries_expire_after_the_ttl_in_memory_and_on_disk(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "cache.db")
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+
+    writer = ResultCache(ttl_seconds=60, db_path=db_path)
+    run(writer.set("key", {"status": "safe"}))
+    now[0] += 30
+    assert run(writer.get("key")) == {"status": "safe"}
+
+    now[0] += 31
+    assert run(writer.get("key")) is None
+    # A fresh process sees the same expired row on disk and deletes it
+    reader = ResultCache(ttl_seconds=60, db_path=db_path)
+    assert run(reader.get("key")) is None
+    assert reader._connect().execute("SELECT COUNT(*) FROM results").fetchone()[0] == 0
+
+
+def test_disk_hits_are_promoted_into_memory(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    run(ResultCache(db_path=db_path).set("key", {"status": "nsfw"}))
+
+    cache = ResultCache(db_path=db_path)
+    assert run(cache.get("key")) == {"status": "nsfw"}
+    assert run(cache.get("key")) == {"status": "nsfw"}
+
+    snapshot = cache.snapshot()
+    assert (snapshot["disk_hits"], snapshot["memory_hits"], snapshot["misses"]) == (1, 1, 0)
+    assert snapshot["memory_entries"] == 1
+
+
+def test_zero_max_entries_keeps_only_the_disk_tier(tmp_path):
+    cache = ResultCache(max_entries=0, db_path=str(tmp_path / "cache.db"))
+    run(cache.set("key", {"status": "safe"}))
+
+    assert cache.snapshot()["memory_entries"] == 0
+    assert run(cache.get("key")) == {"status": "safe"}
+
+
+def test_cache_key_changes_with_model_or_config():
+    config = {"gemini_model": "gemini-1.5-flash", "num_clips": 3, "prompt_version": 2}
+    key = make_cache_key("abc123", config)
+
+    assert make_cache_key("abc123", dict(reversed(list(config.items())))) == key
+    assert make_cache_key("abc123", {**config, "gemini_model": "gemini-2.0-flash"}) != key
+    assert make_cache_key("abc123", {**config, "num_clips": 5}) != key
+    assert make_cache_key("def456", config) != key
+    assert key.startswith("abc123:")
+
+
+def test_service_config_changes_the_cache_key(monkeypatch):
+    import main
+
+    key = make_cache_key("abc123", main.analysis_config())
+    monkeypatch.setattr(main, "GEMINI_MODEL", "some-newer-model")
+    assert make_cache_key("abc123", main.analysis_config()) != key
+    monkeypatch.undo()
+    monkeypatch.setattr(main, "SCENE_DUPLICATE_THRESHOLD", main.SCENE_DUPLICATE_THRESHOLD + 0.1)
+    assert make_cache_key("abc123", main.analysis_config()) != key
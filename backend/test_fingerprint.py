@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Tests for the near-duplicate fingerprint index: matching, splicing, thresholds and the shared SQLite tier
+"""
+
+import asyncio
+import os
+import threading
+
+import numpy as np
+
+from fingerprint import FingerprintIndex, TAIL_LIMIT, compute_fingerprint
+from sampling import decode_thumbnails
+
+SAFE = {"status": "safe", "severity": 0}
+
+
+def random_hashes(count, seed):
+    return np.random.default_rng(seed).integers(0, 2 ** 63, count, dtype=np.uint64)
+
+
+def flip_bits(hashes, bits, seed=0):
+    """Flip `bits` random bits of every hash, like a re-encode would"""
+    rng = np.random.default_rng(seed)
+    flipped = hashes.copy()
+    for i in range(len(flipped)):
+        for bit in rng.choice(64, bits, replace=False):
+            flipped[i] ^= np.uint64(1) << np.uint64(bit)
+    return flipped
+
+
+def lookup(index, query):
+    return asyncio.run(index.lookup(query))
+
+
+def make_index(**kwargs):
+    return FingerprintIndex(max_distance=8, match_threshold=0.8, min_matches=3, **kwargs)
+
+
+def test_near_duplicate_matches():
+    index = make_index()
+    stored = random_hashes(30, seed=1)
+    asyncio.run(index.add(stored, SAFE))
+
+    match = lookup(index, flip_bits(stored, 4))
+    assert match is not None
+    result, score = match
+    assert result == SAFE and score == 1.0
+    # Too many differing bits per frame is a different video
+    assert lookup(index, flip_bits(stored, 20)) is None
+
+
+def test_trimmed_copy_matches_its_source():
+    index = make_index()
+    stored = random_hashes(60, seed=2)
+    asyncio.run(index.add(stored, SAFE))
+
+    assert lookup(index, stored[10:30]) is not None
+
+
+def test_spliced_video_does_not_inherit_verdict():
+    index = make_index()
+    stored = random_hashes(10, seed=3)
+    asyncio.run(index.add(stored, SAFE))
+
+    spliced = np.concatenate([stored, random_hashes(50, seed=4)])
+    assert lookup(index, spliced) is None
+
+
+def test_match_threshold_and_min_matches():
+    index = make_index()
+    stored = random_hashes(20, seed=5)
+    asyncio.run(index.add(stored, SAFE))
+
+    # 15 of 20 query frames known: 0.75 is below the 0.8 threshold
+    assert lookup(index, np.concatenate([stored[:15], random_hashes(5, seed=6)])) is None
+    assert lookup(index, np.concatenate([stored[:16], random_hashes(4, seed=6)])) is not None
+    # Fewer frames than min_matches never match, however well they score
+    assert lookup(index, stored[:2]) is None
+
+
+def test_rebuilt_index_still_matches():
+    index = make_index()
+    target = random_hashes(10, seed=7)
+    asyncio.run(index.add(target, SAFE))
+    asyncio.run(index.add(random_hashes(TAIL_LIMIT + 1, seed=8), {"status": "nsfw", "severity": 3}))
+
+    assert index.stats["rebuilds"] >= 1
+    assert lookup(index, flip_bits(target, 2))[0] == SAFE
+
+
+def test_concurrent_refreshes_load_rows_once(tmp_path):
+    db_path = str(tmp_path / "fingerprints.db")
+    writer = make_index(db_path=db_path)
+    for seed in range(5):
+        asyncio.run(writer.add(random_hashes(10, seed=seed), SAFE))
+
+    reader = make_index(db_path=db_path, refresh_seconds=0)
+    threads = [threading.Thread(target=reader._refresh) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert reader.snapshot()["videos"] == 5
+    assert reader.snapshot()["hashes"] == 50
+
+
+def test_shared_thumbnails_hash_like_a_dedicated_decode():
+    video = os.path.join(os.path.dirname(__file__), "test_video.mp4")
+    own = asyncio.run(compute_fingerprint(video, fps=1.0))
+    thumbs = asyncio.run(decode_thumbnails(video, 1.0, size=128))
+    shared = asyncio.run(compute_fingerprint(video, thumbs=thumbs))
+
+    # Fingerprints stored before thumbnails were shared still match new uploads
+    index = make_index()
+    asyncio.run(index.add(own, SAFE))
+    assert lookup(index, shared) is not None
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Tests for per-provider media preprocessing: frame downscaling/encoding and clip downscaling
+"""
+
+import cv2
+import numpy as np
+import pytest
+
+import main
+from frames import FrameEncoding
+
+
+def make_frame(height, width):
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+def decoded_shape(frame):
+    return cv2.imdecode(np.frombuffer(frame.data, np.uint8), cv2.IMREAD_COLOR).shape[:2]
+
+
+def test_frames_are_downscaled_keeping_aspect_ratio():
+    frame = FrameEncoding(height=360, image_format="webp", quality=75).encode(make_frame(1080, 1920))
+
+    assert decoded_shape(frame) == (360, 640)
+    assert frame.mime_type == "image/webp"
+    assert frame.data_url.startswith("data:image/webp;base64,")
+    # Estimated from the pixel ratio, 1080p has 9x the pixels of 360p
+    assert frame.source_bytes == 9 * len(frame.data)
+
+
+def test_frames_are_never_upscaled():
+    frame = FrameEncoding(height=720).encode(make_frame(240, 320))
+
+    assert decoded_shape(frame) == (240, 320)
+    # Same resolution, nothing counted as saved
+    assert frame.source_bytes == len(frame.data)
+
+
+def test_unknown_frame_format_is_rejected():
+    with pytest.raises(ValueError):
+        FrameEncoding(image_format="gif")
+
+
+def test_oversized_sources_are_re_encoded_for_gemini(monkeypatch):
+    monkeypatch.setattr(main, "GEMINI_CLIP_HEIGHT", 720)
+    monkeypatch.setattr(main, "GEMINI_CLIP_FPS", 0)
+
+    assert main.exceeds_clip_target({"height": 1080, "fps": 30})
+    assert not main.exceeds_clip_target({"height": 720, "fps": 60})
+    assert not main.exceeds_clip_target({"height": None})
+
+    cmd = main.build_clip_command("in.mp4", [0.0, 5.0], 2.0, ["a.mp4", "b.mp4"], stream_copy=False)
+    assert cmd.count("scale=-2:'min(720,ih)'") == 2
+    copy_cmd = main.build_clip_command("in.mp4", [0.0], 2.0, ["a.mp4"], stream_copy=True)
+    assert "-vf" not in copy_cmd
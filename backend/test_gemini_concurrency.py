@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Tests for Gemini analysis: per-clip concurrency, early exit and combined requests
+Uses a local fake Gemini model with injected latency, no API key or network needed
+"""
+
+import asyncio
+import json
+import os
+import time
+
+import main
+
+LATENCY = 0.5  # seconds per fake Gemini call
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """Stand-in for genai.GenerativeModel that sleeps instead of calling the API"""
+
+    def __init__(self, model_name, latency=LATENCY, severities=(0, 3, 1), latencies=None):
+        self.model_name = model_name
+        self.latency = latency
+        self.severities = list(severities)
+        self.latencies = list(latencies) if latencies else None
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.cancelled = 0
+
+    async def generate_content_async(self, content):
+        severity = self.severities[self.calls % len(self.severities)]
+        latency = self.latencies[self.calls % len(self.latencies)] if self.latencies else self.latency
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(latency)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.in_flight -= 1
+        return FakeResponse(json.dumps({
+            "status": "nsfw" if severity else "safe",
+            "categories": ["violence"] if severity else [],
+            "severity": severity,
+            "description": f"fake clip with severity {severity}"
+        }))
+
+
+def install_fake_gemini(monkeypatch, concurrency, **kwargs):
+    """Patch main so analyze_with_gemini talks to a fresh fake model"""
+    fake = FakeGenerativeModel(main.GEMINI_MODEL, **kwargs)
+    monkeypatch.setattr(main, "GEMINI_API_KEY", "fake-key")
+    monkeypatch.setattr(main.genai, "GenerativeModel", lambda name: fake)
+    monkeypatch.setattr(main, "gemini_semaphore", asyncio.Semaphore(concurrency))
+    monkeypatch.setattr(main, "gemini_guard", main.make_provider_guard("gemini", concurrency))
+    return fake
+
+
+def install_early_exit(monkeypatch, mode, **kwargs):
+    monkeypatch.setattr(main, "early_exit_policy", main.EarlyExitPolicy(mode=mode, **kwargs))
+
+
+def make_clips(count=3):
+    return [f"clip-{i}".encode() for i in range(count)]
+
+
+def test_clips_analyzed_concurrently(monkeypatch):
+    fake = install_fake_gemini(monkeypatch, concurrency=6)
+
+    start = time.perf_counter()
+    result = asyncio.run(main.analyze_with_gemini(make_clips(3)))
+    elapsed = time.perf_counter() - start
+
+    assert fake.calls == 3
+    assert fake.max_in_flight == 3
+    # Close to one round-trip, far from the three a serial loop would take
+    assert elapsed < LATENCY * 1.8, f"took {elapsed:.2f}s"
+    # Aggregation still keeps the most severe clip
+    assert result.method == "gemini"
+    assert result.severity == 3
+    assert result.status == "nsfw"
+
+
+def test_concurrency_limit_is_respected(monkeypatch):
+    fake = install_fake_gemini(monkeypatch, concurrency=1, latency=0.1)
+
+    start = time.perf_counter()
+    result = asyncio.run(main.analyze_with_gemini(make_clips(3)))
+    elapsed = time.perf_counter() - start
+
+    assert fake.max_in_flight == 1
+    assert elapsed >= 0.3
+    assert result.severity == 3
+
+
+def test_failed_clips_are_skipped(monkeypatch):
+    fake = install_fake_gemini(monkeypatch, concurrency=6, latency=0.05)
+
+    async def flaky(content):
+        fake.calls += 1
+        if fake.calls == 2:
+            raise RuntimeError("simulated Gemini error")
+        return FakeResponse('```json\n{"status": "safe", "categories": [], "severity": 0, "description": "ok"}\n```')
+
+    fake.generate_content_async = flaky
+    result = asyncio.run(main.analyze_with_gemini(make_clips(3)))
+
+    assert result.status == "safe"
+    assert result.categories == ["other"]
+
+
+def test_max_severity_short_circuits(monkeypatch):
+    fake = install_fake_gemini(monkeypatch, concurrency=6, severities=(5, 0, 1), latencies=(0.05, 2, 2))
+    install_early_exit(monkeypatch, "max_severity", block_severity=5)
+
+    start = time.perf_counter()
+    result = asyncio.run(main.analyze_with_gemini(make_clips(3)))
+    elapsed = time.perf_counter() - start
+
+    assert result.severity == 5
+    assert elapsed < 1, f"took {elapsed:.2f}s"
+    assert fake.cancelled == 2
+    assert fake.in_flight == 0
+    assert main.early_exit_policy.stats["early_exits"] == 1
+    assert main.early_exit_policy.stats["clips_cancelled"] == 2
+
+
+def test_first_nsfw_wins(monkeypatch):
+    fake = install_fake_gemini(monkeypatch, concurrency=6, severities=(0, 2, 5), latencies=(0.05, 0.1, 2))
+    install_early_exit(monkeypatch, "first_nsfw")
+
+    result = asyncio.run(main.analyze_with_gemini(make_clips(3)))
+
+    # Stops at the first nsfw clip, without waiting for the slower, more severe one
+    assert result.status == "nsfw"
+    assert result.severity == 2
+    assert fake.cancelled == 1
+
+
+def test_quorum_waits_for_enough_nsfw_clips(monkeypatch):
+    fake = install_fake_gemini(monkeypatch, concurrency=6, severities=(2, 0, 3, 4), latencies=(0.05, 0.1, 0.15, 2))
+    install_early_exit(monkeypatch, "quorum", quorum=2)
+
+    result = asyncio.run(main.analyze_with_gemini(make_clips(4)))
+
+    assert result.severity == 3
+    assert fake.cancelled == 1
+
+
+def test_early_exit_off_waits_for_every_clip(monkeypatch):
+    fake = install_fake_gemini(monkeypatch, concurrency=6, severities=(5, 0, 1), latencies=(0.05, 0.2, 0.2))
+    install_early_exit(monkeypatch, "off")
+
+    result = asyncio.run(main.analyze_with_gemini(make_clips(3)))
+
+    assert result.severity == 5
+    assert fake.cancelled == 0
+    assert fake.calls == 3
+
+
+class CombinedFakeModel:
+    """Answers a combined request with a fixed reply and remembers what it was sent"""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.requests = []
+
+    async def generate_content_async(self, content):
+        self.requests.append(content)
+        return FakeResponse(json.dumps(self.reply))
+
+
+def install_combined_fake(monkeypatch, reply):
+    fake = CombinedFakeModel(reply)
+    install_fake_gemini(monkeypatch, concurrency=6)
+    monkeypatch.setattr(main.genai, "GenerativeModel", lambda name: fake)
+    return fake
+
+
+def test_combined_request_sends_every_clip_once(monkeypatch):
+    fake = install_combined_fake(monkeypatch, {"segments": [
+        {"index": 0, "status": "safe", "categories": [], "severity": 0, "description": "calm"},
+        {"index": 1, "status": "nsfw", "categories": ["weapons"], "severity": 3, "description": "a rifle"},
+        {"index": 7, "status": "nsfw", "categories": ["violence"], "severity": 5, "description": "no such clip"},
+    ]})
+
+    result = asyncio.run(main.analyze_combined_with_gemini(make_clips(3), 3))
+
+    assert len(fake.requests) == 1
+    prompt, *videos = fake.requests[0]
+    assert "3 clip(s)" in prompt
+    assert [video["data"] for video in videos] == make_clips(3)
+    # The verdict for a clip that wasn't sent is ignored
+    assert (result.status, result.severity, result.categories) == ("nsfw", 3, ["weapons"])
+
+
+def test_combined_request_accepts_single_verdict(monkeypatch):
+    install_combined_fake(monkeypatch, {"status": "nsfw", "categories": ["profanity"], "severity": 2, "description": "swearing"})
+    result = asyncio.run(main.analyze_combined_with_gemini(make_clips(2), 2))
+    assert (result.status, result.severity) == ("nsfw", 2)
+
+    install_combined_fake(monkeypatch, {"segments": []})
+    assert asyncio.run(main.analyze_combined_with_gemini(make_clips(2), 2)) is None
+
+
+def test_proxy_joins_clips_into_one_small_video():
+    video = os.path.join(os.path.dirname(__file__), "test_video.mp4")
+    probe = {"duration": 5.0, "format_name": "mp4", "video_codec": "h264", "has_audio": None}
+
+    proxy, count, layout = asyncio.run(main.extract_gemini_proxy(video, num_clips=3, probe=probe))
+
+    assert count == 3
+    assert 0 < len(proxy) < os.path.getsize(video)
+    assert "clip 2 is" in layout
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Tests for hedged primary/fallback races and the censored latency budget
+"""
+
+import asyncio
+
+from hedging import HedgePolicy, hedged_race, censored_percentile, HEDGE_STATIC, HEDGE_ADAPTIVE
+
+
+def path(result=None, delay=0.0, error=None, events=None, name=""):
+    """Coroutine factory that sleeps, then returns result or raises error, logging its fate"""
+    async def run():
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            if events is not None:
+                events.append(f"{name} cancelled")
+            raise
+        if error:
+            raise error
+        return result
+    return run
+
+
+def test_primary_wins_before_the_budget():
+    policy = HedgePolicy(mode=HEDGE_STATIC, after_seconds=1)
+    result = asyncio.run(hedged_race(path("primary", 0.01), path("fallback"), policy))
+
+    assert result == "primary"
+    assert policy.stats["primary_wins"] == 1 and policy.stats["hedges_started"] == 0
+    assert len(policy._latencies) == 1 and policy._latencies[0][1] is False
+
+
+def test_fallback_wins_and_primary_is_recorded_as_censored():
+    events = []
+    policy = HedgePolicy(mode=HEDGE_STATIC, after_seconds=0.05)
+    result = asyncio.run(hedged_race(path("primary", 1, events=events, name="primary"),
+                                     path("fallback", 0.01), policy))
+
+    assert result == "fallback"
+    assert events == ["primary cancelled"]
+    assert policy.stats["hedged_fallback_wins"] == 1
+    [(seconds, censored)] = policy._latencies
+    assert censored and seconds >= 0.05
+    assert policy.snapshot()["censored_samples"] == 1
+
+
+def test_primary_error_falls_back_without_recording_latency():
+    policy = HedgePolicy(mode=HEDGE_STATIC, after_seconds=1)
+    result = asyncio.run(hedged_race(path(error=RuntimeError("boom")), path("fallback"), policy))
+
+    assert result == "fallback"
+    assert policy.stats["fallback_wins"] == 1 and policy.stats["hedges_started"] == 0
+    assert len(policy._latencies) == 0
+
+
+def test_both_failing_reraises_the_fallback_error():
+    policy = HedgePolicy(mode=HEDGE_STATIC, after_seconds=1)
+    try:
+        asyncio.run(hedged_race(path(None), path(error=ValueError("fallback")), policy))
+    except ValueError as e:
+        assert str(e) == "fallback"
+    else:
+        raise AssertionError("expected the fallback error")
+    assert policy.stats["both_failed"] == 1
+
+
+def test_cancelling_the_race_cancels_both_paths_and_censors_primary():
+    events = []
+    policy = HedgePolicy(mode=HEDGE_STATIC, after_seconds=0.01)
+
+    async def main():
+        race = asyncio.create_task(hedged_race(path("primary", 5, events=events, name="primary"),
+                                               path("fallback", 5, events=events, name="fallback"), policy))
+        await asyncio.sleep(0.1)
+        race.cancel()
+        try:
+            await race
+        except asyncio.CancelledError:
+            return True
+        return False
+
+    assert asyncio.run(main())
+    assert sorted(events) == ["fallback cancelled", "primary cancelled"]
+    [(seconds, censored)] = policy._latencies
+    assert censored and seconds >= 0.1
+
+
+def test_censored_percentile_matches_empirical_without_censoring():
+    samples = [(float(i), False) for i in range(1, 101)]
+    assert censored_percentile(samples, 95) == 95
+    assert censored_percentile(samples, 50) == 50
+
+
+def test_censored_samples_push_the_budget_up():
+    fast = [(1.0, False)] * 80
+    # Ignoring the slow runs that lost the race would make 1s look like the p95
+    assert censored_percentile(fast, 95) == 1.0
+    assert censored_percentile(fast + [(10.0, True)] * 20, 95) == 10.0
+
+    policy = HedgePolicy(mode=HEDGE_ADAPTIVE, after_seconds=45, percentile=95, min_samples=20)
+    for _ in range(15):
+        policy.record_primary_latency(2.0)
+    assert policy.budget() == 45
+    for _ in range(5):
+        policy.record_primary_latency(8.0, censored=True)
+    assert policy.budget() == 8.0
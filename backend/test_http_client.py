@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared HTTP client: retry/backoff, Retry-After handling and POST retry safety
+"""
+
+import asyncio
+import logging
+import socket
+import time
+from email.utils import formatdate
+
+from aiohttp import web
+
+from http_client import HttpClient, parse_retry_after
+from jobs import post_job_callback
+
+
+async def serve(handler):
+    """Start a local server routing every request to handler, returning (runner, base_url)"""
+    app = web.Application()
+    app.router.add_route("*", "/{tail:.*}", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def scripted(responses, hits):
+    """Handler replaying (status, headers, delay) tuples, repeating the last one"""
+    async def handler(request):
+        status, headers, delay = responses[min(len(hits), len(responses) - 1)]
+        hits.append(request.method)
+        if delay:
+            await asyncio.sleep(delay)
+        return web.json_response({"attempt": len(hits)}, status=status, headers=headers)
+    return handler
+
+
+def run_against(responses, method, **kwargs):
+    hits = []
+
+    async def main():
+        runner, base = await serve(scripted(responses, hits))
+        client = HttpClient(max_retries=3, backoff_base=0.01, backoff_max=0.05)
+        try:
+            return await client.request_json(method, f"{base}/x", **kwargs), client
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    result, client = asyncio.run(main())
+    return result, client, hits
+
+
+def test_get_retries_5xx_until_success():
+    result, client, hits = run_against([(502, None, 0), (500, None, 0), (200, None, 0)], "GET")
+    assert result.status == 200 and result.data == {"attempt": 3}
+    assert len(hits) == 3
+    assert client.stats["retries"] == 2 and client.stats["errors"] == 0
+
+
+def test_retries_are_bounded_and_return_the_last_response():
+    result, client, hits = run_against([(503, None, 0)], "GET", retries=2)
+    assert result.status == 503
+    assert len(hits) == 3
+    assert client.stats["errors"] == 1
+
+
+def test_post_is_not_retried_on_server_errors():
+    result, client, hits = run_against([(500, None, 0), (200, None, 0)], "POST", json={})
+    assert result.status == 500
+    assert hits == ["POST"]
+
+
+def test_post_is_retried_when_rejected_with_429_or_503():
+    result, client, hits = run_against([(429, None, 0), (503, None, 0), (200, None, 0)], "POST", json={})
+    assert result.status == 200
+    assert len(hits) == 3
+
+
+def test_post_is_not_retried_on_timeout():
+    hits = []
+
+    async def main():
+        runner, base = await serve(scripted([(200, None, 0.5)], hits))
+        client = HttpClient(max_retries=3, backoff_base=0.01, backoff_max=0.05)
+        try:
+            await client.request_json("POST", f"{base}/x", json={}, timeout=0.1)
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    try:
+        asyncio.run(main())
+    except asyncio.TimeoutError:
+        pass
+    else:
+        raise AssertionError("expected the timeout to propagate")
+    assert len(hits) == 1
+
+
+def test_idempotent_post_and_get_are_retried_on_timeout():
+    result, client, hits = run_against([(200, None, 0.5), (200, None, 0)], "POST", json={},
+                                       timeout=0.1, idempotent=True)
+    assert result.status == 200 and len(hits) == 2
+
+    result, client, hits = run_against([(200, None, 0.5), (200, None, 0)], "GET", timeout=0.1)
+    assert result.status == 200 and len(hits) == 2
+
+
+def test_post_is_retried_when_the_connection_cannot_be_opened():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    async def main():
+        client = HttpClient(max_retries=2, backoff_base=0.01, backoff_max=0.05)
+        try:
+            await client.request_json("POST", f"http://127.0.0.1:{port}/x", json={})
+        except Exception as e:
+            return client, e
+        finally:
+            await client.close()
+
+    client, error = asyncio.run(main())
+    assert error is not None
+    assert client.stats["requests"] == 3 and client.stats["retries"] == 2
+
+
+def test_retry_after_header_sets_the_delay():
+    start = time.monotonic()
+    result, client, hits = run_against([(503, {"Retry-After": "0.3"}, 0), (200, None, 0)], "GET")
+    assert result.status == 200
+    # backoff_max caps Retry-After at 0.05s, so the server's 0.3s is not honoured in full
+    assert time.monotonic() - start < 0.3
+
+    client = HttpClient(backoff_base=0.01, backoff_max=10)
+    assert client._backoff(0, 2.5) == 2.5
+    assert client._backoff(0, 60) == 10
+
+
+def test_backoff_is_full_jitter_capped_exponential():
+    client = HttpClient(backoff_base=0.5, backoff_max=3)
+    for attempt in range(6):
+        for _ in range(50):
+            delay = client._backoff(attempt, None)
+            assert 0 <= delay <= min(3, 0.5 * 2 ** attempt)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("") is None
+    assert parse_retry_after("7") == 7
+    assert parse_retry_after("-3") == 0
+    assert parse_retry_after("soon") is None
+    delay = parse_retry_after(formatdate(time.time() + 30, usegmt=True))
+    assert 25 < delay <= 30
+    assert parse_retry_after(formatdate(time.time() - 30, usegmt=True)) == 0
+
+
+def test_job_callback_logs_rejection_as_failure(caplog):
+    hits = []
+    job = {"id": "job-1", "status": "succeeded", "result": None, "error": None}
+
+    async def main():
+        runner, base = await serve(scripted([(404, None, 0)], hits))
+        client = HttpClient(backoff_base=0.01, backoff_max=0.05)
+        try:
+            await post_job_callback(client, {**job, "callback_url": f"{base}/hook"})
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    with caplog.at_level(logging.INFO, logger="jobs"):
+        asyncio.run(main())
+    assert len(hits) == 1
+    assert not any("delivered" in r.message for r in caplog.records)
+    assert any(r.levelno == logging.ERROR and "404" in r.message for r in caplog.records)
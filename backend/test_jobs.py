@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Tests for the persistent job queue: leases, heartbeats, requeue on shutdown and attempt limits
+"""
+
+import asyncio
+import os
+import time
+
+from jobs import JobStore, JobWorkerPool, JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED, JOB_FAILED
+
+
+def make_job(tmp_path, store, name="job"):
+    upload = tmp_path / f"{name}.mp4"
+    upload.write_bytes(b"video")
+    return store.submit(str(upload), f"{name}.mp4", job_id=name), str(upload)
+
+
+def test_claim_leases_the_job_until_it_expires(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"), lease_seconds=0.2, max_attempts=3)
+    job_id, _ = make_job(tmp_path, store)
+
+    job = store.claim()
+    assert (job["id"], job["attempts"]) == (job_id, 1)
+    assert store.claim() is None
+
+    time.sleep(0.25)
+    # The worker died without renewing, another one takes over
+    retry = store.claim()
+    assert (retry["id"], retry["attempts"]) == (job_id, 2)
+    # The first attempt's lease can't be renewed any more
+    assert not store.renew(job_id, 1)
+    assert store.renew(job_id, 2)
+
+
+def test_max_attempts_fails_the_job_and_removes_its_upload(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"), lease_seconds=0.05, max_attempts=1)
+    job_id, upload = make_job(tmp_path, store)
+
+    store.claim()
+    time.sleep(0.1)
+    assert store.claim() is None
+
+    job = store.get(job_id)
+    assert job["status"] == JOB_FAILED and "maximum attempts" in job["error"]
+    assert not os.path.exists(upload)
+
+
+def run_pool(store, handler, until, timeout=5):
+    """Run a one-worker pool until until() is true, then stop it"""
+    async def main():
+        pool = JobWorkerPool(store, handler, concurrency=1, poll_interval=0.05)
+        pool.start()
+        deadline = time.monotonic() + timeout
+        while not until() and time.monotonic() < deadline:
+            await asyncio.sleep(0.02)
+        await pool.stop()
+    asyncio.run(main())
+
+
+def test_stop_requeues_the_running_job_and_keeps_its_upload(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"), lease_seconds=60)
+    job_id, upload = make_job(tmp_path, store)
+    started = []
+
+    async def handler(job):
+        started.append(job["id"])
+        await asyncio.sleep(60)
+
+    run_pool(store, handler, until=lambda: started)
+
+    job = store.get(job_id)
+    assert job["status"] == JOB_QUEUED
+    assert job["attempts"] == 0
+    assert os.path.exists(upload)
+
+
+def test_heartbeat_keeps_long_jobs_from_being_claimed_twice(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"), lease_seconds=0.3)
+    other_worker = JobStore(str(tmp_path / "jobs.db"), lease_seconds=0.3)
+    job_id, upload = make_job(tmp_path, store)
+    stolen = []
+
+    async def handler(job):
+        # Runs for three leases' worth while another worker keeps trying to claim
+        for _ in range(9):
+            await asyncio.sleep(0.1)
+            stolen.append(other_worker.claim())
+        return {"status": "safe"}
+
+    run_pool(store, handler, until=lambda: store.get(job_id)["status"] != JOB_RUNNING and stolen)
+
+    assert not any(stolen)
+    assert store.get(job_id)["status"] == JOB_SUCCEEDED
+    assert not os.path.exists(upload)
+
+
+def test_failed_job_removes_its_upload(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    job_id, upload = make_job(tmp_path, store)
+
+    async def handler(job):
+        raise ValueError("corrupt video")
+
+    run_pool(store, handler, until=lambda: store.get(job_id)["status"] == JOB_FAILED)
+
+    assert store.get(job_id)["error"] == "corrupt video"
+    assert not os.path.exists(upload)
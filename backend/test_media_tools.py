@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Tests for the ffmpeg/ffprobe subprocess runner: output capture, timeouts and cancellation
+"""
+
+import asyncio
+import os
+import time
+
+import pytest
+
+from media_tools import run_media_tool, MediaToolError, STDERR_TAIL_BYTES
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def wait_for_pid(path, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if os.path.exists(path) and open(path).read().strip():
+            return int(open(path).read())
+        time.sleep(0.01)
+    raise AssertionError("child never wrote its pid")
+
+
+def test_captures_stdout_and_stderr_tail():
+    result = asyncio.run(run_media_tool(["sh", "-c", "printf out; printf 'x%.0s' $(seq 5000) >&2; echo end >&2"]))
+
+    assert result.returncode == 0
+    assert result.text == "out"
+    assert len(result.stderr) <= STDERR_TAIL_BYTES
+    assert result.stderr.endswith("end")
+
+
+def test_non_zero_exit_raises_with_stderr():
+    with pytest.raises(MediaToolError) as error:
+        asyncio.run(run_media_tool(["sh", "-c", "echo 'Invalid data found' >&2; exit 3"]))
+
+    assert error.value.returncode == 3
+    assert not error.value.timed_out
+    assert "Invalid data found" in error.value.stderr
+
+
+def test_timeout_kills_the_process_and_keeps_the_stderr_tail(tmp_path):
+    pid_file = tmp_path / "pid"
+    cmd = ["sh", "-c", f"echo $$ > {pid_file}; echo 'frame=  120 speed=0.1x' >&2; exec sleep 30"]
+
+    start = time.monotonic()
+    with pytest.raises(MediaToolError) as error:
+        asyncio.run(run_media_tool(cmd, timeout=0.5))
+
+    assert time.monotonic() - start < 5
+    assert error.value.timed_out and error.value.returncode is None
+    assert "frame=  120 speed=0.1x" in error.value.stderr
+    assert "speed=0.1x" in str(error.value)
+    assert not pid_alive(wait_for_pid(pid_file))
+
+
+def test_cancellation_terminates_the_child(tmp_path):
+    pid_file = tmp_path / "pid"
+    cmd = ["sh", "-c", f"echo $$ > {pid_file}; exec sleep 30"]
+
+    async def scenario():
+        task = asyncio.create_task(run_media_tool(cmd, timeout=60))
+        pid = await asyncio.get_running_loop().run_in_executor(None, wait_for_pid, pid_file)
+        assert pid_alive(pid)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return pid
+
+    start = time.monotonic()
+    pid = asyncio.run(scenario())
+    assert time.monotonic() - start < 5
+    assert not pid_alive(pid)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Tests for Prometheus multiprocess mode: one scrape aggregates every uvicorn worker
+"""
+
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+WORKER = """
+from metrics import ANALYSES_IN_FLIGHT, UPLOAD_BYTES, record_analysis
+record_analysis("pipeline", "gemini", "safe", [])
+UPLOAD_BYTES.labels("gemini").inc(1000)
+ANALYSES_IN_FLIGHT.inc()
+"""
+
+SCRAPE = """
+import os
+from metrics import mark_worker_dead, metrics_payload
+mark_worker_dead(int(os.environ["DEAD_PID"]))
+print(metrics_payload().decode())
+"""
+
+
+def run(code, multiproc_dir, **env):
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=HERE, capture_output=True, text=True, check=True,
+        env={**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(multiproc_dir), **env}
+    )
+    return result.stdout
+
+
+def sample(text, prefix):
+    return [float(line.rsplit(" ", 1)[1]) for line in text.splitlines() if line.startswith(prefix)]
+
+
+def test_scrape_sums_counters_across_workers(tmp_path):
+    for _ in range(2):
+        run(WORKER, tmp_path)
+    assert len(list(tmp_path.glob("counter_*.db"))) == 2
+
+    text = run(SCRAPE, tmp_path, DEAD_PID="0")
+
+    assert sample(text, 'nsfw_analyses_total{method="gemini",source="pipeline",status="safe"}') == [2.0]
+    assert sample(text, 'nsfw_provider_upload_bytes_total{provider="gemini"}') == [2000.0]
+
+
+def test_dead_workers_drop_out_of_live_gauges(tmp_path):
+    run(WORKER, tmp_path)
+    pid = next(tmp_path.glob("gauge_livesum_*.db")).stem.rsplit("_", 1)[1]
+
+    text = run(SCRAPE, tmp_path, DEAD_PID=pid)
+
+    assert sample(text, "nsfw_analyses_in_flight") in ([], [0.0])
+    assert sample(text, 'nsfw_analyses_total{method="gemini",source="pipeline",status="safe"}') == [1.0]
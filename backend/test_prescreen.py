@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Tests for the local pre-screen: blank/slide detection, the audio rule and the optional classifier
+"""
+
+import asyncio
+import threading
+
+import numpy as np
+
+from prescreen import Prescreener, skin_ratio, PRESCREEN_SAFE, PRESCREEN_NSFW
+
+SKIN = (224, 172, 140)
+
+
+def solid(colour, count=4, size=32):
+    return np.tile(np.array(colour, np.uint8), (count, size, size, 1))
+
+
+def noise(count=4, size=32, seed=0):
+    """Detailed frames with no red, so nothing is skin toned"""
+    frames = np.random.default_rng(seed).integers(0, 256, (count, size, size, 3), dtype=np.uint8)
+    frames[..., 0] = 0
+    return frames
+
+
+class FakeClassifier:
+    def __init__(self, score):
+        self.score = score
+
+    def nsfw_scores(self, thumbs):
+        return np.full(len(thumbs), self.score)
+
+
+def test_blank_silent_video_is_safe():
+    verdict = Prescreener().evaluate(solid((10, 10, 10)), has_audio=False)
+    assert verdict["status"] == PRESCREEN_SAFE
+
+
+def test_blank_video_with_audio_escalates():
+    prescreener = Prescreener()
+    assert prescreener.evaluate(solid((10, 10, 10)), has_audio=True) is None
+    # Unknown audio counts as audio
+    assert prescreener.evaluate(solid((10, 10, 10)), has_audio=None) is None
+    assert Prescreener(require_silent=False).evaluate(solid((10, 10, 10)), has_audio=True)["status"] == PRESCREEN_SAFE
+
+
+def test_detailed_video_escalates_without_classifier():
+    assert Prescreener().evaluate(noise(), has_audio=False) is None
+
+
+def test_classifier_flags_explicit_frames_even_with_audio():
+    verdict = Prescreener(classifier=FakeClassifier(0.99)).evaluate(noise(), has_audio=True)
+    assert verdict["status"] == PRESCREEN_NSFW
+    assert verdict["severity"] == 5
+
+
+def test_classifier_safe_needs_little_skin():
+    prescreener = Prescreener(classifier=FakeClassifier(0.01))
+    assert prescreener.evaluate(noise(), has_audio=False)["status"] == PRESCREEN_SAFE
+
+    assert skin_ratio(noise()).max() == 0
+    skin = noise()
+    skin[:, :16] = SKIN
+    assert skin_ratio(skin).min() > 0.4
+    assert prescreener.evaluate(skin, has_audio=False) is None
+
+
+def test_screen_uses_given_thumbnails_and_counts_outcomes():
+    prescreener = Prescreener()
+    asyncio.run(prescreener.screen("/nonexistent.mp4", False, solid((0, 0, 0))))
+    asyncio.run(prescreener.screen("/nonexistent.mp4", False, noise()))
+    # No thumbnails: decoding the missing file fails and the video escalates
+    asyncio.run(prescreener.screen("/nonexistent.mp4", False))
+
+    snapshot = prescreener.snapshot()
+    assert (snapshot["local_safe"], snapshot["escalated"], snapshot["errors"]) == (1, 2, 1)
+
+
+def test_screen_evaluates_off_the_event_loop():
+    prescreener = Prescreener()
+    threads = []
+    evaluate = prescreener.evaluate
+
+    def recording_evaluate(thumbs, has_audio):
+        threads.append(threading.get_ident())
+        return evaluate(thumbs, has_audio)
+
+    prescreener.evaluate = recording_evaluate
+    verdict = asyncio.run(prescreener.screen("/nonexistent.mp4", False, solid((0, 0, 0))))
+
+    assert verdict["status"] == PRESCREEN_SAFE
+    assert threads and threads[0] != threading.get_ident()
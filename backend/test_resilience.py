@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-provider circuit breakers and adaptive concurrency limits
+Uses the fake Gemini model from the concurrency tests, no API key or network needed
+"""
+
+import asyncio
+
+import pytest
+
+import main
+from resilience import (
+    AdaptiveLimiter, CircuitBreaker, ProviderGuard, ProviderUnavailable,
+    BREAKER_CLOSED, BREAKER_OPEN, BREAKER_HALF_OPEN
+)
+from test_gemini_concurrency import install_fake_gemini, make_clips
+
+
+def test_breaker_opens_then_probes(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr("resilience.time.monotonic", lambda: clock[0])
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=10)
+
+    for _ in range(3):
+        assert breaker.acquire()
+        breaker.record_failure()
+    assert breaker.state == BREAKER_OPEN
+    assert not breaker.acquire()
+
+    clock[0] = 10
+    assert breaker.acquire()
+    assert breaker.state == BREAKER_HALF_OPEN
+    # Only one probe at a time while half-open
+    assert not breaker.acquire()
+    breaker.record_failure()
+    assert breaker.state == BREAKER_OPEN
+
+    clock[0] = 20
+    assert breaker.acquire()
+    breaker.record_success()
+    assert breaker.state == BREAKER_CLOSED
+    assert breaker.stats["opened"] == 2
+
+
+def test_limiter_backs_off_and_recovers():
+    limiter = AdaptiveLimiter(min_limit=1, max_limit=8, cooldown=0)
+
+    limiter.record_congestion()
+    assert int(limiter.limit) == 4
+    for _ in range(3):
+        limiter.record_congestion()
+    assert int(limiter.limit) == 1
+
+    # Additive increase: about one step per limit's worth of successes
+    for _ in range(10):
+        limiter.record_success(0.1)
+    assert 3 <= int(limiter.limit) <= 4
+
+
+def test_limiter_bounds_in_flight_calls():
+    limiter = AdaptiveLimiter(min_limit=1, max_limit=2, latency_tolerance=0)
+    in_flight = []
+
+    async def call():
+        await limiter.acquire()
+        in_flight.append(limiter.in_flight)
+        await asyncio.sleep(0.01)
+        limiter.release()
+
+    async def run():
+        await asyncio.gather(*(call() for _ in range(6)))
+
+    asyncio.run(run())
+    assert max(in_flight) == 2
+    assert limiter.in_flight == 0
+
+
+def test_gemini_outage_opens_circuit_and_skips_calls(monkeypatch):
+    fake = install_fake_gemini(monkeypatch, concurrency=6, latency=0.01)
+    guard = ProviderGuard("gemini", CircuitBreaker(failure_threshold=3, reset_seconds=60),
+                          AdaptiveLimiter(max_limit=6))
+    monkeypatch.setattr(main, "gemini_guard", guard)
+
+    async def outage(content):
+        fake.calls += 1
+        raise RuntimeError("503 service unavailable")
+
+    fake.generate_content_async = outage
+    assert asyncio.run(main.analyze_with_gemini(make_clips(3))) is None
+    assert guard.breaker.state == BREAKER_OPEN
+    assert fake.calls == 3
+    assert int(guard.limiter.limit) < 6
+
+    # While open, clips are rejected without reaching the provider
+    assert asyncio.run(main.analyze_with_gemini(make_clips(3))) is None
+    assert fake.calls == 3
+    assert guard.breaker.stats["rejected"] == 3
+
+
+def test_cancelled_calls_are_not_failures():
+    guard = ProviderGuard("test", CircuitBreaker(failure_threshold=1), AdaptiveLimiter(max_limit=4))
+
+    async def run():
+        async def hang():
+            async with guard.slot():
+                await asyncio.sleep(10)
+
+        task = asyncio.create_task(hang())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert guard.breaker.state == BREAKER_CLOSED
+    assert guard.stats["cancelled"] == 1
+    assert guard.limiter.in_flight == 0
+
+
+def test_open_slot_raises():
+    guard = ProviderGuard("test", CircuitBreaker(failure_threshold=1), AdaptiveLimiter(max_limit=4))
+    guard.breaker.record_failure()
+
+    async def run():
+        async with guard.slot():
+            pass
+
+    with pytest.raises(ProviderUnavailable):
+        asyncio.run(run())
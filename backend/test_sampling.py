@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Tests for scene-aware sampling: shot-cut detection and distinct shot selection
+"""
+
+import asyncio
+import os
+
+import numpy as np
+
+from sampling import Thumbnails, color_histograms, histogram_distance, select_distinct_shots, plan_scene_samples
+
+FPS = 2.0
+RED, GREEN, BLUE, DARK_RED = (220, 20, 20), (20, 200, 20), (20, 20, 220), (200, 30, 30)
+
+
+def shots(*spec):
+    """Histograms for consecutive solid-colour shots given as (colour, samples) pairs"""
+    thumbs = np.concatenate([np.tile(np.array(colour, np.uint8), (count, 8, 8, 1)) for colour, count in spec])
+    return color_histograms(thumbs)
+
+
+def test_histograms_are_normalised_and_separate_colours():
+    hists = shots((RED, 1), (GREEN, 1), (DARK_RED, 1))
+
+    assert np.allclose(hists.sum(axis=1), 1)
+    assert histogram_distance(hists[0], hists[1]) == 1.0
+    assert histogram_distance(hists[0], hists[2]) == 0.0
+
+
+def test_cuts_split_shots_and_each_shot_is_sampled():
+    plan = select_distinct_shots(shots((RED, 10), (GREEN, 4), (BLUE, 6)), FPS, budget=3,
+                                 cut_threshold=0.35, duplicate_threshold=0.15)
+
+    assert plan.num_shots == 3
+    assert plan.num_samples == 20
+    # The longest shot leads, then one sample from the middle of each other shot
+    assert plan.timestamps[0] == 4 / FPS
+    assert plan.top(3) == [4 / FPS, 11 / FPS, 16 / FPS]
+
+
+def test_single_shot_video_yields_fewer_samples_than_budget():
+    plan = select_distinct_shots(shots((RED, 20)), FPS, budget=3, cut_threshold=0.35, duplicate_threshold=0.15)
+
+    assert plan.num_shots == 1
+    assert plan.timestamps == [9 / FPS]
+
+
+def test_near_duplicate_shots_are_dropped():
+    # A cut back to the same colour: three shots, but the third adds nothing new
+    plan = select_distinct_shots(shots((RED, 10), (GREEN, 10), (RED, 10)), FPS, budget=4,
+                                 cut_threshold=0.35, duplicate_threshold=0.15)
+
+    assert plan.num_shots == 3
+    assert sorted(plan.timestamps) == [4 / FPS, 14 / FPS]
+
+
+def test_min_picks_tops_up_with_evenly_spaced_samples():
+    plan = select_distinct_shots(shots((RED, 20)), FPS, budget=4, cut_threshold=0.35,
+                                 duplicate_threshold=0.15, min_picks=3)
+
+    assert len(plan.timestamps) == 3
+    # The shot's middle first, then evenly spaced picks covering the start and end
+    assert plan.timestamps[0] == 9 / FPS
+    assert plan.top(3) == [0.0, 9 / FPS, 19 / FPS]
+
+
+def test_plan_from_a_real_video():
+    video = os.path.join(os.path.dirname(__file__), "test_video.mp4")
+    plan = asyncio.run(plan_scene_samples(video, budget=3, fps=FPS))
+
+    assert plan is not None
+    assert 1 <= len(plan.top(3)) <= 3
+    assert all(0 <= t <= 5 for t in plan.timestamps)
+
+
+def test_shared_thumbnails_slice_by_time_and_rate():
+    thumbnails = Thumbnails(np.arange(20).reshape(20, 1, 1, 1), fps=2.0)
+
+    segment = thumbnails.between(3.0, 6.0)
+    assert segment.frames.ravel().tolist() == [6, 7, 8, 9, 10, 11]
+    assert thumbnails.between(8.5).frames.ravel().tolist() == [17, 18, 19]
+
+    slower = segment.at_fps(1.0)
+    assert slower.fps == 1.0
+    assert slower.frames.ravel().tolist() == [6, 8, 10]
+
+    shrunk = Thumbnails(np.full((2, 128, 128, 3), 200, np.uint8), fps=2.0).shrink(64)
+    assert shrunk.frames.shape == (2, 64, 64, 3) and shrunk.fps == 2.0
+    assert (shrunk.frames == 200).all()
+    assert shrunk.shrink(128) is shrunk
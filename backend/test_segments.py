@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Tests for long-video segmentation and verdict merging
+Splitting runs the real ffmpeg on the bundled test video
+"""
+
+import asyncio
+import os
+
+import pytest
+from fastapi import HTTPException
+
+import main
+from segments import Segment, plan_segments, split_video
+
+VIDEO = os.path.join(os.path.dirname(__file__), "test_video.mp4")
+
+
+def test_plan_balances_segments_and_spreads_budget():
+    assert plan_segments(61, 60, 30, 3, 3) == (31, 3, 3)
+    assert plan_segments(300, 60, 30, 3, 3) == (60, 3, 3)
+    # 30 one-minute segments use up the budget at one clip each
+    assert plan_segments(1800, 60, 30, 3, 3) == (60, 1, 1)
+    # Beyond that, segments get longer instead of exceeding the budget
+    assert plan_segments(7200, 60, 30, 3, 3) == (240, 1, 1)
+    assert plan_segments(7200, 60, 0, 3, 5) == (60, 3, 5)
+
+
+def test_split_covers_the_whole_video(tmp_path):
+    segments = asyncio.run(split_video(VIDEO, str(tmp_path), 2))
+
+    assert len(segments) >= 2
+    assert segments[0].start == 0
+    for previous, current in zip(segments, segments[1:]):
+        assert current.start == pytest.approx(previous.end, abs=0.05)
+    assert all(os.path.getsize(segment.path) > 0 for segment in segments)
+
+
+def verdict(status, severity, categories=(), method="gemini"):
+    return main.AnalysisResult(method=method, status=status, categories=list(categories),
+                               severity=severity, description=f"{status} {severity}")
+
+
+def test_merge_reports_flagged_ranges():
+    results = [
+        (Segment("a", 0, 60), verdict("safe", 0, method="local")),
+        (Segment("c", 120, 180), verdict("nsfw", 2, ["profanity"])),
+        (Segment("b", 60, 120), verdict("nsfw", 4, ["violence", "weapons"])),
+    ]
+    merged = main.merge_segment_results(results, failed=0, total=3, duration=180)
+
+    assert merged.status == "nsfw"
+    assert merged.severity == 4
+    assert merged.categories == ["violence", "weapons", "profanity"]
+    assert merged.description.startswith("Flagged at 01:00-02:00, 02:00-03:00.")
+    assert [(s.start, s.severity) for s in merged.flagged_segments] == [(60, 4), (120, 2)]
+
+
+def test_merge_refuses_safe_verdict_with_failed_segments():
+    results = [(Segment("a", 0, 60), verdict("safe", 0))]
+    with pytest.raises(HTTPException):
+        main.merge_segment_results(results, failed=1, total=2, duration=120)
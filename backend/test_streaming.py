@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Tests for the server-sent events analysis stream and the NDJSON batch endpoint
+Uses the fake Gemini model from the concurrency tests, no API key or network needed
+"""
+
+import asyncio
+import json
+import os
+import shutil
+
+from fastapi.testclient import TestClient
+
+import main
+from test_gemini_concurrency import FakeGenerativeModel, FakeResponse, install_fake_gemini, install_early_exit
+
+VIDEO = os.path.join(os.path.dirname(__file__), "test_video.mp4")
+
+
+async def fake_probe(path):
+    return {"duration": 5.0, "format_name": "mov,mp4", "video_codec": "h264", "has_audio": True}
+
+
+def isolate_pipeline(monkeypatch):
+    """Skip caching, fingerprinting and scene planning so every run reaches Gemini"""
+    monkeypatch.setattr(main, "probe_video", fake_probe)
+    monkeypatch.setattr(main, "result_cache", None)
+    monkeypatch.setattr(main, "fingerprint_index", None)
+    monkeypatch.setattr(main, "SCENE_SAMPLING", False)
+
+
+def parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_stream_emits_clips_then_result(monkeypatch):
+    isolate_pipeline(monkeypatch)
+    install_fake_gemini(monkeypatch, concurrency=6, latency=0.05)
+
+    with open(VIDEO, "rb") as f:
+        response = TestClient(main.app).post("/analyze/stream", files={"file": ("test_video.mp4", f, "video/mp4")})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    names = [name for name, _ in events]
+    assert names.count("clip") == 3
+    assert names[-1] == "result"
+    assert sorted(data["index"] for name, data in events if name == "clip") == [0, 1, 2]
+    assert events[-1][1]["method"] == "gemini"
+    assert events[-1][1]["severity"] == 3
+
+
+class StaggeredModel(FakeGenerativeModel):
+    """First clip answers immediately, the rest hang until cancelled"""
+
+    def __init__(self, model_name):
+        super().__init__(model_name)
+        self.cancelled = 0
+
+    async def generate_content_async(self, content):
+        self.calls += 1
+        if self.calls == 1:
+            return FakeResponse(json.dumps({
+                "status": "nsfw", "categories": ["violence"], "severity": 5, "description": "early hit"
+            }))
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+def test_closing_stream_cancels_outstanding_work(monkeypatch, tmp_path):
+    isolate_pipeline(monkeypatch)
+    install_fake_gemini(monkeypatch, concurrency=6)
+    # Without early exit only the disconnect can cancel the hanging clips
+    install_early_exit(monkeypatch, "off")
+    fake = StaggeredModel(main.GEMINI_MODEL)
+    monkeypatch.setattr(main.genai, "GenerativeModel", lambda name: fake)
+
+    upload_path = str(tmp_path / "upload.mp4")
+    shutil.copy(VIDEO, upload_path)
+    upload = main.UploadInfo(upload_path, os.path.getsize(upload_path), None, None)
+    before_close = {}
+
+    async def consume_first_event():
+        stream = main.stream_analysis_events(upload, "upload.mp4")
+        first = await stream.__anext__()
+        await asyncio.sleep(0.3)
+        before_close.update(calls=fake.calls, cancelled=fake.cancelled)
+        # Client acts on the early high-severity hit and disconnects
+        await stream.aclose()
+        return first
+
+    first = asyncio.run(asyncio.wait_for(consume_first_event(), timeout=10))
+
+    assert first.startswith("event: clip")
+    assert '"severity": 5' in first
+    assert before_close == {"calls": 3, "cancelled": 0}
+    assert fake.cancelled == 2
+    assert not os.path.exists(upload_path)
+
+
+def install_fake_batch_analysis(monkeypatch, delays):
+    """Replace per-file analysis with a fake that sleeps per filename, failing for names starting with bad"""
+    monkeypatch.setattr(main, "probe_video", fake_probe)
+    started = []
+
+    async def fake_analyze(path, filename, sha256, probe):
+        started.append(filename)
+        await asyncio.sleep(delays.get(filename, 0))
+        if filename.startswith("bad"):
+            raise RuntimeError("decoder exploded")
+        return main.AnalysisResult(method="gemini", status="safe", categories=[], severity=0, description=filename)
+
+    monkeypatch.setattr(main, "analyze_saved_video", fake_analyze)
+    return started
+
+
+def post_batch(names, sizes=None):
+    files = [("files", (name, b"v" * (sizes or {}).get(name, 64), "video/mp4")) for name in names]
+    response = TestClient(main.app).post("/analyze/batch", files=files)
+    lines = [json.loads(line) for line in response.text.splitlines()] if response.status_code == 200 else []
+    return response, lines
+
+
+def test_batch_reports_each_file_and_tags_results_with_upload_order(monkeypatch):
+    # The first upload finishes last, results stream in completion order
+    install_fake_batch_analysis(monkeypatch, {"slow.mp4": 0.3})
+    response, lines = post_batch(["slow.mp4", "fast.mp4", "other.mp4"])
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert lines[-1]["filename"] == "slow.mp4"
+    assert sorted((line["index"], line["filename"]) for line in lines) == [
+        (0, "slow.mp4"), (1, "fast.mp4"), (2, "other.mp4")
+    ]
+    assert all(line["result"]["description"] == line["filename"] for line in lines)
+
+
+def test_batch_failures_stay_with_their_file(monkeypatch):
+    install_fake_batch_analysis(monkeypatch, {})
+    monkeypatch.setattr(main, "MAX_UPLOAD_SIZE", 1000)
+    response, lines = post_batch(["good.mp4", "bad.mp4", "huge.mp4", "also_good.mp4"], sizes={"huge.mp4": 5000})
+
+    assert response.status_code == 200
+    by_index = {line["index"]: line for line in lines}
+    assert sorted(by_index) == [0, 1, 2, 3]
+    assert by_index[0]["result"]["status"] == "safe" and "error" not in by_index[0]
+    assert by_index[1]["error"] == "Analysis failed: decoder exploded"
+    assert "exceeds maximum size" in by_index[2]["error"] and "result" not in by_index[2]
+    assert by_index[3]["result"]["description"] == "also_good.mp4"
+
+
+def test_batch_rejects_too_many_files(monkeypatch):
+    started = install_fake_batch_analysis(monkeypatch, {})
+    monkeypatch.setattr(main, "BATCH_MAX_FILES", 2)
+    response, _ = post_batch(["a.mp4", "b.mp4", "c.mp4"])
+
+    assert response.status_code == 400
+    assert "At most 2 files" in response.json()["detail"]
+    assert started == []
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Tests for request tracing: span trees, context propagation, OTLP JSON and the ASGI middleware
+"""
+
+import asyncio
+
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from tracing import (
+    Trace, TracingMiddleware, current_span, span, set_attribute, tracing_active, to_otlp_json,
+    SPAN_KIND_SERVER, SPAN_KIND_CLIENT, STATUS_OK, STATUS_ERROR,
+)
+
+
+def test_spans_nest_and_propagate_into_tasks():
+    trace = Trace()
+    root = trace.start("request", None, SPAN_KIND_SERVER)
+
+    async def child(name):
+        with span(name, SPAN_KIND_CLIENT) as traced:
+            await asyncio.sleep(0)
+            set_attribute("worker", name)
+            return traced
+
+    async def scenario():
+        token = current_span.set(root)
+        try:
+            with span("stage") as stage:
+                # Tasks copy the context, so each child hangs off the stage that spawned it
+                first, second = await asyncio.gather(child("a"), child("b"))
+            try:
+                with span("failing"):
+                    raise ValueError("boom")
+            except ValueError:
+                pass
+            return stage, first, second
+        finally:
+            current_span.reset(token)
+
+    stage, first, second = asyncio.run(scenario())
+    root.end()
+
+    by_name = {item.name: item for item in trace.spans}
+    assert root.parent_id is None
+    assert stage.parent_id == root.span_id
+    assert first.parent_id == second.parent_id == stage.span_id
+    assert by_name["failing"].parent_id == root.span_id
+    assert first.attributes == {"worker": "a"}
+    assert by_name["failing"].status == STATUS_ERROR and by_name["failing"].message == "ValueError: boom"
+    assert all(item.end_ns >= item.start_ns for item in trace.spans)
+
+
+def test_untraced_code_records_nothing():
+    with span("stage") as traced:
+        set_attribute("ignored", 1)
+    assert traced is None
+    assert not tracing_active()
+
+
+def test_otlp_json_shape():
+    trace = Trace()
+    root = trace.start("GET /health", None, SPAN_KIND_SERVER)
+    root.attributes.update({"http.status_code": 200, "cache.hit": True, "ratio": 0.5, "path": "/health"})
+    child = trace.start("probe", root)
+    child.end(RuntimeError("failed"))
+    root.end()
+
+    payload = to_otlp_json(trace)
+    [resource_spans] = payload["resourceSpans"]
+    assert resource_spans["resource"]["attributes"] == [{"key": "service.name", "value": {"stringValue": "nsfw-analyzer"}}]
+    [scope_spans] = resource_spans["scopeSpans"]
+    otlp_root, otlp_child = scope_spans["spans"]
+
+    assert otlp_root["traceId"] == otlp_child["traceId"] == trace.trace_id
+    assert len(trace.trace_id) == 32 and len(otlp_root["spanId"]) == 16
+    assert "parentSpanId" not in otlp_root
+    assert otlp_child["parentSpanId"] == otlp_root["spanId"]
+    assert otlp_root["kind"] == SPAN_KIND_SERVER
+    assert isinstance(otlp_root["startTimeUnixNano"], str)
+    assert {item["key"]: item["value"] for item in otlp_root["attributes"]} == {
+        "http.status_code": {"intValue": "200"},
+        "cache.hit": {"boolValue": True},
+        "ratio": {"doubleValue": 0.5},
+        "path": {"stringValue": "/health"},
+    }
+    assert otlp_root["status"] == {"code": STATUS_OK}
+    assert otlp_child["status"] == {"code": STATUS_ERROR, "message": "RuntimeError: failed"}
+
+
+def make_client(sample_rate=0.0):
+    exported = []
+
+    async def exporter(payload):
+        exported.append(payload)
+
+    app = FastAPI()
+
+    @app.get("/ok")
+    async def ok():
+        with span("work"):
+            set_attribute("traced", tracing_active())
+        return {"traced": tracing_active()}
+
+    @app.get("/missing")
+    async def missing():
+        raise HTTPException(status_code=404, detail="nope")
+
+    app.add_middleware(TracingMiddleware, header="x-trace", sample_rate=sample_rate, exporter=exporter)
+    return TestClient(app), exported
+
+
+def spans_of(payload):
+    return payload["resourceSpans"][0]["scopeSpans"][0]["spans"]
+
+
+def test_middleware_traces_opted_in_requests_and_records_status():
+    client, exported = make_client()
+
+    response = client.get("/ok", headers={"x-trace": "1"})
+    assert response.json() == {"traced": True}
+    [payload] = exported
+    root, work = spans_of(payload)
+    assert response.headers["x-trace-id"] == root["traceId"]
+    assert root["name"] == "GET /ok"
+    assert {"key": "http.status_code", "value": {"intValue": "200"}} in root["attributes"]
+    assert work["parentSpanId"] == root["spanId"]
+
+    client.get("/missing", headers={"x-trace": "true"})
+    root = spans_of(exported[1])[0]
+    assert {"key": "http.status_code", "value": {"intValue": "404"}} in root["attributes"]
+
+
+def test_middleware_does_not_trace_or_export_when_disabled():
+    client, exported = make_client(sample_rate=0.0)
+
+    response = client.get("/ok")
+    assert response.json() == {"traced": False}
+    assert "x-trace-id" not in response.headers
+    client.get("/ok", headers={"x-trace": "0"})
+    assert exported == []
+
+
+def test_middleware_samples_requests_at_the_configured_rate():
+    client, exported = make_client(sample_rate=1.0)
+    assert client.get("/ok").json() == {"traced": True}
+    assert len(exported) == 1
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Tests for rejecting oversized uploads before the multipart body is spooled
+"""
+
+from fastapi import FastAPI, UploadFile, File
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.testclient import TestClient
+
+from upload_limits import UploadSizeLimitMiddleware
+
+
+def make_app(max_bytes=1000, path_limits=None):
+    calls = []
+    app = FastAPI()
+    app.add_middleware(CORSMiddleware, allow_origins=["*"])
+    app.add_middleware(UploadSizeLimitMiddleware, max_bytes=max_bytes, path_limits=path_limits)
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        calls.append(file.filename)
+        return {"size": len(await file.read())}
+
+    @app.post("/batch")
+    async def batch(file: UploadFile = File(...)):
+        calls.append(file.filename)
+        return {"size": len(await file.read())}
+
+    return TestClient(app), calls
+
+
+def test_small_upload_passes_through():
+    client, calls = make_app()
+    response = client.post("/upload", files={"file": ("a.mp4", b"x" * 500, "video/mp4")})
+    assert response.status_code == 200
+    assert response.json() == {"size": 500}
+    assert calls == ["a.mp4"]
+
+
+def test_declared_oversized_body_is_rejected_before_the_endpoint():
+    client, calls = make_app()
+    response = client.post("/upload", files={"file": ("a.mp4", b"x" * 5000, "video/mp4")},
+                           headers={"Origin": "http://frontend"})
+    assert response.status_code == 413
+    assert "1000" in response.json()["detail"]
+    assert response.headers.get("access-control-allow-origin") == "*"
+    assert calls == []
+
+
+def test_chunked_oversized_body_is_rejected_while_streaming():
+    client, calls = make_app()
+
+    def body():
+        for _ in range(50):
+            yield b"y" * 100
+
+    response = client.post("/upload", content=body(),
+                           headers={"Content-Type": "multipart/form-data; boundary=xyz"})
+    assert response.status_code == 413
+    assert calls == []
+
+
+def test_path_limits_override_the_default():
+    client, calls = make_app(path_limits={"/batch": 10000})
+    response = client.post("/batch", files={"file": ("a.mp4", b"x" * 5000, "video/mp4")})
+    assert response.status_code == 200
+    response = client.post("/upload", files={"file": ("a.mp4", b"x" * 5000, "video/mp4")})
+    assert response.status_code == 413
+    assert calls == ["a.mp4"]
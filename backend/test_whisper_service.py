@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Tests for the Whisper pool's startup preload policy
+"""
+
+from whisper_service import WhisperPool, preload_count
+
+
+def test_auto_preloads_one_instance_of_small_models_only():
+    assert preload_count("auto", "base.en", pool_size=4) == 1
+    assert preload_count("AUTO", "tiny", pool_size=1) == 1
+    assert preload_count("auto", "small.en", pool_size=4) == 0
+    assert preload_count("auto", "large-v3", pool_size=1) == 0
+
+
+def test_explicit_settings_override_the_model_size():
+    assert preload_count("true", "large-v3", pool_size=2) == 2
+    assert preload_count("false", "tiny.en", pool_size=2) == 0
+
+
+def test_preload_loads_only_the_requested_instances(monkeypatch):
+    pool = WhisperPool(pool_size=3)
+    loaded = []
+
+    class FakeModel:
+        def transcribe(self, audio, fp16=False):
+            return {"text": ""}
+
+    def fake_load():
+        loaded.append(1)
+        return FakeModel()
+
+    monkeypatch.setattr(pool, "_load_model", fake_load)
+    pool.preload(1)
+
+    assert len(loaded) == 1
+    assert pool.stats["warm"] is True
+    pool.executor.shutdown()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Tests for per-request temp workspaces, the free-space guard and the orphan sweeper
+"""
+
+import asyncio
+import os
+import time
+
+import pytest
+
+from workspace import WorkspaceManager, WorkspaceFull, current_workspace, scratch_dir
+
+
+def make_manager(tmp_path, **kwargs):
+    return WorkspaceManager(str(tmp_path / "temp"), min_free_bytes=0, **kwargs)
+
+
+def test_workspace_removed_on_cancellation(tmp_path):
+    manager = make_manager(tmp_path)
+    seen = {}
+
+    async def request():
+        with await manager.create(1024) as workspace:
+            seen["path"] = workspace.path
+            seen["scratch"] = scratch_dir("fallback")
+            with open(workspace.file("../../etc/passwd"), "wb") as f:
+                f.write(b"x" * 1024)
+            await asyncio.sleep(10)
+
+    async def run():
+        task = asyncio.create_task(request())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert seen["scratch"] == seen["path"]
+    assert not os.path.exists(seen["path"])
+    assert current_workspace.get() is None
+    assert manager.disk_reserved == 0
+    assert manager.snapshot()["live"] == 0
+
+
+def test_file_names_are_sanitised(tmp_path):
+    workspace = asyncio.run(make_manager(tmp_path).create())
+    assert workspace.file("../../etc/passwd") == os.path.join(workspace.path, "passwd")
+    assert workspace.file("my clip (1).mp4") == os.path.join(workspace.path, "my_clip_1_.mp4")
+    assert workspace.file(None) == os.path.join(workspace.path, "upload")
+    workspace.close()
+
+
+def test_small_uploads_staged_in_ram(tmp_path):
+    manager = make_manager(tmp_path, ram_dir=str(tmp_path / "shm"), ram_max_file_bytes=1000, ram_budget_bytes=3000)
+
+    small = asyncio.run(manager.create(1000))
+    assert small.in_memory and small.path.startswith(manager.ram_root)
+    # Budget is spent (2x the upload is reserved), so the next one goes to disk
+    second = asyncio.run(manager.create(1000))
+    assert not second.in_memory
+    unknown = asyncio.run(manager.create(None))
+    assert not unknown.in_memory
+    for workspace in (small, second, unknown):
+        workspace.close()
+    assert manager.ram_reserved == 0
+
+
+def test_rejects_when_disk_is_full(tmp_path):
+    manager = WorkspaceManager(str(tmp_path / "temp"), min_free_bytes=2**62, wait_seconds=0.6)
+
+    start = time.perf_counter()
+    with pytest.raises(WorkspaceFull):
+        asyncio.run(manager.create(1024))
+    assert time.perf_counter() - start >= 0.5
+    assert manager.stats["rejected"] == 1
+
+
+def test_sweeper_removes_only_orphans(tmp_path, monkeypatch):
+    manager = make_manager(tmp_path, orphan_age=60)
+    live = asyncio.run(manager.create())
+
+    dead_worker = os.path.join(manager.root, "ws-999999-dead")
+    os.mkdir(dead_worker)
+    untracked_own = os.path.join(manager.root, f"ws-{os.getpid()}-previous-run")
+    os.mkdir(untracked_own)
+    stale_file = os.path.join(manager.root, "trimmed_0123abcd.mp4")
+    stale_dir = os.path.join(manager.root, "clips_x1y2z3")
+    os.mkdir(stale_dir)
+    fresh_file = os.path.join(manager.root, "proxy_other_worker")
+    # Old entries that aren't ours must survive, the root may be a shared /tmp
+    foreign_file = os.path.join(manager.root, "1749873507.746414_test_video.mp4")
+    foreign_dir = os.path.join(manager.root, "systemd-private-abc")
+    os.mkdir(foreign_dir)
+    for path in (stale_file, fresh_file, foreign_file):
+        open(path, "wb").close()
+    for path in (stale_file, stale_dir, foreign_file, foreign_dir):
+        os.utime(path, (time.time() - 3600, time.time() - 3600))
+
+    monkeypatch.setattr("workspace.pid_alive", lambda pid: pid != 999999)
+    assert manager.sweep() == 4
+
+    assert os.path.exists(live.path)
+    assert os.path.exists(fresh_file)
+    assert os.path.exists(foreign_file)
+    assert os.path.exists(foreign_dir)
+    assert not os.path.exists(dead_worker)
+    assert not os.path.exists(untracked_own)
+    assert not os.path.exists(stale_file)
+    assert not os.path.exists(stale_dir)
+    live.close()
@@ -0,0 +1,261 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import cProfile
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, List, Callable, Awaitable
+
+try:
+    import pyinstrument
+except ImportError:  # Optional: only needed for TRACE_PROFILER=pyinstrument
+    pyinstrument = None
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "nsfw-analyzer"
+
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+PROFILER_CPROFILE = "cprofile"
+PROFILER_PYINSTRUMENT = "pyinstrument"
+
+
+class Span:
+    """One timed operation in a trace, with OpenTelemetry-style attributes"""
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "status", "message")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], kind: int = SPAN_KIND_INTERNAL):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = {}
+        self.status = STATUS_OK
+        self.message = ""
+
+    def end(self, error: Optional[BaseException] = None):
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.status = STATUS_ERROR
+            self.message = f"{type(error).__name__}: {error}"[:500]
+
+
+class Trace:
+    """All spans recorded for one traced request"""
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List[Span] = []
+
+    def start(self, name: str, parent: Optional[Span], kind: int = SPAN_KIND_INTERNAL) -> Span:
+        span = Span(self, name, parent.span_id if parent else None, kind)
+        self.spans.append(span)
+        return span
+
+
+# The innermost open span of the current request; None whenever tracing is off
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class span:
+    """Record a child span of the current span; does nothing when the request isn't traced"""
+
+    __slots__ = ("name", "kind", "_span", "_token")
+
+    def __init__(self, name: str, kind: int = SPAN_KIND_INTERNAL):
+        self.name = name
+        self.kind = kind
+        self._span = None
+
+    def __enter__(self) -> Optional[Span]:
+        parent = current_span.get()
+        if parent is None:
+            return None
+        self._span = parent.trace.start(self.name, parent, self.kind)
+        self._token = current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._span is not None:
+            self._span.end(exc)
+            current_span.reset(self._token)
+        return False
+
+
+def set_attribute(key: str, value: Any):
+    """Attach an attribute to the current span, if the request is traced"""
+    active = current_span.get()
+    if active is not None:
+        active.attributes[key] = value
+
+
+def tracing_active() -> bool:
+    return current_span.get() is not None
+
+
+def _attribute_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp_json(trace: Trace) -> Dict[str, Any]:
+    """Trace as an OTLP/HTTP JSON ExportTraceServiceRequest"""
+    spans = []
+    for item in trace.spans:
+        otlp_span = {
+            "traceId": trace.trace_id,
+            "spanId": item.span_id,
+            "name": item.name,
+            "kind": item.kind,
+            "startTimeUnixNano": str(item.start_ns),
+            "endTimeUnixNano": str(item.end_ns or time.time_ns()),
+            "attributes": [{"key": key, "value": _attribute_value(value)} for key, value in item.attributes.items()],
+            "status": {"code": item.status, "message": item.message} if item.message else {"code": item.status},
+        }
+        if item.parent_id:
+            otlp_span["parentSpanId"] = item.parent_id
+        spans.append(otlp_span)
+
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": spans}],
+        }]
+    }
+
+
+class RequestProfiler:
+    """cProfile or pyinstrument around one sampled request, dumped to profile_dir
+
+    cProfile profiles the whole thread, so other requests interleaved on the
+    event loop show up too and only one request is profiled at a time.
+    pyinstrument's async mode attributes time to the traced request only.
+    """
+
+    _cprofile_busy = False
+
+    def __init__(self, kind: str, profile_dir: str, trace_id: str):
+        self.kind = kind
+        self.path = os.path.join(profile_dir, trace_id)
+        self._profiler = None
+
+    def start(self):
+        if self.kind == PROFILER_CPROFILE and not RequestProfiler._cprofile_busy:
+            RequestProfiler._cprofile_busy = True
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.kind == PROFILER_PYINSTRUMENT and pyinstrument is not None:
+            self._profiler = pyinstrument.Profiler(async_mode="enabled")
+            self._profiler.start()
+
+    def stop(self):
+        """Stop profiling; must run on the thread that started it"""
+        if self._profiler is None:
+            return
+        if self.kind == PROFILER_CPROFILE:
+            self._profiler.disable()
+            RequestProfiler._cprofile_busy = False
+        else:
+            self._profiler.stop()
+
+    def dump(self) -> Optional[str]:
+        """Write the profile and return its path (blocking)"""
+        if self._profiler is None:
+            return None
+        if self.kind == PROFILER_CPROFILE:
+            path = f"{self.path}.prof"
+            self._profiler.dump_stats(path)
+        else:
+            path = f"{self.path}.html"
+            with open(path, "w") as f:
+                f.write(self._profiler.output_html())
+        return path
+
+
+class TracingMiddleware:
+    """ASGI middleware that traces requests opted in by header or picked by sampling
+
+    Untraced requests pass straight through with one header lookup and one
+    random draw, and every span() call below them is a no-op. Traced requests
+    get a root span, optionally a profiler, and are handed to exporter as OTLP
+    JSON once the response (including any streamed body) has finished.
+    """
+
+    def __init__(self, app, header: str = "x-trace", sample_rate: float = 0.0,
+                 exporter: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+                 profiler: str = "", profile_dir: str = ""):
+        self.app = app
+        self.header = header.lower().encode("latin-1")
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+        self.profiler = profiler
+        self.profile_dir = profile_dir
+
+    def _wants_trace(self, scope) -> bool:
+        for name, value in scope.get("headers", []):
+            if name == self.header:
+                return value.strip().lower() in (b"1", b"true", b"yes", b"on")
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wants_trace(scope):
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace()
+        root = trace.start(f"{scope['method']} {scope['path']}", None, SPAN_KIND_SERVER)
+        root.attributes["http.method"] = scope["method"]
+        root.attributes["http.target"] = scope["path"]
+        token = current_span.set(root)
+
+        profiler = None
+        if self.profiler and self.profile_dir:
+            profiler = RequestProfiler(self.profiler, self.profile_dir, trace.trace_id)
+            profiler.start()
+
+        async def send_with_trace_id(message):
+            if message["type"] == "http.response.start":
+                root.attributes["http.status_code"] = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-trace-id", trace.trace_id.encode())]
+            await send(message)
+
+        error = None
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            root.end(error)
+            current_span.reset(token)
+            loop = asyncio.get_event_loop()
+            if profiler:
+                profiler.stop()
+                try:
+                    path = await loop.run_in_executor(None, profiler.dump)
+                    if path:
+                        logger.info(f"Profile for trace {trace.trace_id} written to {path}")
+                except Exception as e:
+                    logger.error(f"Failed to write profile for trace {trace.trace_id}: {e}")
+            if self.exporter:
+                try:
+                    await self.exporter(to_otlp_json(trace))
+                except Exception as e:
+                    logger.error(f"Failed to export trace {trace.trace_id}: {e}")
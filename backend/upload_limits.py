@@ -0,0 +1,58 @@
+import logging
+from typing import Dict, Optional
+
+from starlette.exceptions import HTTPException
+
+logger = logging.getLogger(__name__)
+
+
+class UploadSizeLimitMiddleware:
+    """ASGI middleware that rejects request bodies over a size limit before they are read
+
+    Starlette spools the whole multipart body to a temporary file before the
+    endpoint runs, so limits checked in the endpoint only fire after the
+    upload has arrived. This checks Content-Length and, for chunked bodies,
+    counts bytes as they are received. The 413 is raised from receive() so it
+    goes through the normal exception handlers (and CORS headers) like any
+    other HTTPException.
+    """
+
+    def __init__(self, app, max_bytes: int, path_limits: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_limits = path_limits or {}
+
+    def _content_length(self, scope) -> Optional[int]:
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                try:
+                    return int(value)
+                except ValueError:
+                    return None
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT"):
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.path_limits.get(scope["path"], self.max_bytes)
+        declared = self._content_length(scope)
+        received = 0
+
+        def too_large():
+            logger.warning(f"Rejected {scope['method']} {scope['path']}: body exceeds {limit} bytes")
+            return HTTPException(status_code=413, detail=f"Request body exceeds maximum size of {limit} bytes")
+
+        async def limited_receive():
+            nonlocal received
+            if declared is not None and declared > limit:
+                raise too_large()
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise too_large()
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,215 @@
+import time
+import queue
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Dict, Any
+
+import numpy as np
+import torch
+import whisper
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = whisper.audio.SAMPLE_RATE  # 16 kHz mono float32, what Whisper expects
+CHUNK_SAMPLES = whisper.audio.N_SAMPLES  # 30 second decoding window
+
+PRELOAD_AUTO = "auto"
+# Cheap enough (well under 300 MB resident) to load in every uvicorn worker at startup
+SMALL_MODELS = {"tiny", "tiny.en", "base", "base.en"}
+
+
+def preload_count(setting: str, model_name: str, pool_size: int) -> int:
+    """Model instances to load at startup for a WHISPER_PRELOAD setting
+
+    auto warms one instance of a small model per worker, so the first request
+    doesn't pay for loading it, and leaves larger models and the rest of the
+    pool to load on first use. true preloads the whole pool, false nothing.
+    """
+    setting = setting.lower()
+    if setting == PRELOAD_AUTO:
+        return 1 if model_name in SMALL_MODELS else 0
+    return pool_size if setting == "true" else 0
+
+
+class WhisperPool:
+    """Bounded pool of Whisper model instances with optional request batching
+
+    Each model instance is used by one inference thread at a time. Models are
+    loaded lazily (thread-safe) or up front via preload(). With batch_size > 1,
+    transcriptions arriving within batch_window seconds are split into 30s
+    windows and decoded together in one forward pass.
+    """
+
+    def __init__(self, model_name: str = "base.en", pool_size: int = 1, device: Optional[str] = None,
+                 fp16: bool = False, batch_size: int = 1, batch_window: float = 0.05,
+                 threads: int = 0):
+        self.model_name = model_name
+        self.pool_size = max(1, pool_size)
+        self.device = device or None
+        self.fp16 = fp16
+        self.batch_size = max(1, batch_size)
+        self.batch_window = batch_window
+        self.threads = threads
+        self.executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="whisper")
+        self._models: "queue.Queue" = queue.Queue()
+        self._loaded = 0
+        self._load_lock = threading.Lock()
+        self._batch_queue: Optional[asyncio.Queue] = None
+        self._batch_task: Optional[asyncio.Task] = None
+        self._batch_runs = set()
+        self.stats = {
+            "models_loaded": 0,
+            "transcriptions": 0,
+            "batches": 0,
+            "load_seconds": 0.0,
+            "warm": False,
+        }
+
+    def _load_model(self):
+        start = time.perf_counter()
+        logger.info(f"Loading Whisper {self.model_name} model...")
+        if self.threads > 0:
+            torch.set_num_threads(self.threads)
+        model = whisper.load_model(self.model_name, device=self.device)
+        elapsed = time.perf_counter() - start
+        self.stats["models_loaded"] += 1
+        self.stats["load_seconds"] = round(self.stats["load_seconds"] + elapsed, 3)
+        logger.info(f"Whisper model loaded successfully in {elapsed:.1f}s")
+        return model
+
+    def _acquire(self):
+        """Take an idle model, loading a new one if the pool isn't full yet"""
+        try:
+            return self._models.get_nowait()
+        except queue.Empty:
+            pass
+        with self._load_lock:
+            if self._loaded < self.pool_size:
+                self._loaded += 1
+                try:
+                    return self._load_model()
+                except Exception:
+                    self._loaded -= 1
+                    raise
+        return self._models.get()
+
+    def _release(self, model):
+        self._models.put(model)
+
+    def preload(self, count: Optional[int] = None):
+        """Load count model instances (default: all) and run a warm-up transcription (blocking)"""
+        models = [self._acquire() for _ in range(min(self.pool_size, count or self.pool_size))]
+        try:
+            silence = np.zeros(SAMPLE_RATE, dtype=np.float32)
+            for model in models:
+                model.transcribe(silence, fp16=self.fp16)
+            self.stats["warm"] = True
+            logger.info(f"Whisper pool warmed up with {len(models)} instance(s)")
+        finally:
+            for model in models:
+                self._release(model)
+
+    async def start(self, count: Optional[int] = None):
+        """Preload in the background of the event loop"""
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(self.executor, self.preload, count)
+        except Exception as e:
+            logger.error(f"Whisper preload failed: {e}")
+
+    def _transcribe_sync(self, audio: np.ndarray) -> str:
+        model = self._acquire()
+        try:
+            result = model.transcribe(audio, fp16=self.fp16)
+            return result["text"]
+        finally:
+            self._release(model)
+
+    def _decode_batch_sync(self, audios: List[np.ndarray]) -> List[str]:
+        """Decode several clips in one forward pass, 30 seconds per window"""
+        model = self._acquire()
+        try:
+            mels, owners = [], []
+            for owner, audio in enumerate(audios):
+                for offset in range(0, max(len(audio), 1), CHUNK_SAMPLES):
+                    window = whisper.pad_or_trim(audio[offset:offset + CHUNK_SAMPLES])
+                    mels.append(whisper.log_mel_spectrogram(window, n_mels=model.dims.n_mels))
+                    owners.append(owner)
+
+            mel_batch = torch.stack(mels).to(model.device)
+            options = whisper.DecodingOptions(
+                language="en" if self.model_name.endswith(".en") else None,
+                without_timestamps=True,
+                fp16=self.fp16
+            )
+            results = model.decode(mel_batch, options)
+
+            texts = [[] for _ in audios]
+            for owner, result in zip(owners, results):
+                if result.text.strip():
+                    texts[owner].append(result.text.strip())
+            self.stats["batches"] += 1
+            return [" ".join(parts) for parts in texts]
+        finally:
+            self._release(model)
+
+    async def _batch_loop(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            items = [await self._batch_queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(items) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(self._batch_queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            items = [(audio, future) for audio, future in items if not future.cancelled()]
+            if not items:
+                continue
+
+            async def run(batch_items):
+                try:
+                    texts = await loop.run_in_executor(
+                        self.executor, self._decode_batch_sync, [audio for audio, _ in batch_items]
+                    )
+                    for (_, future), text in zip(batch_items, texts):
+                        if not future.done():
+                            future.set_result(text)
+                except Exception as e:
+                    for _, future in batch_items:
+                        if not future.done():
+                            future.set_exception(e)
+
+            # Don't hold up collection of the next batch while this one runs
+            task = asyncio.create_task(run(items))
+            self._batch_runs.add(task)
+            task.add_done_callback(self._batch_runs.discard)
+
+    async def transcribe(self, audio: np.ndarray) -> str:
+        """Transcribe 16 kHz mono float32 audio"""
+        self.stats["transcriptions"] += 1
+        loop = asyncio.get_event_loop()
+
+        if self.batch_size <= 1:
+            return await loop.run_in_executor(self.executor, self._transcribe_sync, audio)
+
+        if self._batch_task is None or self._batch_task.done():
+            self._batch_queue = asyncio.Queue()
+            self._batch_task = asyncio.create_task(self._batch_loop())
+        future = loop.create_future()
+        await self._batch_queue.put((audio, future))
+        return await future
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "model": self.model_name,
+            "pool_size": self.pool_size,
+            "batch_size": self.batch_size,
+            **self.stats,
+        }
@@ -0,0 +1,245 @@
+import os
+import re
+import time
+import uuid
+import shutil
+import asyncio
+import logging
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, List, Set
+
+logger = logging.getLogger(__name__)
+
+WORKSPACE_PREFIX = "ws-"
+WORKSPACE_NAME = re.compile(r"^ws-(\d+)-")
+# Scratch files the pipeline creates outside a workspace (scratch_dir falls back to TEMP_DIR)
+SCRATCH_PREFIXES = ("trimmed_", "clips_", "segments_", "proxy_")
+UNSAFE_FILENAME_CHARS = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+class WorkspaceFull(Exception):
+    """Not enough temp space for a new workspace, even after waiting"""
+
+
+class Workspace:
+    """A private directory for one request's files, removed with everything in it on close
+
+    Use as `with workspace:` to make it the current workspace (see
+    scratch_dir) and to guarantee cleanup, including on cancellation.
+    """
+
+    def __init__(self, manager: "WorkspaceManager", path: str, in_memory: bool, reserved: int):
+        self.manager = manager
+        self.path = path
+        self.in_memory = in_memory
+        self.reserved = reserved
+        self.closed = False
+        self._token = None
+
+    def file(self, filename: Optional[str], default: str = "upload") -> str:
+        """Path for a client-named file inside the workspace, with the name sanitised"""
+        name = UNSAFE_FILENAME_CHARS.sub("_", os.path.basename(filename or "")).strip("._") or default
+        return os.path.join(self.path, name[-120:])
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.manager._release(self)
+
+    def __enter__(self) -> "Workspace":
+        self._token = current_workspace.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        current_workspace.reset(self._token)
+        self.close()
+        return False
+
+
+# The workspace of the request being handled, for intermediate files
+current_workspace: ContextVar[Optional[Workspace]] = ContextVar("current_workspace", default=None)
+
+
+def scratch_dir(default: str) -> str:
+    """Directory for intermediate files: the current workspace, else default"""
+    workspace = current_workspace.get()
+    return workspace.path if workspace and not workspace.closed else default
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class WorkspaceManager:
+    """Creates per-request workspaces, guards free space and sweeps orphans
+
+    Small uploads of known size are staged on a tmpfs directory (ram_dir) when
+    it has room, so they never touch the disk. Everything else goes under
+    root, where a new workspace waits up to wait_seconds for free space to
+    stay above min_free_bytes (counting space promised to workspaces still
+    filling up) before WorkspaceFull is raised.
+
+    Workspace directories carry the owning process ID. The sweeper removes
+    those whose process has died, any of our own we no longer track (left
+    before a restart that reused our PID), and any other workspace or
+    SCRATCH_PREFIXES entry older than orphan_age. Nothing else is touched, so
+    root and ram_dir can safely be shared directories like /tmp or /dev/shm.
+    """
+
+    def __init__(self, root: str, ram_dir: str = "", ram_max_file_bytes: int = 32 * 1024 * 1024,
+                 ram_budget_bytes: int = 128 * 1024 * 1024, min_free_bytes: int = 512 * 1024 * 1024,
+                 wait_seconds: float = 10.0, orphan_age: float = 3600.0, sweep_interval: float = 300.0):
+        self.root = root
+        self.ram_root = os.path.join(ram_dir, "nsfw-analyzer") if ram_dir else ""
+        self.ram_max_file_bytes = ram_max_file_bytes
+        self.ram_budget_bytes = ram_budget_bytes
+        self.min_free_bytes = min_free_bytes
+        self.wait_seconds = wait_seconds
+        self.orphan_age = orphan_age
+        self.sweep_interval = sweep_interval
+        self.disk_reserved = 0
+        self.ram_reserved = 0
+        self._live: Set[str] = set()
+        self._sweeper: Optional[asyncio.Task] = None
+        self.stats = {"created": 0, "in_memory": 0, "waited": 0, "rejected": 0, "swept": 0}
+
+        os.makedirs(root, exist_ok=True)
+        if self.ram_root:
+            try:
+                os.makedirs(self.ram_root, exist_ok=True)
+            except OSError as e:
+                logger.warning(f"RAM staging disabled, can't use {self.ram_root}: {e}")
+                self.ram_root = ""
+
+    @property
+    def roots(self) -> List[str]:
+        return [self.root] + ([self.ram_root] if self.ram_root else [])
+
+    def _ram_fits(self, expected_bytes: Optional[int]) -> bool:
+        if not self.ram_root or not expected_bytes or expected_bytes > self.ram_max_file_bytes:
+            return False
+        # Room for the upload plus a trimmed copy and clips of about the same size
+        needed = 2 * expected_bytes
+        if self.ram_reserved + needed > self.ram_budget_bytes:
+            return False
+        return shutil.disk_usage(self.ram_root).free - self.ram_reserved >= needed
+
+    def _disk_fits(self, expected_bytes: int) -> bool:
+        return shutil.disk_usage(self.root).free - self.disk_reserved >= self.min_free_bytes + expected_bytes
+
+    async def create(self, expected_bytes: Optional[int] = None) -> Workspace:
+        """New empty workspace, in RAM if the upload is small enough"""
+        in_memory = self._ram_fits(expected_bytes)
+        if not in_memory and not self._disk_fits(expected_bytes or 0):
+            self.stats["waited"] += 1
+            loop = asyncio.get_event_loop()
+            deadline = loop.time() + self.wait_seconds
+            while not self._disk_fits(expected_bytes or 0):
+                if loop.time() >= deadline:
+                    self.stats["rejected"] += 1
+                    raise WorkspaceFull(f"Less than {self.min_free_bytes} bytes free in {self.root}")
+                await asyncio.sleep(0.5)
+
+        reserved = 2 * expected_bytes if in_memory else (expected_bytes or 0)
+        path = os.path.join(self.ram_root if in_memory else self.root, f"{WORKSPACE_PREFIX}{os.getpid()}-{uuid.uuid4().hex}")
+        # Tracked before it exists so a concurrent sweep never mistakes it for an orphan
+        self._live.add(path)
+        try:
+            os.mkdir(path, 0o700)
+        except OSError:
+            self._live.discard(path)
+            raise
+        if in_memory:
+            self.ram_reserved += reserved
+            self.stats["in_memory"] += 1
+        else:
+            self.disk_reserved += reserved
+        self.stats["created"] += 1
+        return Workspace(self, path, in_memory, reserved)
+
+    def _release(self, workspace: Workspace):
+        self._live.discard(workspace.path)
+        if workspace.in_memory:
+            self.ram_reserved -= workspace.reserved
+        else:
+            self.disk_reserved -= workspace.reserved
+
+    def _orphaned(self, path: str, name: str, now: float) -> bool:
+        if not name.startswith((WORKSPACE_PREFIX,) + SCRATCH_PREFIXES):
+            return False
+        match = WORKSPACE_NAME.match(name)
+        if match:
+            pid = int(match.group(1))
+            if pid == os.getpid():
+                return path not in self._live
+            if not pid_alive(pid):
+                return True
+        try:
+            return now - os.lstat(path).st_mtime > self.orphan_age
+        except FileNotFoundError:
+            return False
+
+    def sweep(self) -> int:
+        """Remove workspaces and files left behind by crashed or restarted workers (blocking)"""
+        removed = 0
+        now = time.time()
+        for root in self.roots:
+            try:
+                entries = list(os.scandir(root))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if entry.path in self._live or not self._orphaned(entry.path, entry.name, now):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        shutil.rmtree(entry.path)
+                    else:
+                        os.unlink(entry.path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"Failed to remove orphaned temp entry {entry.path}: {e}")
+        if removed:
+            logger.info(f"Swept {removed} orphaned temp entries")
+        self.stats["swept"] += removed
+        return removed
+
+    async def _sweep_forever(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.sweep)
+            except Exception as e:
+                logger.error(f"Temp sweep failed: {e}")
+            await asyncio.sleep(self.sweep_interval)
+
+    def start_sweeper(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_forever())
+
+    async def stop_sweeper(self):
+        if self._sweeper and not self._sweeper.done():
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        usage = shutil.disk_usage(self.root)
+        return {
+            "root": self.root,
+            "ram_dir": self.ram_root or None,
+            "live": len(self._live),
+            "disk_free_bytes": usage.free,
+            "disk_reserved_bytes": self.disk_reserved,
+            "ram_reserved_bytes": self.ram_reserved,
+            **self.stats,
+        }
@@ -1,4 +1,4 @@
-import React, { useState, useCallback } from 'react';
+import React, { useState, useCallback, useRef } from 'react';
 import { Upload, AlertCircle, CheckCircle2, XCircle, Loader2, Github, ExternalLink, FileVideo, Clock, Tag, Shield } from 'lucide-react';
 
 function App() {
@@ -7,6 +7,8 @@ function App() {
   const [isAnalyzing, setIsAnalyzing] = useState(false);
   const [result, setResult] = useState(null);
   const [error, setError] = useState(null);
+  const [progress, setProgress] = useState([]);
+  const abortRef = useRef(null);
 
   const handleFileSelect = (selectedFile) => {
     if (selectedFile && selectedFile.type.startsWith('video/')) {
@@ -36,20 +38,51 @@ function App() {
     setIsDragging(false);
   };
 
+  // Parse a server-sent event stream, calling onEvent(name, data) for each complete event
+  const readEventStream = async (response, onEvent) => {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const block = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        let event = 'message';
+        let data = '';
+        block.split('\n').forEach((line) => {
+          if (line.startsWith('event: ')) event = line.slice(7);
+          else if (line.startsWith('data: ')) data += line.slice(6);
+        });
+        onEvent(event, data ? JSON.parse(data) : null);
+      }
+    }
+  };
+
   const analyzeVideo = async () => {
     if (!file) return;
 
     setIsAnalyzing(true);
     setError(null);
     setResult(null);
+    setProgress([]);
 
     const formData = new FormData();
     formData.append('file', file);
 
+    const controller = new AbortController();
+    abortRef.current = controller;
+
     try {
-      const response = await fetch(`${process.env.REACT_APP_API_URL}/analyze`, {
+      const response = await fetch(`${process.env.REACT_APP_API_URL}/analyze/stream`, {
         method: 'POST',
         body: formData,
+        signal: controller.signal,
       });
 
       if (!response.ok) {
@@ -57,15 +90,37 @@ function App() {
         throw new Error(errorData.detail || 'Analysis failed');
       }
 
-      const data = await response.json();
-      setResult(data);
+      if (response.body && response.body.getReader) {
+        // Show per-clip verdicts, captions and the transcript as they arrive
+        let finalResult = null;
+        await readEventStream(response, (event, data) => {
+          if (event === 'result') {
+            finalResult = data;
+          } else if (event === 'error') {
+            throw new Error(data.detail || 'Analysis failed');
+          } else {
+            setProgress((items) => [...items, { event, data }]);
+          }
+        });
+        if (!finalResult) throw new Error('Analysis ended without a result');
+        setResult(finalResult);
+      } else {
+        const data = await response.json();
+        setResult(data);
+      }
     } catch (err) {
-      setError(err.message);
+      // A cancelled request closes the stream, which stops the analysis on the server
+      if (err.name !== 'AbortError') setError(err.message);
     } finally {
       setIsAnalyzing(false);
+      abortRef.current = null;
     }
   };
 
+  const cancelAnalysis = () => {
+    if (abortRef.current) abortRef.current.abort();
+  };
+
   const getCategoryColor = (category) => {
     const colors = {
       'pornography': 'bg-pink-100 text-pink-800 border-pink-200',
@@ -106,6 +161,14 @@ function App() {
     return (severity / 5) * 100;
   };
 
+  const formatTimestamp = (seconds) => {
+    const total = Math.floor(seconds);
+    const hours = Math.floor(total / 3600);
+    const minutes = String(Math.floor((total % 3600) / 60)).padStart(2, '0');
+    const secs = String(total % 60).padStart(2, '0');
+    return hours ? `${hours}:${minutes}:${secs}` : `${minutes}:${secs}`;
+  };
+
   const formatFileSize = (bytes) => {
     if (bytes === 0) return '0 Bytes';
     const k = 1024;
@@ -214,7 +277,7 @@ function App() {
                   <span className="px-2 py-1 bg-gray-100 rounded">AVI</span>
                   <span className="px-2 py-1 bg-gray-100 rounded">MOV</span>
                 </div>
-                <p className="text-xs text-gray-400 mt-2">Max file size: 100MB • Max duration: 60 seconds</p>
+                <p className="text-xs text-gray-400 mt-2">Max file size: 100MB • Long videos are analysed in segments</p>
               </div>
             </div>
 
@@ -258,6 +321,42 @@ function App() {
                 )}
               </button>
             )}
+
+            {isAnalyzing && (
+              <button
+                onClick={cancelAnalysis}
+                className="mt-3 w-full px-6 py-3 border border-gray-300 rounded-xl text-sm font-medium text-gray-700 bg-white hover:bg-gray-50 transition-colors"
+              >
+                Cancel
+              </button>
+            )}
+
+            {isAnalyzing && progress.length > 0 && (
+              <div className="mt-6 p-4 bg-gray-50 rounded-lg border space-y-2">
+                {progress.map(({ event, data }, i) => (
+                  <div key={i} className="text-sm text-gray-700">
+                    {event === 'clip' && (
+                      <span>
+                        <span className={`px-2 py-0.5 mr-2 rounded-full text-xs font-medium border ${getSeverityColor(data.severity)}`}>
+                          Clip {data.index + 1} · {getSeverityLabel(data.severity)}
+                        </span>
+                        {data.description}
+                      </span>
+                    )}
+                    {event === 'segment' && (
+                      <span>
+                        <span className={`px-2 py-0.5 mr-2 rounded-full text-xs font-medium border ${getSeverityColor(data.severity)}`}>
+                          Segment {formatTimestamp(data.start)}–{formatTimestamp(data.end)} · {getSeverityLabel(data.severity)}
+                        </span>
+                        {data.description}
+                      </span>
+                    )}
+                    {event === 'caption' && <span>Frame {data.index + 1}: {data.caption}</span>}
+                    {event === 'transcript' && <span>Transcript: {data.text || 'No speech detected'}</span>}
+                  </div>
+                ))}
+              </div>
+            )}
           </div>
 
           {error && (